@@ -3,7 +3,10 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.database import connect_to_database, close_database_connection
-from app.routers import budget_router, master_data_router, theme_router, revision_router, auth_router, system_router, user_router
+from app.services.export_pool import export_pool
+from app.services.export_job_service import export_job_service
+from app.services.revision_service import revision_service
+from app.routers import budget_router, master_data_router, theme_router, revision_router, auth_router, system_router, user_router, export_router
 
 
 @asynccontextmanager
@@ -11,8 +14,12 @@ async def lifespan(app: FastAPI):
     """Application lifespan manager."""
     # Startup
     await connect_to_database()
+    await revision_service.ensure_indexes()
+    await export_job_service.start()
     yield
     # Shutdown
+    export_job_service.shutdown()
+    export_pool.shutdown()
     await close_database_connection()
 
 
@@ -46,6 +53,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers
@@ -56,6 +64,7 @@ app.include_router(revision_router)
 app.include_router(auth_router) # Add Auth
 app.include_router(system_router) # Add System
 app.include_router(user_router) # Add User Management
+app.include_router(export_router)
 
 @app.get("/")
 async def root():
@@ -70,7 +79,8 @@ async def root():
             "health": "/health",
             "budget": "/api/budget",
             "master_data": "/api/master-data",
-            "theme": "/api/theme"
+            "theme": "/api/theme",
+            "exports": "/api/exports"
         }
     }
 
@@ -9,16 +9,24 @@ from app.models.schemas import (
     BudgetRow,
     BudgetRowDocument,
     BudgetRowResponse,
+    BudgetBatchOpType,
+    BudgetBatchOperation,
     MasterDataItem,
     MasterDataCreate,
+    MasterDataImportMode,
     MasterDataDocument,
     MasterDataResponse,
     ThemeConfig,
     ThemeConfigDocument,
     RevisionBase,
     RevisionCreate,
+    RevisionSnapshotCreate,
     RevisionResponse,
     RevisionDetailResponse,
+    ExportFormat,
+    ExportJobStatus,
+    ExportFilter,
+    ExportJobCreate,
 )
 
 from app.models.user_models import (
@@ -43,16 +51,24 @@ __all__ = [
     "BudgetRow",
     "BudgetRowDocument",
     "BudgetRowResponse",
+    "BudgetBatchOpType",
+    "BudgetBatchOperation",
     "MasterDataItem",
     "MasterDataCreate",
+    "MasterDataImportMode",
     "MasterDataDocument",
     "MasterDataResponse",
     "ThemeConfig",
     "ThemeConfigDocument",
     "RevisionBase",
     "RevisionCreate",
+    "RevisionSnapshotCreate",
     "RevisionResponse",
     "RevisionDetailResponse",
+    "ExportFormat",
+    "ExportJobStatus",
+    "ExportFilter",
+    "ExportJobCreate",
     "UserRole",
     "UserBase",
     "UserCreate",
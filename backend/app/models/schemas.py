@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List, Dict
 from enum import Enum
 from bson import ObjectId
@@ -106,6 +106,40 @@ class BudgetRowDocument(BudgetRowBase):
         json_encoders = {ObjectId: str}
 
 
+# Batch mutation models (PATCH /api/budget/batch)
+class BudgetBatchOpType(str, Enum):
+    UPDATE = "update"    # Set fields of a row (row_id, data)
+    MONTHLY = "monthly"  # Update one month allocation (row_id, month_index, detail)
+    INSERT = "insert"    # Insert a subtree (parent_id, row, optional position)
+    DELETE = "delete"    # Delete a row and its subtree (row_id)
+    MOVE = "move"        # Move a row under another parent (row_id, parent_id, optional position)
+
+
+class BudgetBatchOperation(BaseModel):
+    op: BudgetBatchOpType
+    row_id: Optional[str] = None
+    data: Optional[BudgetRowUpdate] = None
+    month_index: Optional[int] = Field(default=None, ge=0, le=11)
+    detail: Optional[MonthlyDetail] = None
+    parent_id: Optional[str] = None
+    row: Optional[BudgetRowCreate] = None
+    position: Optional[int] = Field(default=None, ge=0)
+
+    @model_validator(mode="after")
+    def check_required_fields(self):
+        required = {
+            BudgetBatchOpType.UPDATE: ["row_id", "data"],
+            BudgetBatchOpType.MONTHLY: ["row_id", "month_index", "detail"],
+            BudgetBatchOpType.INSERT: ["row"],
+            BudgetBatchOpType.DELETE: ["row_id"],
+            BudgetBatchOpType.MOVE: ["row_id"],
+        }[self.op]
+        missing = [name for name in required if getattr(self, name) is None]
+        if missing:
+            raise ValueError(f"Operation '{self.op.value}' requires: {', '.join(missing)}")
+        return self
+
+
 # Master Data Models
 class MasterDataItem(BaseModel):
     code: str
@@ -118,6 +152,11 @@ class MasterDataCreate(BaseModel):
     desc: str
 
 
+class MasterDataImportMode(str, Enum):
+    INSERT = "insert"  # new entries only, existing codes are reported as errors
+    UPSERT = "upsert"  # new entries are inserted, existing codes get the new description
+
+
 class MasterDataDocument(BaseModel):
     id: str = Field(alias="_id")
     type: RowType
@@ -170,6 +209,9 @@ class RevisionBase(BaseModel):
     note: str
     timestamp: datetime = Field(default_factory=datetime.now)
 
+class RevisionSnapshotCreate(BaseModel):
+    note: str
+
 class RevisionCreate(RevisionBase):
     data: List[BudgetRowResponse] # Menyimpan seluruh tree anggaran
 
@@ -181,7 +223,43 @@ class RevisionDetailResponse(RevisionResponse):
     data: List[BudgetRowResponse]
 
 
+# Export job models (/api/exports)
+class ExportFormat(str, Enum):
+    EXCEL = "excel"
+    PDF = "pdf"
+
+
+class ExportJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class ExportFilter(BaseModel):
+    row_id: Optional[str] = None                          # Export only this row's subtree
+    types: Optional[List[RowType]] = None                 # Only rows of these types
+    month_from: int = Field(default=0, ge=0, le=11)       # Month range (0-11, inclusive)
+    month_to: int = Field(default=11, ge=0, le=11)
+    changed_only: bool = False                            # Rows where menjadi differs from semula (+ ancestors)
+
+    @model_validator(mode="after")
+    def check_month_range(self):
+        if self.month_from > self.month_to:
+            raise ValueError("month_from must not be after month_to")
+        return self
+
+    @property
+    def months(self) -> range:
+        return range(self.month_from, self.month_to + 1)
+
+
+class ExportJobCreate(ExportFilter):
+    format: ExportFormat = ExportFormat.EXCEL
+
+
 # Fix forward references
 BudgetRowCreate.model_rebuild()
 BudgetRow.model_rebuild()
 BudgetRowResponse.model_rebuild()
+BudgetBatchOperation.model_rebuild()
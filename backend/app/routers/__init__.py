@@ -5,5 +5,6 @@ from app.routers.revision_router import router as revision_router
 from app.routers.auth_router import router as auth_router
 from app.routers.system_router import router as system_router
 from app.routers.user_router import router as user_router
+from app.routers.export_router import router as export_router
 
-__all__ = ["budget_router", "master_data_router", "theme_router", "revision_router", "auth_router", "system_router", "user_router"]
\ No newline at end of file
+__all__ = ["budget_router", "master_data_router", "theme_router", "revision_router", "auth_router", "system_router", "user_router", "export_router"]
\ No newline at end of file
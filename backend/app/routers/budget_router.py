@@ -1,18 +1,82 @@
-from fastapi import APIRouter, HTTPException, status
-from fastapi.responses import Response
-from typing import List, Optional, Union
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response
+from typing import Annotated, List, Optional, Union
 from app.models.schemas import (
     BudgetRowCreate,
     BudgetRowUpdate,
     BudgetRowResponse,
+    BudgetBatchOperation,
     MonthlyDetail,
+    ExportFilter,
 )
 from app.services.budget_service import budget_service
-from app.services.export_service import export_service
+from app.services.export_service import export_service, EXPORT_FORMATS
+from app.services.export_pool import export_pool, ExportPoolBusy
+from app.services.export_cache import export_cache
+from app.utils.etag import etag, etag_matches
 
 router = APIRouter(prefix="/api/budget", tags=["Budget"])
 
 
+def _export_headers(key: str) -> dict:
+    return {"ETag": etag(key), "Cache-Control": "private, no-cache"}
+
+
+async def _render_to_cache(renderer, rows: List[tuple], key: str, suffix: str, months: range) -> str:
+    """
+    Render `rows` in the export process pool into the export cache.
+    Returns 503 when the export queue is full. If rendering fails or the
+    request is cancelled, the partial file is removed once the worker is done.
+    """
+    tmp_path = export_cache.reserve(suffix)
+    try:
+        await export_pool.run(
+            renderer, rows, tmp_path, None, months,
+            on_abandoned=lambda: export_cache.discard(tmp_path)
+        )
+    except ExportPoolBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"{e}. Please retry shortly.",
+            headers={"Retry-After": "5"}
+        )
+    return await run_in_threadpool(export_cache.put, key, suffix, tmp_path)
+
+
+async def _export_response(request: Request, kind: str, filters: ExportFilter):
+    """
+    Serve an export from the on-disk export cache, rendering it on a miss.
+    The cache key is the ETag: `If-None-Match` gets a 304 and `Range` /
+    `If-Range` requests are answered by FileResponse.
+    """
+    renderer, suffix, media_type, filename = EXPORT_FORMATS[kind]
+    options = export_service.cache_options(filters)
+    if_none_match = request.headers.get("if-none-match")
+    
+    version = budget_service.data_version
+    key = export_cache.known_key(version, kind, options)
+    if key is not None and etag_matches(if_none_match, key):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_export_headers(key))
+    path = export_cache.get(key, suffix) if key else None
+    
+    if path is None:
+        # Data berubah sejak export terakhir, atau file sudah tergusur dari cache
+        rows = await export_service.collect_rows(filters)
+        if rows is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Budget row with ID {filters.row_id} not found"
+            )
+        key = await run_in_threadpool(export_cache.make_key, kind, options, rows)
+        export_cache.remember_key(version, kind, options, key)
+        if etag_matches(if_none_match, key):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_export_headers(key))
+        path = export_cache.get(key, suffix) or await _render_to_cache(renderer, rows, key, suffix, filters.months)
+    
+    return FileResponse(path, media_type=media_type, filename=filename, headers=_export_headers(key))
+
+
 @router.get("/", response_model=List[BudgetRowResponse])
 async def get_all_budget_rows():
     """Get all budget rows as hierarchical tree structure."""
@@ -20,6 +84,15 @@ async def get_all_budget_rows():
     return rows
 
 
+@router.get("/aggregates")
+async def get_budget_aggregates(row_id: Optional[List[str]] = Query(None)):
+    """
+    Monthly and yearly RPD / realization / SP2D totals per row (own + descendants).
+    Pass `row_id` (repeatable) to fetch specific rows, otherwise all rows are returned.
+    """
+    return await budget_service.get_aggregates(row_id)
+
+
 @router.get("/{row_id}")
 async def get_budget_row(row_id: str):
     """Get a single budget row by ID."""
@@ -37,11 +110,13 @@ async def save_budget_data(data: List[BudgetRowResponse]):
     """
     Save/sync all budget data.
     Accepts array of budget rows with nested children - replaces all existing data.
+    Only rows that differ from the stored data are written.
     """
     result = await budget_service.sync_all(data)
     return {
         "message": "Budget data saved successfully",
-        "count": result
+        "count": result["total"],
+        "changes": result
     }
 
 
@@ -50,21 +125,27 @@ async def create_single_budget_row(
     row_data: BudgetRowCreate,
     parent_id: Optional[str] = None
 ):
-    """Create a single new budget row (optionally under a parent)."""
-    row_id = await budget_service.create_row(row_data, parent_id)
-    return {"id": row_id, "message": "Budget row created successfully"}
+    """
+    Create a single new budget row (optionally under a parent), including nested children.
+    `ids` lists the new ids in depth-first order of the submitted tree.
+    """
+    row_ids = await budget_service.create_row(row_data, parent_id)
+    return {"id": row_ids[0], "ids": row_ids, "message": "Budget row created successfully"}
 
 
 @router.post("/{parent_id}/children", status_code=status.HTTP_201_CREATED)
 async def add_child_row(parent_id: str, row_data: BudgetRowCreate):
-    """Add a child row to an existing parent row."""
-    row_id = await budget_service.add_child_row(parent_id, row_data)
-    if not row_id:
+    """
+    Add a child row to an existing parent row.
+    `ids` lists the new ids in depth-first order of the submitted tree.
+    """
+    row_ids = await budget_service.add_child_row(parent_id, row_data)
+    if not row_ids:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Parent row with ID {parent_id} not found"
         )
-    return {"id": row_id, "message": "Child row added successfully"}
+    return {"id": row_ids[0], "ids": row_ids, "message": "Child row added successfully"}
 
 
 @router.put("/sync")
@@ -72,11 +153,34 @@ async def sync_all_budget_data(data: List[BudgetRowResponse]):
     """
     Sync all budget data - replaces existing data with new tree structure.
     Accepts array of budget rows with nested children.
+    Only inserted, updated (incl. moved) and deleted rows are written;
+    the response reports how many rows of each kind were touched.
     """
     result = await budget_service.sync_all(data)
     return {
         "message": "Budget data synced successfully",
-        "count": result
+        "count": result["total"],
+        "changes": result
+    }
+
+
+@router.patch("/batch")
+async def apply_budget_batch(operations: List[BudgetBatchOperation]):
+    """
+    Apply an ordered list of operations (update, monthly, insert, delete, move)
+    in a single database write. Returns the result of every operation;
+    operations that fail (e.g. unknown row) are skipped without aborting the batch.
+    """
+    if not operations:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one operation is required"
+        )
+    
+    result = await budget_service.apply_batch(operations)
+    return {
+        "message": "Budget batch applied",
+        **result
     }
 
 
@@ -140,34 +244,22 @@ async def update_monthly_allocation(
     return {"message": f"Monthly allocation for month {month_index} updated"}
 
 @router.get("/export/excel")
-async def export_budget_excel():
-    """Download budget data as Excel."""
-    # Get latest data tree
-    data = await budget_service.get_all_rows()
-    
-    excel_file = export_service.generate_excel(data)
-    
-    headers = {
-        'Content-Disposition': 'attachment; filename="rincian_kertas_kerja.xlsx"'
-    }
-    return Response(
-        content=excel_file.getvalue(), 
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 
-        headers=headers
-    )
+async def export_budget_excel(request: Request, filters: Annotated[ExportFilter, Query()]):
+    """
+    Download budget data as Excel.
+    Optional filters: `row_id` (subtree), `types` (repeatable), `month_from` /
+    `month_to` (0-11) and `changed_only` (menjadi differs from semula).
+    Served from the export cache (ETag / Range supported); otherwise rendered
+    in the export process pool, returning 503 when the export queue is full.
+    """
+    return await _export_response(request, "excel", filters)
 
 @router.get("/export/pdf")
-async def export_budget_pdf():
-    """Download budget data as PDF."""
-    data = await budget_service.get_all_rows()
-    
-    pdf_file = export_service.generate_pdf(data)
-    
-    headers = {
-        'Content-Disposition': 'attachment; filename="rincian_kertas_kerja.pdf"'
-    }
-    return Response(
-        content=pdf_file.getvalue(), 
-        media_type='application/pdf', 
-        headers=headers
-    )
+async def export_budget_pdf(request: Request, filters: Annotated[ExportFilter, Query()]):
+    """
+    Download budget data as PDF (A3 landscape, header repeated on every page).
+    Takes the same filters as the Excel export.
+    Served from the export cache (ETag / Range supported); otherwise rendered
+    in the export process pool, returning 503 when the export queue is full.
+    """
+    return await _export_response(request, "pdf", filters)
@@ -0,0 +1,76 @@
+import re
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import FileResponse, Response
+from app.models.schemas import ExportJobCreate, ExportJobStatus
+from app.services.export_job_service import export_job_service, ExportJobLimit, ExportRowNotFound
+from app.services.export_service import EXPORT_FORMATS
+from app.utils.etag import etag, etag_matches
+
+router = APIRouter(prefix="/api/exports", tags=["Export"])
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _get_job_or_404(job_id: str) -> dict:
+    job = export_job_service.get_job(job_id) if JOB_ID_PATTERN.match(job_id) else None
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Export job {job_id} not found"
+        )
+    return job
+
+
+@router.post("/", status_code=status.HTTP_202_ACCEPTED)
+async def create_export_job(payload: ExportJobCreate):
+    """
+    Start a background export (Excel or PDF) of the budget worksheet.
+    Accepts the same filters as the direct exports (`row_id`, `types`,
+    `month_from`, `month_to`, `changed_only`).
+    Poll `GET /api/exports/{id}` for progress and download the result from
+    `GET /api/exports/{id}/file` once the status is `done`.
+    """
+    try:
+        job = await export_job_service.create_job(payload.format.value, payload)
+    except ExportRowNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ExportJobLimit as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"{e}. Please retry shortly.",
+            headers={"Retry-After": "10"}
+        )
+    return {"message": "Export job created", **job}
+
+
+@router.get("/{job_id}")
+async def get_export_job(job_id: str):
+    """Status and progress (rows rendered out of total) of an export job."""
+    return _get_job_or_404(job_id)
+
+
+@router.get("/{job_id}/file")
+async def download_export_job_file(job_id: str, request: Request):
+    """
+    Download the document of a finished export job.
+    Supports ETag / If-None-Match and Range requests (resumable downloads).
+    """
+    job = _get_job_or_404(job_id)
+    if job["status"] != ExportJobStatus.DONE.value:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Export job is {job['status']}, the file is not available"
+        )
+    result = export_job_service.get_result(job_id)
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"File of export job {job_id} has expired"
+        )
+    
+    path, key = result
+    _, _, media_type, filename = EXPORT_FORMATS[job["format"]]
+    headers = {"ETag": etag(key), "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), key):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
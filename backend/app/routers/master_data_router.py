@@ -1,29 +1,60 @@
-from fastapi import APIRouter, HTTPException, status
+import json
+from fastapi import APIRouter, File, Form, Header, HTTPException, Query, Response, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from typing import List, Dict, Optional
 from app.models.schemas import (
     MasterDataItem,
     MasterDataCreate,
+    MasterDataImportMode,
     MasterDataResponse,
     RowType,
 )
 from app.services.master_data_service import master_data_service
+from app.services.master_data_import import ImportFormatError, open_import
+from app.utils.etag import etag, etag_matches
 
 router = APIRouter(prefix="/api/master-data", tags=["Master Data"])
 
+async def _cached_response(row_type: Optional[RowType], if_none_match: Optional[str]) -> Response:
+    """
+    Master data from the in-memory cache, with an ETag over the body.
+    A matching If-None-Match gets an empty 304.
+    """
+    body, key = await master_data_service.get_json(row_type)
+    headers = {"ETag": etag(key), "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, key):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @router.get("/", response_model=Dict[str, List[MasterDataItem]])
-async def get_all_master_data():
-    return await master_data_service.get_all()
+async def get_all_master_data(if_none_match: Optional[str] = Header(None)):
+    return await _cached_response(None, if_none_match)
 
 @router.get("/{row_type}", response_model=List[MasterDataItem])
-async def get_master_data_by_type(row_type: RowType):
-    return await master_data_service.get_by_type(row_type)
+async def get_master_data_by_type(row_type: RowType, if_none_match: Optional[str] = Header(None)):
+    return await _cached_response(row_type, if_none_match)
+
+@router.get("/{row_type}/search", response_model=List[MasterDataItem])
+async def search_master_data(
+    row_type: RowType,
+    q: str = "",
+    limit: int = Query(20, ge=1, le=200),
+    fuzzy: bool = False
+):
+    """
+    Autocomplete: code prefix matches first, then items whose description
+    contains every word of `q` (words may be incomplete).
+    fuzzy=true also accepts words with one typo.
+    """
+    return await master_data_service.search(row_type, q, limit, fuzzy)
 
 @router.post("/")
 async def save_master_data(data: Dict[str, List[MasterDataItem]]):
     result = await master_data_service.sync_all(data)
     return {
         "message": "Master data saved successfully",
-        "counts": result
+        **result
     }
 
 @router.post("/create", status_code=status.HTTP_201_CREATED)
@@ -36,12 +67,36 @@ async def bulk_create_master_data(items: List[MasterDataCreate]):
     count = await master_data_service.bulk_create(items)
     return {"count": count, "message": f"{count} master data items created"}
 
+@router.post("/import")
+async def import_master_data(
+    file: UploadFile = File(...),
+    row_type: Optional[RowType] = Form(None),
+    mode: MasterDataImportMode = Form(MasterDataImportMode.UPSERT)
+):
+    """
+    Import master data from a CSV or XLSX file (DJA/SAKTI exports).
+    The file needs a header row with code and description columns (kode/uraian
+    are recognized too) and a type column unless `row_type` is given.
+    Rows are validated and written in batches; the response is NDJSON with one
+    progress line per batch (incl. per-row errors) and a final line with "done".
+    """
+    try:
+        rows = await run_in_threadpool(open_import, file.file, file.filename, row_type is not None)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    async def progress():
+        async for update in master_data_service.import_rows(rows, row_type, mode):
+            yield json.dumps(update) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
 @router.put("/sync")
 async def sync_all_master_data(data: Dict[str, List[MasterDataItem]]):
     result = await master_data_service.sync_all(data)
     return {
         "message": "Master data synced successfully",
-        "counts": result
+        **result
     }
 
 @router.delete("/{row_type}/{code}")
@@ -1,13 +1,41 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
-from app.models.schemas import RevisionCreate, RevisionResponse, RevisionDetailResponse, BudgetRowResponse
-from app.services.revision_service import revision_service
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.models.schemas import RevisionCreate, RevisionSnapshotCreate, RevisionResponse, RevisionDetailResponse, BudgetRowResponse
+from app.services.revision_service import (
+    revision_service, RevisionNotDiffable, RowMap, diff_snapshots, iter_diff_lines,
+    HISTORY_MAX_PAGE_SIZE
+)
 
 router = APIRouter(prefix="/api/revisions", tags=["Revisions"])
 
 @router.get("/", response_model=List[RevisionResponse])
-async def get_history():
-    return await revision_service.get_all_revisions()
+async def get_history(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    q: Optional[str] = None
+):
+    """
+    Revision history, newest first. Without `limit` and `cursor` the full
+    history is returned; otherwise one page at a time (HISTORY_PAGE_SIZE by
+    default), the next page fetched by passing the X-Next-Cursor response
+    header back as `cursor` (absent on the last page). Filters: date_from <= timestamp < date_to,
+    `q` = words in the note.
+    """
+    try:
+        revisions, next_cursor = await revision_service.get_revisions(
+            limit, cursor, date_from, date_to, q
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return revisions
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_revision(payload: RevisionCreate):
@@ -24,12 +52,64 @@ async def create_revision(payload: RevisionCreate):
     rev_id = await revision_service.create_revision(payload.note, data_dicts)
     return {"id": rev_id, "message": "Revision snapshot saved"}
 
+@router.post("/snapshot", status_code=status.HTTP_201_CREATED)
+async def create_revision_snapshot(payload: RevisionSnapshotCreate):
+    """
+    Save the current budget data as a revision snapshot.
+    Only a note is sent; the snapshot is built server-side from budget_rows.
+    """
+    result = await revision_service.create_snapshot(payload.note)
+    return {**result, "message": "Revision snapshot saved"}
+
 @router.get("/{rev_id}", response_model=RevisionDetailResponse)
 async def get_revision_detail(rev_id: str):
-    rev = await revision_service.get_revision_by_id(rev_id)
-    if not rev:
+    # Streamed: large snapshots are serialized piece by piece
+    body = await revision_service.stream_revision(rev_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return StreamingResponse(body, media_type="application/json")
+
+async def _diff_rows(rev_id: str) -> RowMap:
+    try:
+        rows = await revision_service.get_rows(rev_id)
+    except RevisionNotDiffable as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if rows is None:
+        raise HTTPException(status_code=404, detail=f"Revision {rev_id} not found")
+    return rows
+
+@router.get("/{rev_id}/diff/{other_id}")
+async def diff_revisions(rev_id: str, other_id: str, stream: bool = False):
+    """
+    Rows added, removed, moved and changed (field by field) from revision
+    `rev_id` to `other_id`. Either side may be "live" for the current budget data.
+    With stream=true the diff is sent as NDJSON, one entry per line.
+    """
+    old = await _diff_rows(rev_id)
+    new = await _diff_rows(other_id)
+    if stream:
+        return StreamingResponse(iter_diff_lines(old, new), media_type="application/x-ndjson")
+    return await run_in_threadpool(diff_snapshots, old, new)
+
+@router.post("/{rev_id}/restore")
+async def restore_revision(rev_id: str, dry_run: bool = False):
+    """
+    Restore the budget data to a revision, server-side. Only rows that differ
+    are written (inserted, updated incl. moved, deleted). With dry_run=true
+    nothing is written and the response only reports the counts.
+    """
+    try:
+        result = await revision_service.restore_revision(rev_id, dry_run)
+    except RevisionNotDiffable as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if result is None:
         raise HTTPException(status_code=404, detail="Revision not found")
-    return rev
+    return {
+        "message": "Restore preview" if dry_run else "Revision restored successfully",
+        "dry_run": dry_run,
+        "count": result["total"],
+        "changes": result
+    }
 
 @router.delete("/{rev_id}")
 async def delete_revision(rev_id: str):
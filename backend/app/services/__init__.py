@@ -3,5 +3,8 @@ from app.services.master_data_service import master_data_service
 from app.services.theme_service import theme_service
 from app.services.revision_service import revision_service
 from app.services.export_service import export_service
+from app.services.export_pool import export_pool
+from app.services.export_cache import export_cache
+from app.services.export_job_service import export_job_service
 
-__all__ = ["budget_service", "master_data_service", "theme_service", "revision_service", "export_service"]
\ No newline at end of file
+__all__ = ["budget_service", "master_data_service", "theme_service", "revision_service", "export_service", "export_pool", "export_cache", "export_job_service"]
\ No newline at end of file
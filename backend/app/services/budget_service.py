@@ -1,52 +1,557 @@
-from typing import List, Optional, Dict, Any
+import asyncio
+import hashlib
+import json
+from typing import List, Optional, Dict, Any, Awaitable, Callable, Iterable, Tuple
 from bson import ObjectId
+from pymongo import InsertOne, ReplaceOne, UpdateOne, UpdateMany, DeleteMany
 from app.database import get_collection
 from app.models.schemas import (
     BudgetRowCreate,
     BudgetRowUpdate,
     BudgetRowResponse,
+    BudgetBatchOpType,
+    BudgetBatchOperation,
+    BudgetDetail,
     MonthlyDetail,
     RowType,
 )
 
 
+# Stored on every budget_rows document written by sync/create/copy.
+# Writes that change content without recomputing it ($set) must unset it,
+# a missing hash simply means "compare as changed" on the next sync.
+CONTENT_HASH_FIELD = "content_hash"
+
+# Materialized monthly aggregates per row (own allocation + all descendants),
+# one 12-slot array per measure, kept up to date by the rollup engine.
+MONTHLY_TOTALS_FIELD = "monthlyTotals"
+MONTHLY_MEASURES = ("rpd", "realization", "sp2d")
+
+# semula/menjadi total of a row with children = sum of the children's totals;
+# a parent whose total is first incremented from null starts from EMPTY_DETAIL.
+DETAIL_FIELDS = ("semula", "menjadi")
+EMPTY_DETAIL = {"volume": 0.0, "unit": "", "price": 0.0, "total": 0.0}
+# Row fields that feed the rollup, and what is read to compute its deltas
+ROLLUP_INPUT_FIELDS = {"semula", "menjadi", "monthlyAllocation"}
+ROLLUP_PROJECTION = {"semula": 1, "menjadi": 1, "monthlyAllocation": 1, MONTHLY_TOTALS_FIELD: 1}
+
+# Exports read the materialized monthlyTotals, never the per-month allocations
+EXPORT_PROJECTION = {"monthlyAllocation": 0, CONTENT_HASH_FIELD: 0}
+
+_MISSING = object()
+
+
+def content_hash(doc: dict) -> str:
+    """Stable hash of a budget row document (everything except _id and the hash itself)."""
+    payload = {
+        k: v for k, v in doc.items()
+        if k not in ("_id", CONTENT_HASH_FIELD)
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _detail_total(detail: Optional[dict]) -> float:
+    return float(detail.get("total") or 0) if detail else 0.0
+
+
+def _own_monthly_totals(doc: dict) -> Dict[str, List[float]]:
+    """Monthly arrays of a row's own allocation (monthlyAllocation is keyed "0".."11")."""
+    totals = {measure: [0.0] * 12 for measure in MONTHLY_MEASURES}
+    for key, detail in (doc.get("monthlyAllocation") or {}).items():
+        month = int(key) if str(key).isdigit() else -1
+        if not detail or not 0 <= month < 12:
+            continue
+        for measure in MONTHLY_MEASURES:
+            totals[measure][month] += float(detail.get(measure) or 0)
+    return totals
+
+
+def _budget_changed(doc: dict) -> bool:
+    """Whether a row's menjadi differs from its semula (volume, unit, price or total)."""
+    semula = doc.get("semula") or {}
+    menjadi = doc.get("menjadi") or {}
+    return any(
+        (semula.get(field) or 0) != (menjadi.get(field) or 0)
+        for field in ("volume", "unit", "price", "total")
+    )
+
+
+def _rollup_detail(current: Optional[dict], total: float) -> Optional[dict]:
+    """Parent semula/menjadi for a rolled-up total (same rule as recalculateBudget in the frontend)."""
+    if current:
+        return {**current, "total": total}
+    if total > 0:
+        return {**EMPTY_DETAIL, "total": total}
+    return None
+
+
+def _add_delta(target: Dict[str, float], delta: Dict[str, float], sign: float = 1.0) -> Dict[str, float]:
+    """Add `delta` (times `sign`) into `target`; both are $inc documents, see _contribution."""
+    for key, value in delta.items():
+        if value:
+            target[key] = target.get(key, 0.0) + sign * value
+    return target
+
+
+def _monthly_delta(monthly: Optional[Dict[str, List[float]]]) -> Dict[str, float]:
+    return {
+        f"{MONTHLY_TOTALS_FIELD}.{measure}.{month}": value
+        for measure in MONTHLY_MEASURES
+        for month, value in enumerate((monthly or {}).get(measure) or ())
+        if value
+    }
+
+
+def _contribution(doc: dict) -> Dict[str, float]:
+    """
+    What a row adds to each of its ancestors, as an $inc document:
+    {"semula.total": ..., "menjadi.total": ..., "monthlyTotals.rpd.0": ..., ...}
+    """
+    delta = {f"{field}.total": _detail_total(doc.get(field)) for field in DETAIL_FIELDS}
+    delta.update(_monthly_delta(doc.get(MONTHLY_TOTALS_FIELD)))
+    return delta
+
+
+def _input_delta(before: dict, after: dict, leaf_before: bool, leaf_after: bool) -> Dict[str, float]:
+    """
+    Change of a row's own input between two versions of it: its monthly
+    allocation, and its semula/menjadi totals while it is a leaf (the totals
+    of a row with children are derived from them, not input).
+    """
+    delta = _add_delta(
+        _monthly_delta(_own_monthly_totals(after)),
+        _monthly_delta(_own_monthly_totals(before)),
+        -1
+    )
+    for field in DETAIL_FIELDS:
+        new = _detail_total(after.get(field)) if leaf_after else 0.0
+        old = _detail_total(before.get(field)) if leaf_before else 0.0
+        _add_delta(delta, {f"{field}.total": new - old})
+    return delta
+
+
+def _is_structural(operations: List[BudgetBatchOperation]) -> bool:
+    """Whether a batch changes the hierarchy (insert/delete/move)."""
+    return any(
+        op.op in (BudgetBatchOpType.INSERT, BudgetBatchOpType.DELETE, BudgetBatchOpType.MOVE)
+        for op in operations
+    )
+
+
+def _overwrite_delta(before: dict, fields: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Increments restoring the semula/menjadi totals that a $set of `fields`
+    overwrote, so rolled-up deltas can be applied on top of the stored value.
+    """
+    delta: Dict[str, float] = {}
+    for field in DETAIL_FIELDS:
+        if field in fields:
+            _add_delta(delta, {
+                f"{field}.total": _detail_total(before.get(field)) - _detail_total(fields[field])
+            })
+    return delta
+
+
 class BudgetService:
     def __init__(self):
         self.collection_name = "budget_rows"
+        # In-process cache of the assembled tree, tagged with the data version
+        # it was built from. Every write goes through this service and bumps
+        # the version, so a cached tree is valid while the versions match.
+        self._data_version = 0
+        self._tree_cache: Optional[List[BudgetRowResponse]] = None
+        self._tree_cache_nodes: Dict[str, BudgetRowResponse] = {}
+        self._tree_cache_parents: Dict[str, Optional[str]] = {}
+        self._tree_cache_version = -1
+        # Writes that will patch the cached tree with increments once done;
+        # a tree loaded meanwhile may already contain them, so it is not cached
+        self._pending_patches = 0
+        self._indexes_initialized = False
+        # Writes that move aggregates run one at a time (see _write)
+        self._write_lock = asyncio.Lock()
+        self._transactions: Optional[bool] = None
+        self._rollups_stale = False
 
     def get_collection(self):
         return get_collection(self.collection_name)
 
-    async def _build_tree(self, rows: List[dict], parent_id: Optional[str] = None) -> List[BudgetRowResponse]:
-        """Recursively build tree structure from flat list."""
-        tree = []
-        for row in rows:
-            if row.get("parent_id") == parent_id:
-                children = await self._build_tree(rows, row["_id"])
-                tree.append(BudgetRowResponse(
-                    id=row["_id"],
-                    code=row["code"],
-                    description=row["description"],
-                    type=row["type"],
-                    semula=row.get("semula"),
-                    menjadi=row.get("menjadi"),
-                    monthlyAllocation=row.get("monthlyAllocation", {}),
-                    isBlocked=row.get("isBlocked"),
-                    isOpen=row.get("isOpen", True),
-                    children=children
+    async def _ensure_indexes(self):
+        """
+        Index (parent_id, order) so child lookups, sibling ordering and the
+        level-by-level subtree walks do not scan the collection.
+        """
+        if self._indexes_initialized:
+            return
+
+        collection = self.get_collection()
+        try:
+            await collection.create_index(
+                [("parent_id", 1), ("order", 1)],
+                name="parent_id_1_order_1"
+            )
+            self._indexes_initialized = True
+        except Exception as e:
+            # Log error tapi jangan hentikan aplikasi
+            print(f"Warning: Failed to initialize budget indexes: {e}")
+
+    async def _transactions_supported(self) -> bool:
+        """Whether the server runs transactions (replica set or mongos, e.g. Atlas)."""
+        if self._transactions is None:
+            try:
+                hello = await self.get_collection().database.command("hello")
+            except Exception:
+                return False
+            self._transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+        return self._transactions
+
+    async def _write(self, fn: Callable[[Any], Awaitable[Any]]) -> Any:
+        """
+        Run `fn(session)`, a write that changes rows and rolls the change up to
+        their ancestors, and return its result. Such writes run one at a time
+        in this process, each in one MongoDB transaction where the server
+        supports them: the row write and the ancestor increments commit
+        together, and a conflicting writer in another process is aborted and
+        retried (`fn` may run more than once, so it must only read and write
+        through `session`). Without transactions `session` is None; if a write
+        fails halfway the aggregates are rebuilt before the next one.
+        """
+        async with self._write_lock:
+            if not await self._transactions_supported():
+                if self._rollups_stale:
+                    await self._rebuild_rollups(None)
+                    self._rollups_stale = False
+                try:
+                    return await fn(None)
+                except BaseException:
+                    self._rollups_stale = True
+                    raise
+            client = self.get_collection().database.client
+            async with await client.start_session() as session:
+                return await session.with_transaction(fn)
+
+    @property
+    def data_version(self) -> int:
+        """Monotonically increasing version of the budget data in this process."""
+        return self._data_version
+
+    def _bump_version(self):
+        """Mark budget data as changed, invalidating the cached tree."""
+        self._data_version += 1
+        self._tree_cache = None
+        self._tree_cache_nodes = {}
+        self._tree_cache_parents = {}
+
+    def _patch_cached_node(
+        self,
+        row_id: str,
+        apply: Callable[[BudgetRowResponse], None],
+        increments: Optional[Dict[str, Dict[str, float]]] = None
+    ):
+        """
+        Apply an already-persisted change to the cached tree instead of dropping it.
+        `increments` are the rollup increments of that change (see _roll_up); their
+        semula/menjadi totals are applied to the cached nodes as well.
+        Copy-on-write: the touched nodes and their ancestors are replaced by
+        copies (`apply` gets the copy), so a tree handed out earlier, e.g. one
+        being flattened in a worker thread, never changes underneath its reader.
+        Falls back to invalidation when the cache is stale or a row is unknown.
+        """
+        totals = {
+            node_id: delta for node_id, delta in (increments or {}).items()
+            if any(delta.get(f"{field}.total") for field in DETAIL_FIELDS)
+        }
+        nodes = self._tree_cache_nodes
+        if (
+            self._tree_cache is None
+            or self._tree_cache_version != self._data_version
+            or row_id not in nodes
+            or any(node_id not in nodes for node_id in totals)
+        ):
+            self._bump_version()
+            return
+
+        parents = self._tree_cache_parents
+        copies: Dict[str, BudgetRowResponse] = {}
+        for node_id in [row_id, *totals]:
+            while node_id in nodes and node_id not in copies:
+                copies[node_id] = nodes[node_id].model_copy()
+                node_id = parents.get(node_id)
+        for node in copies.values():
+            if any(child.id in copies for child in node.children):
+                node.children = [copies.get(child.id, child) for child in node.children]
+
+        apply(copies[row_id])
+        for node_id, delta in totals.items():
+            node = copies[node_id]
+            for field in DETAIL_FIELDS:
+                change = delta.get(f"{field}.total")
+                if change:
+                    current = getattr(node, field)
+                    values = current.model_dump() if current else dict(EMPTY_DETAIL)
+                    values["total"] += change
+                    setattr(node, field, BudgetDetail(**values))
+        self._tree_cache = [copies.get(node.id, node) for node in self._tree_cache]
+        nodes.update(copies)
+        self._data_version += 1
+        self._tree_cache_version = self._data_version
+
+    def _rollup_docs(self, docs: List[dict]) -> List[dict]:
+        """
+        Recompute aggregates bottom-up, in place, in one pass over flat rows.
+        Rows with children in `docs` get the sum of their children's semula/menjadi
+        totals; rows without children in `docs` (leaves, i.e. user input) keep theirs.
+        Every row gets monthlyTotals = own monthlyAllocation + children's monthlyTotals.
+        Used for whole worksheets and new subtrees; writes to stored rows go
+        through _roll_up instead. Returns the rows that changed.
+        """
+        by_id = {doc["_id"]: doc for doc in docs}
+        children: Dict[str, List[dict]] = {}
+        roots = []
+        for doc in docs:
+            parent_id = doc.get("parent_id")
+            if parent_id in by_id:
+                children.setdefault(parent_id, []).append(doc)
+            else:
+                roots.append(doc)
+
+        # Top-down order; walking it backwards visits children before parents
+        ordered = roots
+        for doc in ordered:
+            ordered.extend(children.get(doc["_id"], []))
+
+        changed = []
+        for doc in reversed(ordered):
+            kids = children.get(doc["_id"], [])
+
+            monthly = _own_monthly_totals(doc)
+            for kid in kids:
+                kid_monthly = kid.get(MONTHLY_TOTALS_FIELD) or {}
+                for measure in MONTHLY_MEASURES:
+                    values = monthly[measure]
+                    for month, value in enumerate(kid_monthly.get(measure) or ()):
+                        values[month] += value
+            updates = {MONTHLY_TOTALS_FIELD: monthly}
+
+            if kids:
+                updates["semula"] = _rollup_detail(
+                    doc.get("semula"), sum(_detail_total(k.get("semula")) for k in kids)
+                )
+                updates["menjadi"] = _rollup_detail(
+                    doc.get("menjadi"), sum(_detail_total(k.get("menjadi")) for k in kids)
+                )
+
+            if any(doc.get(key) != value for key, value in updates.items()):
+                doc.update(updates)
+                changed.append(doc)
+        return changed
+
+    async def _write_rollups(self, changed: List[dict], session=None):
+        """Persist recomputed totals and monthly aggregates of the given rows."""
+        if not changed:
+            return
+        await self.get_collection().bulk_write([
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {
+                    "$set": {
+                        "semula": doc.get("semula"),
+                        "menjadi": doc.get("menjadi"),
+                        MONTHLY_TOTALS_FIELD: doc[MONTHLY_TOTALS_FIELD],
+                    },
+                    "$unset": {CONTENT_HASH_FIELD: ""}
+                }
+            )
+            for doc in changed
+        ], ordered=False, session=session)
+
+    async def _roll_up(
+        self,
+        changes: Dict[Optional[str], Dict[str, float]],
+        own: Optional[Dict[str, Dict[str, float]]] = None,
+        session=None
+    ) -> Dict[str, Dict[str, float]]:
+        """
+        Update stored aggregates after a write by increments instead of recomputing them:
+        every delta in `changes` is added to that row and all its ancestors, every delta
+        in `own` to that row only. Deltas are $inc documents (see _contribution).
+        One aggregation resolves the ancestor paths, one bulk_write applies them;
+        call it inside _write, in the same session as the row write.
+        If a row on those paths has no monthlyTotals yet (stored before aggregates
+        were materialized) the whole worksheet is rebuilt instead and the cached
+        tree dropped. Returns the increments applied per row.
+        """
+        increments: Dict[str, Dict[str, float]] = {}
+        for row_id, delta in (own or {}).items():
+            _add_delta(increments.setdefault(row_id, {}), delta)
+
+        start = {
+            row_id: delta for row_id, delta in changes.items()
+            if row_id is not None and any(delta.values())
+        }
+        if start:
+            pipeline = [
+                {"$match": {"_id": {"$in": list(start)}}},
+                {"$graphLookup": {
+                    "from": self.collection_name,
+                    "startWith": "$parent_id",
+                    "connectFromField": "parent_id",
+                    "connectToField": "_id",
+                    "as": "ancestors",
+                }},
+                {"$project": {"ancestors._id": 1}},
+            ]
+            async for row in self.get_collection().aggregate(pipeline, session=session):
+                for path_id in [row["_id"], *(a["_id"] for a in row.get("ancestors", []))]:
+                    _add_delta(increments.setdefault(path_id, {}), start[row["_id"]])
+
+        increments = {row_id: delta for row_id, delta in increments.items() if any(delta.values())}
+        if not increments:
+            return {}
+        if await self.get_collection().find_one(
+            {"_id": {"$in": list(increments)}, MONTHLY_TOTALS_FIELD: {"$exists": False}},
+            {"_id": 1},
+            session=session
+        ):
+            await self._rebuild_rollups(session)
+            self._bump_version()
+            return {}
+        await self._write_increments(increments, session)
+        return increments
+
+    async def _write_increments(self, increments: Dict[str, Dict[str, float]], session=None):
+        """$inc rollup increments onto the given rows in one ordered bulk_write."""
+        operations = []
+        for row_id, delta in increments.items():
+            delta = {key: value for key, value in delta.items() if value}
+            for key in delta:
+                if not key.startswith(MONTHLY_TOTALS_FIELD):
+                    # $inc cannot create "total" inside a null semula/menjadi
+                    field = key.split(".", 1)[0]
+                    operations.append(UpdateOne(
+                        {"_id": row_id, field: None},
+                        {"$set": {field: dict(EMPTY_DETAIL)}}
+                    ))
+            if delta:
+                operations.append(UpdateOne(
+                    {"_id": row_id},
+                    {"$inc": delta, "$unset": {CONTENT_HASH_FIELD: ""}}
                 ))
-        # Sort by order
-        tree.sort(key=lambda x: next(
-            (r.get("order", 0) for r in rows if r["_id"] == x.id), 0
-        ))
-        return tree
+        if operations:
+            await self.get_collection().bulk_write(operations, ordered=True, session=session)
+
+    async def _rebuild_rollups(self, session=None) -> int:
+        """Recompute and store all aggregates (see rebuild_rollups); call it inside _write."""
+        cursor = self.get_collection().find({}, {
+            "parent_id": 1, "semula": 1, "menjadi": 1,
+            "monthlyAllocation": 1, MONTHLY_TOTALS_FIELD: 1
+        }, session=session)
+        docs = await cursor.to_list(length=None)
+        changed = self._rollup_docs(docs)
+        await self._write_rollups(changed, session)
+        return len(changed)
+
+    async def rebuild_rollups(self) -> int:
+        """
+        Recompute totals and monthly aggregates of the whole worksheet in one pass
+        (e.g. for rows written before aggregates existed). Returns the number of rows updated.
+        """
+        try:
+            return await self._write(self._rebuild_rollups)
+        finally:
+            self._bump_version()
+
+    async def get_aggregates(self, row_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Monthly and yearly rpd/realization/sp2d aggregates per row (own + descendants),
+        read from the materialized monthlyTotals; nothing is recomputed per request.
+        """
+        collection = self.get_collection()
+        query = {"_id": {"$in": row_ids}} if row_ids else {}
+        rows = await collection.find(query, {MONTHLY_TOTALS_FIELD: 1}).to_list(length=None)
+
+        if any(MONTHLY_TOTALS_FIELD not in row for row in rows):
+            # Rows stored before aggregates were materialized: backfill once
+            await self.rebuild_rollups()
+            rows = await collection.find(query, {MONTHLY_TOTALS_FIELD: 1}).to_list(length=None)
+
+        result = {}
+        for row in rows:
+            monthly = row.get(MONTHLY_TOTALS_FIELD) or {}
+            months = {measure: monthly.get(measure) or [0.0] * 12 for measure in MONTHLY_MEASURES}
+            result[row["_id"]] = {
+                "monthly": months,
+                "year": {measure: sum(values) for measure, values in months.items()},
+            }
+        return result
+
+    def _row_to_response(self, row: dict) -> BudgetRowResponse:
+        """Convert a stored document to a response node (without children)."""
+        return BudgetRowResponse(
+            id=row["_id"],
+            code=row["code"],
+            description=row["description"],
+            type=row["type"],
+            semula=row.get("semula"),
+            menjadi=row.get("menjadi"),
+            monthlyAllocation=row.get("monthlyAllocation") or {},
+            isBlocked=row.get("isBlocked"),
+            isOpen=row.get("isOpen", True),
+        )
+
+    def _build_tree(
+        self,
+        rows: List[dict],
+        nodes: Optional[Dict[str, BudgetRowResponse]] = None
+    ) -> List[BudgetRowResponse]:
+        """
+        Build tree structure from flat list in a single pass.
+        Rows are grouped by parent_id, siblings are ordered by their stored
+        `order` field, then every node is linked to its parent's children.
+        Rows whose parent does not exist are not reachable from the root and are skipped.
+        If `nodes` is given it is filled with an id -> node index of the tree.
+        """
+        children_map: Dict[Optional[str], List[dict]] = {}
+        for row in rows:
+            children_map.setdefault(row.get("parent_id"), []).append(row)
+
+        if nodes is None:
+            nodes = {}
+        for row in rows:
+            nodes[row["_id"]] = self._row_to_response(row)
+
+        for parent_id, siblings in children_map.items():
+            # Stable sort keeps insertion order for equal `order` values
+            siblings.sort(key=lambda r: r.get("order", 0))
+            if parent_id is not None and parent_id in nodes:
+                nodes[parent_id].children = [nodes[r["_id"]] for r in siblings]
+
+        return [nodes[r["_id"]] for r in children_map.get(None, [])]
 
     async def get_all_rows(self) -> List[BudgetRowResponse]:
-        """Get all budget rows as tree structure."""
+        """
+        Get all budget rows as tree structure.
+        The tree is served from cache while no write has happened since it was built.
+        The returned models are shared with the cache and must not be mutated;
+        cache patches replace nodes instead of changing them (see _patch_cached_node).
+        """
+        if self._tree_cache is not None and self._tree_cache_version == self._data_version:
+            return self._tree_cache
+
+        version = self._data_version
         collection = self.get_collection()
         cursor = collection.find({})
         rows = await cursor.to_list(length=None)
-        return await self._build_tree(rows, None)
+        nodes: Dict[str, BudgetRowResponse] = {}
+        tree = self._build_tree(rows, nodes)
+
+        # Only cache if no write landed while the rows were being loaded
+        if version == self._data_version and not self._pending_patches:
+            self._tree_cache = tree
+            self._tree_cache_nodes = nodes
+            self._tree_cache_parents = {row["_id"]: row.get("parent_id") for row in rows}
+            self._tree_cache_version = version
+        return tree
 
     async def get_row_by_id(self, row_id: str) -> Optional[dict]:
         """Get single budget row by ID."""
@@ -54,21 +559,16 @@ class BudgetService:
         row = await collection.find_one({"_id": row_id})
         return row
 
-    async def _create_row_recursive(
+    def _create_doc(
         self,
         row_data: BudgetRowCreate,
         parent_id: Optional[str],
-        order: int
-    ) -> str:
-        """Recursively create row and its children."""
-        collection = self.get_collection()
-        
-        # Generate unique ID
-        row_id = str(ObjectId())
-        
-        # Prepare document
+        order: int,
+        row_id: Optional[str] = None
+    ) -> dict:
+        """Build the storage document for a new row (without its children)."""
         doc = {
-            "_id": row_id,
+            "_id": row_id or str(ObjectId()),
             "code": row_data.code,
             "description": row_data.description,
             "type": row_data.type.value if isinstance(row_data.type, RowType) else row_data.type,
@@ -82,35 +582,73 @@ class BudgetService:
             "parent_id": parent_id,
             "order": order
         }
-        
-        await collection.insert_one(doc)
-        
-        # Create children
-        for i, child in enumerate(row_data.children):
-            await self._create_row_recursive(child, row_id, i)
-        
-        return row_id
+        doc[CONTENT_HASH_FIELD] = content_hash(doc)
+        return doc
+
+    def _flatten_create(
+        self,
+        row_data: BudgetRowCreate,
+        parent_id: Optional[str],
+        order: int
+    ) -> List[dict]:
+        """
+        Flatten a nested create payload into documents with fresh ids.
+        Documents are in pre-order of the payload (root first), so the
+        resulting ids map one-to-one onto a depth-first walk of the input tree.
+        """
+        documents = []
+        stack = [(row_data, parent_id, order)]
+        while stack:
+            node, node_parent_id, node_order = stack.pop()
+            doc = self._create_doc(node, node_parent_id, node_order)
+            documents.append(doc)
+            for i in range(len(node.children) - 1, -1, -1):
+                stack.append((node.children[i], doc["_id"], i))
+        return documents
 
     async def create_row(
         self,
         row_data: BudgetRowCreate,
         parent_id: Optional[str] = None
-    ) -> str:
-        """Create a new budget row."""
-        # Get current max order for siblings
+    ) -> List[str]:
+        """
+        Create a new budget row with its nested children.
+        The whole subtree is written with a single insert_many. Returns the
+        new ids in pre-order of the payload; the first id is the created row.
+        """
+        await self._ensure_indexes()
         collection = self.get_collection()
-        max_order_doc = await collection.find_one(
-            {"parent_id": parent_id},
-            sort=[("order", -1)]
-        )
-        order = (max_order_doc.get("order", -1) + 1) if max_order_doc else 0
-        
-        return await self._create_row_recursive(row_data, parent_id, order)
 
-    async def update_row(self, row_id: str, row_data: BudgetRowUpdate) -> bool:
-        """Update a budget row."""
-        collection = self.get_collection()
-        
+        async def write(session) -> List[str]:
+            # Get current max order for siblings
+            max_order_doc = await collection.find_one(
+                {"parent_id": parent_id},
+                sort=[("order", -1)],
+                session=session
+            )
+            order = (max_order_doc.get("order", -1) + 1) if max_order_doc else 0
+
+            docs = self._flatten_create(row_data, parent_id, order)
+            if self._rollup_docs(docs):
+                for doc in docs:
+                    doc[CONTENT_HASH_FIELD] = content_hash(doc)
+            changes = {parent_id: _contribution(docs[0])}
+            if parent_id is not None and max_order_doc is None:
+                # First child: the parent's totals stop being its own input
+                parent = await collection.find_one({"_id": parent_id}, ROLLUP_PROJECTION, session=session)
+                if parent:
+                    _add_delta(changes[parent_id], _input_delta(parent, parent, True, False))
+            await collection.insert_many(docs, session=session)
+            await self._roll_up(changes, session=session)
+            return [doc["_id"] for doc in docs]
+
+        try:
+            return await self._write(write)
+        finally:
+            self._bump_version()
+
+    def _update_fields(self, row_data: BudgetRowUpdate) -> Dict[str, Any]:
+        """Storage fields to $set for a partial row update."""
         update_data = {}
         if row_data.code is not None:
             update_data["code"] = row_data.code
@@ -130,74 +668,271 @@ class BudgetService:
             update_data["isBlocked"] = row_data.isBlocked
         if row_data.isOpen is not None:
             update_data["isOpen"] = row_data.isOpen
+        return update_data
+
+    async def _update_input(
+        self,
+        row_id: str,
+        fields: Dict[str, Any]
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Dict[str, float]]]]:
+        """
+        $set fields of a stored row that include rollup inputs (semula, menjadi,
+        monthlyAllocation or one "monthlyAllocation.<month>") and roll the change up:
+        the difference goes to the row's own monthlyTotals and to all its ancestors,
+        in the same _write as the row itself. A row with children keeps its derived
+        semula/menjadi totals. Returns (fields as written, rollup increments),
+        or None if the row does not exist.
+        """
+        collection = self.get_collection()
+        inputs = [key for key in fields if key.split(".", 1)[0] in ROLLUP_INPUT_FIELDS]
+        projection = {"parent_id": 1, **dict.fromkeys(inputs, 1)}
+
+        async def write(session):
+            before = await collection.find_one({"_id": row_id}, projection, session=session)
+            if before is None:
+                return None
+            leaf = await collection.find_one({"parent_id": row_id}, {"_id": 1}, session=session) is None
+            written = dict(fields)
+            after = dict(before)
+            for key in inputs:
+                field, _, month = key.partition(".")
+                if month:
+                    after[field] = {**(before.get(field) or {}), month: written[key]}
+                else:
+                    if field in DETAIL_FIELDS and not leaf:
+                        written[key] = _rollup_detail(written[key], _detail_total(before.get(field)))
+                    after[field] = written[key]
+
+            delta = _input_delta(before, after, leaf, leaf)
+            own_monthly = {k: v for k, v in delta.items() if k.startswith(MONTHLY_TOTALS_FIELD)}
+            await collection.update_one(
+                {"_id": row_id},
+                {"$set": written, "$unset": {CONTENT_HASH_FIELD: ""}},
+                session=session
+            )
+            increments = await self._roll_up(
+                {before.get("parent_id"): delta}, {row_id: own_monthly}, session
+            )
+            return written, increments
+
+        return await self._write(write)
+
+    async def update_row(self, row_id: str, row_data: BudgetRowUpdate) -> bool:
+        """Update a budget row (changes to rollup inputs go through _update_input)."""
+        collection = self.get_collection()
         
+        update_data = self._update_fields(row_data)
         if not update_data:
             return False
         
-        result = await collection.update_one(
-            {"_id": row_id},
-            {"$set": update_data}
-        )
-        return result.modified_count > 0
+        self._pending_patches += 1
+        try:
+            increments = {}
+            if not ROLLUP_INPUT_FIELDS & update_data.keys():
+                result = await collection.update_one(
+                    {"_id": row_id},
+                    {"$set": update_data, "$unset": {CONTENT_HASH_FIELD: ""}}
+                )
+                if result.modified_count == 0:
+                    return False
+            else:
+                written = await self._update_input(row_id, update_data)
+                if written is None:
+                    return False
+                update_data, increments = written
+            def apply(node: BudgetRowResponse):
+                for key, value in update_data.items():
+                    if key in DETAIL_FIELDS:
+                        setattr(node, key, BudgetDetail(**value))
+                    else:
+                        setattr(node, key, getattr(row_data, key))
+            self._patch_cached_node(row_id, apply, increments)
+        finally:
+            self._pending_patches -= 1
+        return True
+
+    async def _get_subtree_docs(
+        self,
+        row_id: str,
+        projection: Optional[dict] = None,
+        session=None
+    ) -> List[dict]:
+        """
+        Load a row and all its descendants, walking the tree breadth-first:
+        one find per level on the (parent_id, order) index, so no server-side
+        stage has to hold the whole subtree ($graphLookup collects it into a
+        single array, capped at 100MB). Returns the row document first, then
+        its descendants level by level, or [] if the row does not exist.
+        `projection` is applied server-side to every returned document.
+        """
+        await self._ensure_indexes()
+        collection = self.get_collection()
+        root = await collection.find_one({"_id": row_id}, projection, session=session)
+        if root is None:
+            return []
+        docs = [root]
+        seen = {row_id}
+        level = [row_id]
+        while level:
+            cursor = collection.find({"parent_id": {"$in": level}}, projection, session=session)
+            level = []
+            async for doc in cursor:
+                if doc["_id"] not in seen:
+                    seen.add(doc["_id"])
+                    docs.append(doc)
+                    level.append(doc["_id"])
+        return docs
+
+    async def _get_subtree_ids(self, row_id: str, session=None) -> Optional[dict]:
+        """
+        Resolve a row and all its descendants (see _get_subtree_docs; only ids are read).
+        Returns {"parent_id": ..., "ids": [row_id, *descendant_ids]}, or None if the row does not exist.
+        """
+        docs = await self._get_subtree_docs(row_id, {"parent_id": 1}, session)
+        if not docs:
+            return None
+        return {"parent_id": docs[0].get("parent_id"), "ids": [doc["_id"] for doc in docs]}
+
+    async def get_export_rows(
+        self,
+        row_id: Optional[str] = None,
+        types: Optional[List[RowType]] = None,
+        changed_only: bool = False
+    ) -> Optional[List[dict]]:
+        """
+        Rows to export, in worksheet (depth-first) order.
+        The order is worked out from the hierarchy alone (parent_id/order, plus
+        semula/menjadi for `changed_only`), read for the whole worksheet or, with
+        `row_id`, for that row's subtree (_get_subtree_docs). Full documents are
+        then read only for the rows that are exported: `types` is part of that
+        query. Monthly allocations are never loaded since exports use monthlyTotals.
+        `changed_only` keeps rows whose menjadi differs from semula plus their
+        ancestors (for context). Returns None if `row_id` does not exist.
+        """
+        collection = self.get_collection()
+        projection = {"parent_id": 1, "order": 1}
+        if changed_only:
+            projection.update(dict.fromkeys(DETAIL_FIELDS, 1))
+        if row_id:
+            structure = await self._get_subtree_docs(row_id, projection)
+            if not structure:
+                return None
+        else:
+            structure = await collection.find({}, projection).to_list(length=None)
+
+        children_map: Dict[Optional[str], List[dict]] = {}
+        for doc in structure:
+            children_map.setdefault(doc.get("parent_id"), []).append(doc)
+        for siblings in children_map.values():
+            siblings.sort(key=lambda r: r.get("order", 0))
+
+        # Depth-first (worksheet) order from the subtree root or the top-level rows
+        ordered = []
+        stack = list(reversed(structure[:1] if row_id else children_map.get(None, [])))
+        while stack:
+            doc = stack.pop()
+            ordered.append(doc)
+            stack.extend(reversed(children_map.get(doc["_id"], [])))
+
+        if changed_only:
+            # Children come after their parent, so walking backwards marks ancestors in one pass
+            keep = set()
+            for doc in reversed(ordered):
+                if doc["_id"] in keep or _budget_changed(doc):
+                    keep.add(doc["_id"])
+                    keep.add(doc.get("parent_id"))
+            ordered = [doc for doc in ordered if doc["_id"] in keep]
+
+        position = {doc["_id"]: i for i, doc in enumerate(ordered)}
+        query: Dict[str, Any] = {"_id": {"$in": list(position)}} if row_id or changed_only else {}
+        if types:
+            query["type"] = {"$in": list({RowType(t).value for t in types})}
+
+        docs = await collection.find(query, EXPORT_PROJECTION).to_list(length=None)
+        if any(MONTHLY_TOTALS_FIELD not in doc for doc in docs):
+            # Rows stored before aggregates were materialized: backfill once
+            await self.rebuild_rollups()
+            docs = await collection.find(query, EXPORT_PROJECTION).to_list(length=None)
+        # Rows added after the hierarchy was read have no position and are left out
+        docs = [doc for doc in docs if doc["_id"] in position]
+        docs.sort(key=lambda doc: position[doc["_id"]])
+        return docs
 
     async def delete_row(self, row_id: str) -> bool:
-        """Delete a budget row and all its children."""
+        """Delete a budget row and all its children (one read per tree level, one delete_many)."""
         collection = self.get_collection()
-        
-        # Get all descendant IDs
-        async def get_descendant_ids(parent_id: str) -> List[str]:
-            ids = [parent_id]
-            cursor = collection.find({"parent_id": parent_id})
-            children = await cursor.to_list(length=None)
-            for child in children:
-                ids.extend(await get_descendant_ids(child["_id"]))
-            return ids
-        
-        all_ids = await get_descendant_ids(row_id)
-        result = await collection.delete_many({"_id": {"$in": all_ids}})
-        return result.deleted_count > 0
+
+        async def write(session) -> bool:
+            subtree = await self._get_subtree_ids(row_id, session)
+            if not subtree:
+                return False
+            # The root's totals are read by its deletion, and taken off its ancestors
+            root = await collection.find_one_and_delete(
+                {"_id": row_id}, projection=ROLLUP_PROJECTION, session=session
+            )
+            if root is None:
+                return False
+            await collection.delete_many({"_id": {"$in": subtree["ids"][1:]}}, session=session)
+            await self._roll_up(
+                {subtree["parent_id"]: _add_delta({}, _contribution(root), -1)}, session=session
+            )
+            return True
+
+        try:
+            return await self._write(write)
+        finally:
+            self._bump_version()
 
     async def copy_row(self, row_id: str) -> Optional[str]:
-        """Copy a row and all its children."""
+        """
+        Copy a row and all its children.
+        The subtree is loaded level by level and re-keyed in memory with fresh ids.
+        The copy is placed right after the original; following siblings are
+        shifted by one in the same bulk_write that inserts the copy.
+        """
         collection = self.get_collection()
-        
-        # Get original row
-        original = await collection.find_one({"_id": row_id})
-        if not original:
-            return None
-        
-        async def copy_recursive(orig_id: str, new_parent_id: Optional[str]) -> str:
-            orig = await collection.find_one({"_id": orig_id})
-            new_id = str(ObjectId())
-            
-            # Create new document
-            new_doc = {
-                "_id": new_id,
-                "code": orig["code"],
-                "description": orig["description"],
-                "type": orig["type"],
-                "semula": orig.get("semula"),
-                "menjadi": orig.get("menjadi"),
-                "monthlyAllocation": orig.get("monthlyAllocation", {}),
-                "isBlocked": orig.get("isBlocked"),
-                "isOpen": orig.get("isOpen", True),
-                "parent_id": new_parent_id,
-                "order": orig.get("order", 0) + 1  # Place after original
-            }
-            await collection.insert_one(new_doc)
-            
-            # Copy children
-            cursor = collection.find({"parent_id": orig_id})
-            children = await cursor.to_list(length=None)
-            for child in children:
-                await copy_recursive(child["_id"], new_id)
-            
-            return new_id
-        
-        return await copy_recursive(row_id, original.get("parent_id"))
 
-    async def add_child_row(self, parent_id: str, row_data: BudgetRowCreate) -> Optional[str]:
-        """Add a child row to a parent."""
+        async def write(session) -> Optional[str]:
+            docs = await self._get_subtree_docs(row_id, session=session)
+            if not docs:
+                return None
+
+            original = docs[0]
+            new_ids = {doc["_id"]: str(ObjectId()) for doc in docs}
+            parent_id = original.get("parent_id")
+            order = original.get("order", 0)
+
+            copies = []
+            for doc in docs:
+                new_doc = dict(doc)
+                new_doc["_id"] = new_ids[doc["_id"]]
+                if doc is original:
+                    new_doc["order"] = order + 1  # Place after original
+                else:
+                    new_doc["parent_id"] = new_ids[doc["parent_id"]]
+                new_doc[CONTENT_HASH_FIELD] = content_hash(new_doc)
+                copies.append(new_doc)
+
+            # Ordered: shift following siblings first so the copy itself is not shifted
+            operations = [
+                UpdateMany(
+                    {"parent_id": parent_id, "order": {"$gt": order}},
+                    {"$inc": {"order": 1}, "$unset": {CONTENT_HASH_FIELD: ""}}
+                )
+            ]
+            operations.extend(InsertOne(new_doc) for new_doc in copies)
+
+            await collection.bulk_write(operations, ordered=True, session=session)
+            await self._roll_up({parent_id: _contribution(original)}, session=session)
+            return new_ids[original["_id"]]
+
+        try:
+            return await self._write(write)
+        finally:
+            self._bump_version()
+
+    async def add_child_row(self, parent_id: str, row_data: BudgetRowCreate) -> Optional[List[str]]:
+        """Add a child row (with nested children) to a parent. Returns ids as in create_row."""
         # Verify parent exists
         parent = await self.get_row_by_id(parent_id)
         if not parent:
@@ -211,76 +946,491 @@ class BudgetService:
         month_index: int,
         detail: MonthlyDetail
     ) -> bool:
-        """Update monthly allocation for a specific month."""
+        """Update monthly allocation for a specific month (see _update_input)."""
+        self._pending_patches += 1
+        try:
+            written = await self._update_input(
+                row_id, {f"monthlyAllocation.{month_index}": detail.model_dump()}
+            )
+            if written is None:
+                return False
+            increments = written[1]
+            def apply(node: BudgetRowResponse):
+                node.monthlyAllocation = {
+                    **node.monthlyAllocation, str(month_index): detail.model_copy()
+                }
+            self._patch_cached_node(row_id, apply, increments)
+        finally:
+            self._pending_patches -= 1
+        return True
+
+    async def _load_structure(self, operations: List[BudgetBatchOperation], session=None) -> Dict[str, list]:
+        """
+        Load [parent_id, order] for the rows a batch needs to know about.
+        Structural batches (insert/delete/move) load the rows they reference
+        with their ancestor paths (to reject moves under a descendant), the
+        children of those rows and of their parents (sibling order, leaf
+        checks) and, if the batch deletes, the subtrees of deleted and moved
+        rows; never the whole hierarchy.
+        Field-only batches just need to know the rows exist, which the
+        cached tree can answer without a query.
+        """
         collection = self.get_collection()
-        result = await collection.update_one(
-            {"_id": row_id},
-            {"$set": {f"monthlyAllocation.{month_index}": detail.model_dump()}}
-        )
-        return result.modified_count > 0
+        projection = {"parent_id": 1, "order": 1}
+        row_ids = list({op.row_id for op in operations if op.row_id is not None})
+        if not _is_structural(operations):
+            if self._tree_cache is not None and self._tree_cache_version == self._data_version:
+                return {
+                    row_id: [None, 0] for row_id in row_ids
+                    if row_id in self._tree_cache_nodes
+                }
+            cursor = collection.find({"_id": {"$in": row_ids}}, projection, session=session)
+            return {
+                row["_id"]: [row.get("parent_id"), row.get("order", 0)]
+                async for row in cursor
+            }
+
+        targets = {
+            op.parent_id for op in operations
+            if op.op in (BudgetBatchOpType.INSERT, BudgetBatchOpType.MOVE)
+        }
+        rows: Dict[str, dict] = {}
+        pipeline = [
+            {"$match": {"_id": {"$in": list(set(row_ids) | targets - {None})}}},
+            {"$graphLookup": {
+                "from": self.collection_name,
+                "startWith": "$parent_id",
+                "connectFromField": "parent_id",
+                "connectToField": "_id",
+                "as": "ancestors",
+            }},
+            {"$project": {**projection, "ancestors._id": 1, "ancestors.parent_id": 1, "ancestors.order": 1}},
+        ]
+        async for row in collection.aggregate(pipeline, session=session):
+            for doc in [row, *row.pop("ancestors", [])]:
+                rows[doc["_id"]] = doc
+
+        # Referenced rows and their parents (None: top level) get all their children
+        parents = {rows[row_id].get("parent_id") for row_id in row_ids if row_id in rows}
+        parents |= targets | {row_id for row_id in row_ids if row_id in rows}
+        cursor = collection.find({"parent_id": {"$in": list(parents)}}, projection, session=session)
+        async for row in cursor:
+            rows[row["_id"]] = row
 
-    async def sync_all(self, data: List[BudgetRowResponse]) -> int:
+        # A deleted row takes its whole subtree, including rows moved into it
+        if any(op.op == BudgetBatchOpType.DELETE for op in operations):
+            for op in operations:
+                if op.op in (BudgetBatchOpType.DELETE, BudgetBatchOpType.MOVE) and op.row_id in rows:
+                    for row in await self._get_subtree_docs(op.row_id, projection, session):
+                        rows[row["_id"]] = row
+
+        return {
+            row["_id"]: [row.get("parent_id"), row.get("order", 0)]
+            for row in rows.values()
+        }
+
+    async def _batch_rollup(
+        self,
+        initial_parents: Optional[Dict[str, Optional[str]]],
+        index: Dict[str, list],
+        children: Dict[Optional[str], List[str]],
+        new_docs: Dict[str, dict],
+        inserted_parents: set,
+        pending: Dict[str, Dict[str, Any]],
+        detached: set,
+        session=None
+    ) -> Tuple[Dict[Optional[str], Dict[str, float]], Dict[str, Dict[str, float]]]:
         """
-        Sync all budget data - delete existing and insert new tree structure.
-        Accepts array of budget rows with nested children.
+        Rollup deltas of a batch for _roll_up, from the hierarchy before
+        (`initial_parents`, None for field-only batches) and after it, and the
+        stored values of the rows it touches (read just before the batch is written).
+        - `detached` rows take their stored aggregates off the old parent's path
+          and, unless deleted, add them to the new parent's path.
+        - Inserted rows are rolled up in memory and added to the path of the
+          existing row they end up under.
+        - Existing rows add the change of their own input; a first child replaces
+          a row's own totals, and a row left without children is reset to zero.
         """
+        changes: Dict[Optional[str], Dict[str, float]] = {}
+        own: Dict[str, Dict[str, float]] = {}
+        structural = initial_parents is not None
+
+        for doc in new_docs.values():
+            kids = children.get(doc["_id"], [])
+            if not any(kid in new_docs for kid in kids) and (kids or doc["_id"] in inserted_parents):
+                # Totals of an inserted parent come from its children only
+                for field in DETAIL_FIELDS:
+                    doc[field] = _rollup_detail(doc.get(field), 0.0)
+        self._rollup_docs(list(new_docs.values()))
+        for doc in new_docs.values():
+            if doc["parent_id"] not in new_docs:
+                _add_delta(changes.setdefault(doc["parent_id"], {}), _contribution(doc))
+
+        inputs = {
+            row_id for row_id, fields in pending.items()
+            if any(key.split(".", 1)[0] in ROLLUP_INPUT_FIELDS for key in fields)
+        }
+        if structural:
+            for row_id in detached:
+                inputs.add(initial_parents[row_id])
+                if row_id in index:
+                    inputs.add(index[row_id][0])
+            inputs.update(doc["parent_id"] for doc in new_docs.values())
+        inputs = {row_id for row_id in inputs if row_id in index and row_id not in new_docs}
+
         collection = self.get_collection()
-        
-        # Delete all existing data
-        await collection.delete_many({})
-        
-        # Flatten tree and insert
-        def flatten_tree(rows: List[BudgetRowResponse], parent_id: Optional[str] = None) -> List[dict]:
-            documents = []
-            for order, row in enumerate(rows):
-                # Convert monthlyAllocation - handle both dict and object
-                monthly_alloc = {}
-                if row.monthlyAllocation:
-                    for k, v in row.monthlyAllocation.items():
-                        if hasattr(v, 'model_dump'):
-                            monthly_alloc[str(k)] = v.model_dump()
-                        elif isinstance(v, dict):
-                            monthly_alloc[str(k)] = v
+        ids = list(inputs | detached)
+        stored = {}
+        if ids:
+            cursor = collection.find({"_id": {"$in": ids}}, ROLLUP_PROJECTION, session=session)
+            stored = {doc["_id"]: doc async for doc in cursor}
+        if structural:
+            was_parent = set(initial_parents.values())
+        elif inputs:
+            was_parent = set(await collection.distinct(
+                "parent_id", {"parent_id": {"$in": list(inputs)}}, session=session
+            ))
+        else:
+            was_parent = set()
+
+        for row_id in detached:
+            doc = stored.get(row_id)
+            new_parent = index[row_id][0] if row_id in index else _MISSING
+            if doc is None or new_parent == initial_parents[row_id]:
+                continue
+            _add_delta(changes.setdefault(initial_parents[row_id], {}), _contribution(doc), -1)
+            if new_parent is not _MISSING:
+                _add_delta(changes.setdefault(new_parent, {}), _contribution(doc))
+
+        for row_id in inputs:
+            before = stored.get(row_id)
+            if before is None:
+                continue
+            fields = pending.get(row_id, {})
+            after = {**before, **{key: fields[key] for key in DETAIL_FIELDS if key in fields}}
+            allocation = dict(before.get("monthlyAllocation") or {})
+            for key, value in fields.items():
+                if key == "monthlyAllocation":
+                    allocation = dict(value)
+                elif key.startswith("monthlyAllocation."):
+                    allocation[key.split(".", 1)[1]] = value
+            after["monthlyAllocation"] = allocation
+            leaf_before = row_id not in was_parent
+            leaf_after = not children.get(row_id) if structural else leaf_before
+            if leaf_after and not leaf_before:
+                # No children left: the totals were theirs and go down to zero with them
+                after.update({field: None for field in DETAIL_FIELDS if field not in fields})
+            _add_delta(changes.setdefault(row_id, {}), _input_delta(before, after, leaf_before, leaf_after))
+            own[row_id] = _overwrite_delta(before, fields)
+        return changes, own
+
+    async def apply_batch(self, operations: List[BudgetBatchOperation]) -> Dict[str, Any]:
+        """
+        Apply an ordered list of mutations with a single bulk_write.
+        Operations are first applied in order to an in-memory index of the
+        hierarchy (parent_id/order), so later operations see the effect of
+        earlier ones. Only the final state of every touched row is written,
+        which makes the unordered bulk_write independent of execution order.
+        Operations that cannot be applied (unknown row, invalid move) are
+        reported as failed and skipped; the rest of the batch still applies.
+        """
+        collection = self.get_collection()
+
+        async def write(session):
+            index = await self._load_structure(operations, session)
+            children: Dict[Optional[str], List[str]] = {}
+            for row_id, (parent_id, _) in index.items():
+                children.setdefault(parent_id, []).append(row_id)
+            initial_parents = (
+                {row_id: parent_id for row_id, (parent_id, _) in index.items()}
+                if _is_structural(operations) else None
+            )
+
+            new_docs: Dict[str, dict] = {}            # rows inserted by this batch
+            inserted_parents: set = set()             # inserted rows created with children
+            pending: Dict[str, Dict[str, Any]] = {}   # $set per existing row
+            deleted: set = set()
+            detached: set = set()                     # existing rows moved or deleted as subtree root
+
+            def set_fields(row_id: str, fields: Dict[str, Any]):
+                doc = new_docs.get(row_id)
+                for key, value in fields.items():
+                    is_month = key.startswith("monthlyAllocation.")
+                    if doc is not None:
+                        if is_month:
+                            doc["monthlyAllocation"][key.split(".", 1)[1]] = value
                         else:
-                            monthly_alloc[str(k)] = v
-                
-                # Convert semula/menjadi
-                semula = None
-                if row.semula:
-                    semula = row.semula.model_dump() if hasattr(row.semula, 'model_dump') else row.semula
-                
-                menjadi = None
-                if row.menjadi:
-                    menjadi = row.menjadi.model_dump() if hasattr(row.menjadi, 'model_dump') else row.menjadi
-                
-                doc = {
-                    "_id": row.id,
-                    "code": row.code,
-                    "description": row.description,
-                    "type": row.type.value if isinstance(row.type, RowType) else row.type,
-                    "semula": semula,
-                    "menjadi": menjadi,
-                    "monthlyAllocation": monthly_alloc,
-                    "isBlocked": row.isBlocked,
-                    "isOpen": row.isOpen,
-                    "parent_id": parent_id,
-                    "order": order
-                }
-                documents.append(doc)
-                
-                # Process children
-                if row.children:
-                    child_docs = flatten_tree(row.children, row.id)
-                    documents.extend(child_docs)
+                            doc[key] = value
+                        continue
+                    updates = pending.setdefault(row_id, {})
+                    if key == "monthlyAllocation":
+                        # A full replacement supersedes earlier single-month updates
+                        for month_key in [k for k in updates if k.startswith("monthlyAllocation.")]:
+                            del updates[month_key]
+                        updates[key] = value
+                    elif is_month and "monthlyAllocation" in updates:
+                        updates["monthlyAllocation"][key.split(".", 1)[1]] = value
+                    else:
+                        updates[key] = value
+
+            def place(row_id: str, parent_id: Optional[str], position: Optional[int]) -> int:
+                siblings = children.setdefault(parent_id, [])
+                if position is None:
+                    order = max((index[s][1] for s in siblings), default=-1) + 1
+                else:
+                    order = position
+                    for sibling_id in siblings:
+                        if index[sibling_id][1] >= position:
+                            index[sibling_id][1] += 1
+                            set_fields(sibling_id, {"order": index[sibling_id][1]})
+                siblings.append(row_id)
+                index[row_id] = [parent_id, order]
+                return order
+
+            def detach(row_id: str):
+                children[index[row_id][0]].remove(row_id)
+
+            def subtree(row_id: str) -> List[str]:
+                ids = [row_id]
+                for current in ids:
+                    ids.extend(children.get(current, []))
+                return ids
+
+            def fail(message: str) -> Dict[str, Any]:
+                return {"success": False, "detail": message}
+
+            results = []
+            for i, operation in enumerate(operations):
+                op = operation.op
+                row_id = operation.row_id
+                if op != BudgetBatchOpType.INSERT and row_id not in index:
+                    result = fail(f"Budget row with ID {row_id} not found")
+                elif op == BudgetBatchOpType.UPDATE:
+                    update_data = self._update_fields(operation.data)
+                    if update_data:
+                        set_fields(row_id, update_data)
+                        result = {"success": True, "id": row_id}
+                    else:
+                        result = fail("No fields to update")
+                elif op == BudgetBatchOpType.MONTHLY:
+                    set_fields(row_id, {
+                        f"monthlyAllocation.{operation.month_index}": operation.detail.model_dump()
+                    })
+                    result = {"success": True, "id": row_id}
+                elif op == BudgetBatchOpType.INSERT:
+                    parent_id = operation.parent_id
+                    if parent_id is not None and parent_id not in index:
+                        result = fail(f"Parent row with ID {parent_id} not found")
+                    else:
+                        docs = self._flatten_create(operation.row, parent_id, 0)
+                        inserted_parents.update(doc["parent_id"] for doc in docs[1:])
+                        root_id = docs[0]["_id"]
+                        docs[0]["order"] = place(root_id, parent_id, operation.position)
+                        for doc in docs:
+                            new_docs[doc["_id"]] = doc
+                            if doc["_id"] != root_id:
+                                index[doc["_id"]] = [doc["parent_id"], doc["order"]]
+                                children.setdefault(doc["parent_id"], []).append(doc["_id"])
+                        result = {"success": True, "id": root_id, "count": len(docs)}
+                elif op == BudgetBatchOpType.DELETE:
+                    ids = subtree(row_id)
+                    if row_id not in new_docs:
+                        detached.add(row_id)
+                    detach(row_id)
+                    for removed_id in ids:
+                        index.pop(removed_id, None)
+                        children.pop(removed_id, None)
+                        pending.pop(removed_id, None)
+                        if new_docs.pop(removed_id, None) is None:
+                            deleted.add(removed_id)
+                    result = {"success": True, "id": row_id, "count": len(ids)}
+                else:  # MOVE
+                    parent_id = operation.parent_id
+                    ancestor = parent_id
+                    while ancestor is not None and ancestor != row_id and ancestor in index:
+                        ancestor = index[ancestor][0]
+                    if parent_id is not None and parent_id not in index:
+                        result = fail(f"Parent row with ID {parent_id} not found")
+                    elif ancestor == row_id:
+                        result = fail("Cannot move a row under itself or its descendants")
+                    else:
+                        if row_id not in new_docs:
+                            detached.add(row_id)
+                        detach(row_id)
+                        order = place(row_id, parent_id, operation.position)
+                        set_fields(row_id, {"parent_id": parent_id, "order": order})
+                        result = {"success": True, "id": row_id}
+                results.append({"index": i, "op": op.value, **result})
+
+            changes, own = {}, {}
+            if new_docs or pending or deleted:
+                changes, own = await self._batch_rollup(
+                    initial_parents, index, children, new_docs, inserted_parents, pending, detached, session
+                )
+
+            writes = []
+            for doc in new_docs.values():
+                doc[CONTENT_HASH_FIELD] = content_hash(doc)
+                writes.append(InsertOne(doc))
+            for row_id, fields in pending.items():
+                writes.append(UpdateOne(
+                    {"_id": row_id},
+                    {"$set": fields, "$unset": {CONTENT_HASH_FIELD: ""}}
+                ))
+            if deleted:
+                writes.append(DeleteMany({"_id": {"$in": list(deleted)}}))
+
+            if writes:
+                await collection.bulk_write(writes, ordered=False, session=session)
+                await self._roll_up(changes, own, session)
+            return results, len(new_docs), len(pending), len(deleted)
+
+        try:
+            results, inserted, updated, deleted = await self._write(write)
+        finally:
+            self._bump_version()
+
+        return {
+            "results": results,
+            "changes": {
+                "inserted": inserted,
+                "updated": updated,
+                "deleted": deleted,
+            },
+        }
+
+    def _flatten_tree(self, rows: List[BudgetRowResponse], parent_id: Optional[str] = None) -> List[dict]:
+        """Flatten a response tree into storage documents (pre-order, with parent_id/order)."""
+        documents = []
+        for order, row in enumerate(rows):
+            # Convert monthlyAllocation - handle both dict and object
+            monthly_alloc = {}
+            if row.monthlyAllocation:
+                for k, v in row.monthlyAllocation.items():
+                    if hasattr(v, 'model_dump'):
+                        monthly_alloc[str(k)] = v.model_dump()
+                    elif isinstance(v, dict):
+                        monthly_alloc[str(k)] = v
+                    else:
+                        monthly_alloc[str(k)] = v
+            
+            # Convert semula/menjadi
+            semula = None
+            if row.semula:
+                semula = row.semula.model_dump() if hasattr(row.semula, 'model_dump') else row.semula
             
-            return documents
+            menjadi = None
+            if row.menjadi:
+                menjadi = row.menjadi.model_dump() if hasattr(row.menjadi, 'model_dump') else row.menjadi
+            
+            doc = {
+                "_id": row.id,
+                "code": row.code,
+                "description": row.description,
+                "type": row.type.value if isinstance(row.type, RowType) else row.type,
+                "semula": semula,
+                "menjadi": menjadi,
+                "monthlyAllocation": monthly_alloc,
+                "isBlocked": row.isBlocked,
+                "isOpen": row.isOpen,
+                "parent_id": parent_id,
+                "order": order
+            }
+            documents.append(doc)
+            
+            # Process children
+            if row.children:
+                documents.extend(self._flatten_tree(row.children, row.id))
         
-        all_docs = flatten_tree(data, None)
+        return documents
+
+    def _snapshot_docs(self, rows: Iterable[dict]) -> List[dict]:
+        """
+        Storage documents for flat snapshot rows as kept in revisions
+        (response fields without children, plus parent_id and order).
+        """
+        return [
+            {
+                "_id": row["id"],
+                "code": row["code"],
+                "description": row["description"],
+                "type": row["type"].value if isinstance(row["type"], RowType) else row["type"],
+                "semula": row.get("semula"),
+                "menjadi": row.get("menjadi"),
+                "monthlyAllocation": row.get("monthlyAllocation") or {},
+                "isBlocked": row.get("isBlocked"),
+                "isOpen": row.get("isOpen"),
+                "parent_id": row.get("parent_id"),
+                "order": row.get("order", 0)
+            }
+            for row in rows
+        ]
+
+    async def sync_all(self, data: List[BudgetRowResponse]) -> Dict[str, int]:
+        """
+        Sync all budget data with the given tree structure.
+        Accepts array of budget rows with nested children. See sync_docs.
+        """
+        return await self.sync_docs(self._flatten_tree(data, None))
+
+    async def restore_rows(self, rows: Iterable[dict], dry_run: bool = False) -> Dict[str, int]:
+        """Replace all budget data with flat snapshot rows from a revision. See sync_docs."""
+        return await self.sync_docs(self._snapshot_docs(rows), dry_run)
+
+    async def sync_docs(self, all_docs: List[dict], dry_run: bool = False) -> Dict[str, int]:
+        """
+        Make budget_rows equal to the given storage documents. Parent
+        semula/menjadi totals are recomputed from the leaves first, then
+        incoming rows are compared with stored rows by _id and content hash,
+        and only the difference (inserts, replacements incl. parent/order
+        moves, deletes) is written in one unordered bulk_write.
+        With dry_run nothing is written; the counts are the same.
+        """
+        collection = self.get_collection()
         
-        if all_docs:
-            await collection.insert_many(all_docs)
+        # Parent totals are always derived server-side, never trusted from the client
+        self._rollup_docs(all_docs)
+        for doc in all_docs:
+            doc[CONTENT_HASH_FIELD] = content_hash(doc)
         
-        return len(all_docs)
+        async def write(session) -> Dict[str, int]:
+            # Only ids and hashes are needed to compute the difference
+            cursor = collection.find({}, {CONTENT_HASH_FIELD: 1}, session=session)
+            stored_hashes = {
+                row["_id"]: row.get(CONTENT_HASH_FIELD)
+                async for row in cursor
+            }
+
+            counts = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+            operations = []
+            for doc in all_docs:
+                stored_hash = stored_hashes.pop(doc["_id"], _MISSING)
+                if stored_hash is _MISSING:
+                    operations.append(InsertOne(doc))
+                    counts["inserted"] += 1
+                elif stored_hash != doc[CONTENT_HASH_FIELD]:
+                    operations.append(ReplaceOne({"_id": doc["_id"]}, doc))
+                    counts["updated"] += 1
+                else:
+                    counts["unchanged"] += 1
+
+            # Whatever is left in storage is no longer part of the tree
+            if stored_hashes:
+                operations.append(DeleteMany({"_id": {"$in": list(stored_hashes)}}))
+                counts["deleted"] = len(stored_hashes)
+
+            if operations and not dry_run:
+                await collection.bulk_write(operations, ordered=False, session=session)
+            return counts
+
+        try:
+            counts = await self._write(write)
+        finally:
+            if not dry_run:
+                self._bump_version()
+
+        counts["total"] = len(all_docs)
+        return counts
 
 
 budget_service = BudgetService()
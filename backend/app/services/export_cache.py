@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from app.config import get_settings
+
+settings = get_settings()
+
+# Temporary files older than this are left over from a crashed or killed
+# renderer and are removed by evict()
+STALE_TMP_SECONDS = 6 * 3600
+
+
+class ExportCache:
+    """
+    Content-addressed on-disk cache for rendered exports (Excel/PDF).
+
+    A file is stored under a key derived from the export kind, its options and
+    a digest of the exact rows that were rendered, so a hit is always correct,
+    also across restarts and uvicorn workers. The key doubles as the ETag
+    (see app.utils.etag).
+    Within one process the key for (data_version, kind, options) is memoized,
+    so repeat downloads skip building the rows altogether.
+    Files are evicted least-recently-used first once the directory exceeds
+    `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._keys: Dict[Tuple[str, str], str] = {}
+        self._keys_version: Optional[int] = None
+
+    def _ensure_directory(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def _options_key(kind: str, options: dict) -> str:
+        return json.dumps({"kind": kind, **options}, sort_keys=True, default=str)
+
+    def make_key(self, kind: str, options: dict, rows: List[tuple]) -> str:
+        """
+        Key for rendering `rows` as `kind` with `options` (CPU-bound, run in threadpool).
+        Rows are hashed as compact JSON, one line each, so keys are the same
+        across Python versions and never depend on the in-memory representation.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(self._options_key(kind, options).encode())
+        for row in rows:
+            digest.update(b"\n")
+            digest.update(json.dumps(row, separators=(",", ":"), default=str).encode())
+        return digest.hexdigest()
+
+    def remember_key(self, version: int, kind: str, options: dict, key: str):
+        """Memoize the key of an export for the given data version."""
+        if version != self._keys_version:
+            self._keys = {}
+            self._keys_version = version
+        self._keys[(kind, self._options_key(kind, options))] = key
+
+    def known_key(self, version: int, kind: str, options: dict) -> Optional[str]:
+        """Key memoized for this data version, if any."""
+        if version != self._keys_version:
+            return None
+        return self._keys.get((kind, self._options_key(kind, options)))
+
+    def path_for(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key: str, suffix: str) -> Optional[str]:
+        """Path of a cached file, marking it as recently used; None on a miss."""
+        path = self.path_for(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def reserve(self, suffix: str) -> str:
+        """Temporary path inside the cache directory for a file being rendered."""
+        self._ensure_directory()
+        return os.path.join(self.directory, f".tmp-{uuid.uuid4().hex}{suffix}")
+
+    def put(self, key: str, suffix: str, tmp_path: str) -> str:
+        """Move a rendered file into the cache (atomically) and evict old entries."""
+        path = self.path_for(key, suffix)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return path
+
+    def discard(self, tmp_path: str):
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        Remove least recently used files until the cache fits in `max_bytes`,
+        and temporary files older than STALE_TMP_SECONDS.
+        """
+        entries = []
+        total = 0
+        stale_before = time.time() - STALE_TMP_SECONDS
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.startswith(".tmp-"):
+                    if stat.st_mtime < stale_before:
+                        self.discard(entry.path)
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+                total += stat.st_size
+
+        entries.sort()
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+export_cache = ExportCache(
+    settings.export_cache_dir or os.path.join(tempfile.gettempdir(), "sisara-exports"),
+    settings.export_cache_max_bytes
+)
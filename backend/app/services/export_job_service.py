@@ -0,0 +1,270 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+from fastapi.concurrency import run_in_threadpool
+from app.config import get_settings
+from app.models.schemas import ExportFilter, ExportJobStatus
+from app.services.budget_service import budget_service
+from app.services.export_cache import export_cache
+from app.services.export_pool import export_pool, ExportPoolBusy
+from app.services.export_service import export_service, EXPORT_FORMATS
+
+settings = get_settings()
+
+# Seconds to wait before retrying when the export pool is saturated
+POOL_RETRY_DELAY = 1.0
+
+# Identifies this server process in the jobs it creates: a queued or running
+# job with another token was owned by a process that has since been restarted
+INSTANCE_TOKEN = uuid.uuid4().hex
+
+
+class ExportJobLimit(Exception):
+    """Raised when too many export jobs are already queued or running."""
+
+
+class ExportRowNotFound(Exception):
+    """Raised when the root row of a subtree export does not exist."""
+
+
+class ExportJobService:
+    """
+    Background export jobs (POST /api/exports).
+
+    Each job is a JSON file in `directory` (status, rows rendered / total,
+    timestamps), next to a progress file written by the worker process and,
+    once finished, the rendered document. Rendering goes through the shared
+    export process pool and export cache, so a job for data that was already
+    exported completes immediately. Finished jobs are removed after `ttl` seconds
+    (checked at startup and whenever a job is created).
+    """
+
+    def __init__(self, directory: str, ttl: int, max_pending: int):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._tasks: set = set()
+
+    # --- On-disk storage ---
+
+    def _meta_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _progress_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.progress")
+
+    def file_path(self, job: dict) -> str:
+        return os.path.join(self.directory, job["id"] + EXPORT_FORMATS[job["format"]][1])
+
+    def _save(self, job: dict):
+        tmp_path = self._meta_path(job["id"]) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._meta_path(job["id"]))
+
+    def _load(self, job_id: str) -> Optional[dict]:
+        try:
+            with open(self._meta_path(job_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _update(self, job: dict, **fields):
+        job.update(fields)
+        self._save(job)
+
+    def _cleanup(self):
+        """Remove finished jobs older than the TTL."""
+        cutoff = time.time() - self.ttl
+        with os.scandir(self.directory) as it:
+            expired = [
+                entry.name[:-5] for entry in it
+                if entry.name.endswith(".json") and entry.stat().st_mtime < cutoff
+            ]
+        for job_id in expired:
+            job = self._load(job_id)
+            if not job or job["status"] not in (ExportJobStatus.DONE.value, ExportJobStatus.FAILED.value):
+                continue
+            for path in (self.file_path(job), self._progress_path(job_id), self._meta_path(job_id)):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    # --- Jobs ---
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def start(self):
+        """Prepare the jobs directory and drop expired jobs (called on application startup)."""
+        await run_in_threadpool(os.makedirs, self.directory, exist_ok=True)
+        await run_in_threadpool(self._cleanup)
+
+    async def create_job(self, export_format: str, filters: ExportFilter) -> Dict[str, Any]:
+        """
+        Create an export job and start it in the background; rows are
+        collected, keyed and rendered by the job itself (see _run).
+        Raises ExportJobLimit when `max_pending` jobs are already in flight
+        and ExportRowNotFound when `filters.row_id` does not exist.
+        """
+        if self.pending >= self.max_pending:
+            raise ExportJobLimit(f"Too many export jobs in progress ({self.pending})")
+        if filters.row_id and not await budget_service.get_row_by_id(filters.row_id):
+            raise ExportRowNotFound(f"Budget row with ID {filters.row_id} not found")
+
+        await run_in_threadpool(os.makedirs, self.directory, exist_ok=True)
+        await run_in_threadpool(self._cleanup)
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "format": export_format,
+            "status": ExportJobStatus.QUEUED.value,
+            "rendered": 0,
+            "total": 0,
+            "key": None,
+            "months": [filters.month_from, filters.month_to],
+            "instance": INSTANCE_TOKEN,
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "error": None,
+        }
+        self._save(job)
+        task = asyncio.create_task(self._run(job, filters))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return self.describe(job)
+
+    def _link_result(self, source: str, job: dict):
+        """Expose a cached file as the job result (hard link, copy as fallback)."""
+        target = self.file_path(job)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+    def _finish(self, job: dict):
+        self._update(
+            job,
+            status=ExportJobStatus.DONE.value,
+            rendered=job["total"],
+            finished_at=datetime.now().isoformat()
+        )
+
+    async def _run(self, job: dict, filters: ExportFilter):
+        renderer, suffix = EXPORT_FORMATS[job["format"]][:2]
+        tmp_path = export_cache.reserve(suffix)
+        try:
+            rows = await export_service.collect_rows(filters)
+            if rows is None:
+                raise ExportRowNotFound(f"Budget row with ID {filters.row_id} not found")
+            key = await run_in_threadpool(
+                export_cache.make_key, job["format"], export_service.cache_options(filters), rows
+            )
+            self._update(job, total=len(rows), key=key)
+            cached = export_cache.get(key, suffix)
+            if cached:
+                # Already rendered: the job completes without touching the pool
+                await run_in_threadpool(self._link_result, cached, job)
+                self._finish(job)
+                return
+
+            while True:
+                self._update(job, status=ExportJobStatus.RUNNING.value)
+                try:
+                    await export_pool.run(
+                        renderer, rows, tmp_path, self._progress_path(job["id"]),
+                        range(job["months"][0], job["months"][1] + 1),
+                        on_abandoned=lambda: export_cache.discard(tmp_path)
+                    )
+                    break
+                except ExportPoolBusy:
+                    # Jobs wait for a free worker instead of failing
+                    self._update(job, status=ExportJobStatus.QUEUED.value)
+                    await asyncio.sleep(POOL_RETRY_DELAY)
+            del rows
+            path = await run_in_threadpool(export_cache.put, job["key"], suffix, tmp_path)
+            await run_in_threadpool(self._link_result, path, job)
+            self._finish(job)
+        except Exception as e:
+            export_cache.discard(tmp_path)
+            self._update(
+                job,
+                status=ExportJobStatus.FAILED.value,
+                error=str(e) or type(e).__name__,
+                finished_at=datetime.now().isoformat()
+            )
+        except BaseException:
+            # Cancelled on shutdown: the job is reported as interrupted afterwards
+            # (a worker still rendering removes tmp_path via on_abandoned)
+            export_cache.discard(tmp_path)
+            raise
+
+    def _read_progress(self, job_id: str) -> int:
+        try:
+            with open(self._progress_path(job_id)) as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current state of a job, or None if it does not exist (or has expired)."""
+        job = self._load(job_id)
+        if job is None:
+            return None
+        if job["status"] in (ExportJobStatus.QUEUED.value, ExportJobStatus.RUNNING.value):
+            if job.get("instance") != INSTANCE_TOKEN:
+                # The server process that owned the job was restarted
+                self._update(
+                    job,
+                    status=ExportJobStatus.FAILED.value,
+                    error="Export was interrupted, please start a new export"
+                )
+            elif job["status"] == ExportJobStatus.RUNNING.value:
+                job["rendered"] = min(self._read_progress(job_id), job["total"])
+        return self.describe(job)
+
+    def get_result(self, job_id: str) -> Optional[tuple]:
+        """(path, cache key) of a finished job's document, or None."""
+        job = self._load(job_id)
+        if job is None or job["status"] != ExportJobStatus.DONE.value:
+            return None
+        path = self.file_path(job)
+        return (path, job["key"]) if os.path.exists(path) else None
+
+    def describe(self, job: dict) -> Dict[str, Any]:
+        """Public view of a job (internal bookkeeping fields removed)."""
+        total = job["total"]
+        return {
+            "id": job["id"],
+            "format": job["format"],
+            "status": job["status"],
+            "rendered": job["rendered"],
+            "total": total,
+            "progress": (
+                round(job["rendered"] / total, 4) if total
+                else float(job["status"] == ExportJobStatus.DONE.value)
+            ),
+            "created_at": job["created_at"],
+            "finished_at": job["finished_at"],
+            "error": job["error"],
+        }
+
+    def shutdown(self):
+        """Cancel running jobs (called on application shutdown)."""
+        for task in list(self._tasks):
+            task.cancel()
+
+
+export_job_service = ExportJobService(
+    settings.export_jobs_dir or os.path.join(tempfile.gettempdir(), "sisara-export-jobs"),
+    settings.export_job_ttl,
+    settings.export_job_limit
+)
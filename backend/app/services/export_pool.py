@@ -0,0 +1,93 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+from app.config import get_settings
+
+settings = get_settings()
+
+
+class ExportPoolBusy(Exception):
+    """Raised when the export pool already has `queue_limit` jobs in flight."""
+
+
+class ExportPool:
+    """
+    Bounded process pool for CPU-bound export rendering (Excel/PDF).
+    Rendering runs outside the uvicorn event loop, so an export no longer
+    blocks other requests. At most `queue_limit` jobs may be running or
+    waiting at once; further submissions raise ExportPoolBusy.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = max(1, workers)
+        self.queue_limit = max(self.workers, queue_limit)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Jobs currently running or queued."""
+        return self._pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: worker tidak mewarisi thread / koneksi Motor dari proses utama
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable, *args, on_abandoned: Optional[Callable[[], None]] = None) -> Any:
+        """
+        Run a module-level function in a worker process and await its result.
+        The slot is released when the worker finishes, even if the caller
+        was cancelled (e.g. the client disconnected) in the meantime.
+        If the caller stops waiting (error or cancellation), `on_abandoned` is
+        called once the worker is done with the job, e.g. to delete its
+        partial output file; the worker may still be writing it until then.
+        """
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                raise ExportPoolBusy(
+                    f"Export queue is full ({self._pending}/{self.queue_limit} jobs)"
+                )
+            self._pending += 1
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool for the next job
+            self._executor = None
+            self._release(None)
+            raise
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wrap_future(future)
+        except BaseException as e:
+            if isinstance(e, BrokenProcessPool):
+                self._executor = None
+            if on_abandoned is not None:
+                future.add_done_callback(lambda _future: on_abandoned())
+            raise
+
+    def shutdown(self):
+        """Stop the workers (called on application shutdown)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+export_pool = ExportPool(settings.export_workers, settings.export_queue_limit)
@@ -1,10 +1,133 @@
 import io
-from typing import List
+import os
+import re
+from typing import Any, List, Dict, Optional, Iterator, Iterable, Sequence, BinaryIO
 from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.cell import Cell, WriteOnlyCell
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
+from reportlab.lib.colors import HexColor, black, white
+from reportlab.lib.pagesizes import A3, landscape
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.canvas import Canvas
+from fastapi.concurrency import run_in_threadpool
 # Pastikan import model sesuai dengan struktur project Anda
-from app.models.schemas import BudgetRowResponse, RowType 
+from app.models.schemas import RowType, ExportFilter
+from app.services.budget_service import budget_service, MONTHLY_TOTALS_FIELD
+
+# Naikkan bila output Excel/PDF berubah agar cache export lama tidak dipakai lagi
+EXPORT_LAYOUT_VERSION = 2
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'Mei', 'Jun', 'Jul', 'Agu', 'Sep', 'Okt', 'Nov', 'Des']
+ALL_MONTHS = range(12)
+
+# --- Tata letak PDF (A3 landscape, satuan point) ---
+PDF_PAGE_SIZE = landscape(A3)
+PDF_MARGIN = 18
+# Kode, Uraian, Semula (Vol, Sat, Harga, Jumlah), Menjadi (idem); lalu per bulan dan Total
+PDF_BASE_COL_WIDTHS = [60, 190, 26, 30, 46, 56, 26, 30, 46, 56]
+PDF_MONTH_COL_WIDTH = 44
+PDF_TOTAL_COL_WIDTH = 58
+PDF_FONT_SIZE = 6
+PDF_LINE_HEIGHT = 7.5
+PDF_CELL_PADDING = 2
+PDF_MAX_DESC_LINES = 4
+PDF_INDENT_STEP = 6
+PDF_HEADER_BAND = 12
+# ReportLab menyimpan semua halaman sampai save(); dokumen dirender per segmen
+# sebanyak ini lalu digabung, jadi memori dibatasi per segmen, bukan per dokumen
+PDF_SEGMENT_PAGES = 50
+
+PDF_REF = re.compile(rb"(\d+) 0 R")
+
+
+class PdfConcatenator:
+    """
+    Gabungkan segmen PDF buatan ReportLab menjadi satu dokumen yang ditulis
+    langsung ke `output`. Dari tiap segmen hanya objek halaman beserta isinya
+    (stream, font) yang disalin dengan nomor objek baru; Catalog, Pages dan Info
+    segmen diganti satu milik dokumen gabungan yang ditulis di close().
+    Yang disimpan per halaman hanya offset objek dan nomor objek halaman.
+    """
+    CATALOG, PAGES, INFO = 1, 2, 3
+
+    def __init__(self, output: BinaryIO, title: str):
+        self.output = output
+        self.title = title
+        self.position = 0
+        self.offsets: List[int] = [0, 0, 0]  # nomor objek 1..3 dipesan untuk close()
+        self.kids: List[int] = []
+        self._write(b"%PDF-1.3\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data: bytes):
+        self.output.write(data)
+        self.position += len(data)
+
+    def _write_object(self, obj_id: int, body: bytes):
+        if obj_id > len(self.offsets):
+            self.offsets.append(0)
+        self.offsets[obj_id - 1] = self.position
+        self._write(b"%d 0 obj\n" % obj_id + body + b"endobj\n")
+
+    def add_segment(self, data: bytes):
+        """Salin halaman dari satu PDF ReportLab lengkap (hasil save())."""
+        xref_at = int(data[data.rindex(b"startxref") + 9:].split()[0])
+        xref, _, trailer = data[xref_at:].partition(b"trailer")
+        lines = xref.split(b"\n")
+        first, count = map(int, lines[1].split())
+        starts = sorted(
+            (int(entry[:10]), obj_id)
+            for obj_id, entry in enumerate(lines[2:2 + count], start=first)
+            if entry[17:18] == b"n"
+        )
+        bodies = {}
+        for i, (start, obj_id) in enumerate(starts):
+            end = starts[i + 1][0] if i + 1 < len(starts) else xref_at
+            chunk = data[start:end]
+            bodies[obj_id] = chunk[chunk.index(b"obj") + 3:chunk.rindex(b"endobj")].lstrip(b"\r\n")
+
+        root = int(re.search(rb"/Root (\d+) 0 R", trailer).group(1))
+        info = re.search(rb"/Info (\d+) 0 R", trailer)
+        pages = int(re.search(rb"/Pages (\d+) 0 R", bodies[root]).group(1))
+        kids = bodies[pages][bodies[pages].index(b"/Kids"):]
+        kids = [int(ref) for ref in PDF_REF.findall(kids[:kids.index(b"]")])]
+
+        skipped = {root, pages, int(info.group(1)) if info else None}
+        copied = [obj_id for _, obj_id in starts if obj_id not in skipped]
+        renumber = {obj_id: len(self.offsets) + i + 1 for i, obj_id in enumerate(copied)}
+        renumber[pages] = self.PAGES
+
+        def ref(match):
+            return b"%d 0 R" % renumber[int(match.group(1))]
+
+        for obj_id in copied:
+            # Referensi hanya ada di dictionary, bukan di data stream
+            head, keyword, rest = bodies[obj_id].partition(b"stream")
+            self._write_object(renumber[obj_id], PDF_REF.sub(ref, head) + keyword + rest)
+        self.kids.extend(renumber[kid] for kid in kids)
+
+    def close(self):
+        """Tulis Pages, Catalog, Info dan tabel xref."""
+        kids = b" ".join(b"%d 0 R" % kid for kid in self.kids)
+        title = self.title.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        self._write_object(self.PAGES, b"<< /Count %d /Kids [ %s ] /Type /Pages >>\n" % (len(self.kids), kids))
+        self._write_object(self.CATALOG, b"<< /PageMode /UseNone /Pages %d 0 R /Type /Catalog >>\n" % self.PAGES)
+        self._write_object(
+            self.INFO,
+            b"<< /Creator (ReportLab PDF Library - www.reportlab.com) /Title (%s) >>\n"
+            % title.encode("latin-1", errors="replace")
+        )
+        xref_at = self.position
+        size = len(self.offsets) + 1
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        self._write(b"".join(b"%010d 00000 n \n" % offset for offset in self.offsets))
+        self._write(
+            b"trailer\n<< /Info %d 0 R /Root %d 0 R /Size %d >>\nstartxref\n%d\n%%%%EOF\n"
+            % (self.INFO, self.CATALOG, size, xref_at)
+        )
+
 
 class ExportService:
     def __init__(self):
@@ -21,6 +144,11 @@ class ExportService:
             RowType.DETAIL: 8
         }
         
+        # Jenis kolom Kode..Menjadi (sama untuk Excel dan PDF): menentukan style & perataan;
+        # kolom bulan dan Total selalu "number"
+        self.base_column_kinds = ["code", "desc", "text", "text", "number", "number",
+                                  "text", "text", "number", "number"]
+
         # Mapping warna background Excel (Hex ARGB) agar sesuai UI
         self.color_map = {
             RowType.SATKER: "FFF3F4F6",    # gray-100
@@ -31,153 +159,392 @@ class ExportService:
             RowType.ACCOUNT: "FFF9FAFB",   # gray-50
         }
 
-    def _flatten_tree(self, nodes: List[BudgetRowResponse], result: List[BudgetRowResponse]):
-        """Helper rekursif untuk meratakan tree menjadi list"""
-        for node in nodes:
-            result.append(node)
-            if node.children:
-                self._flatten_tree(node.children, result)
+    def _register_styles(self, wb: Workbook, ws) -> Dict[Any, StyleArray]:
+        """
+        Daftarkan NamedStyle sekali per workbook dan kembalikan mapping
+        (tipe baris, jenis kolom) -> StyleArray yang sudah di-resolve. Sel baru
+        cukup menyalin array indeks style tersebut, tanpa objek Font/Fill/Border
+        baru dan tanpa pencarian named style per sel.
+        """
+        thin = Side(style='thin')
+        border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        styles = {}
 
-    def generate_excel(self, data: List[BudgetRowResponse]) -> io.BytesIO:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Rincian Kertas Kerja"
+        header = NamedStyle(
+            name="rkk_header",
+            font=Font(bold=True, color="FFFFFF"),
+            fill=PatternFill(start_color="FF1E3A8A", end_color="FF1E3A8A", fill_type="solid"),  # Blue 800
+            alignment=Alignment(horizontal='center', vertical='center', wrap_text=True),
+            border=border,
+        )
+        wb.add_named_style(header)
+        styles["header"] = header.name
 
-        # --- 1. SETUP HEADERS ---
-        # Definisi Header Baris 1
-        headers_1 = [
-            ("Kode", 1, 3), ("Uraian", 1, 3), 
-            ("Semula", 4, 1), ("Menjadi", 4, 1), 
-            ("Rencana Penarikan Dana (RPD) & Realisasi", 13, 1)
-        ]
-        
-        col_idx = 1
-        for title, width, height in headers_1:
-            cell = ws.cell(row=1, column=col_idx, value=title)
-            if width > 1 or height > 1:
-                ws.merge_cells(start_row=1, start_column=col_idx, 
-                               end_row=1+(height-1), end_column=col_idx+(width-1))
-            col_idx += width
-
-        # Definisi Header Baris 2 (Sub-headers)
-        sub_headers = ["Vol", "Sat", "Harga", "Jumlah"]
-        
-        # Sub-header Semula (Kolom 3-6)
-        for i, h in enumerate(sub_headers):
-            cell = ws.cell(row=2, column=3+i, value=h)
-            ws.merge_cells(start_row=2, start_column=3+i, end_row=3, end_column=3+i)
-
-        # Sub-header Menjadi (Kolom 7-10)
-        for i, h in enumerate(sub_headers):
-            cell = ws.cell(row=2, column=7+i, value=h)
-            ws.merge_cells(start_row=2, start_column=7+i, end_row=3, end_column=7+i)
-
-        # Sub-header Bulan (Kolom 11-23)
-        months = ['Jan', 'Feb', 'Mar', 'Apr', 'Mei', 'Jun', 'Jul', 'Agu', 'Sep', 'Okt', 'Nov', 'Des', 'Total']
-        for i, m in enumerate(months):
-            cell = ws.cell(row=2, column=11+i, value=m)
-            ws.merge_cells(start_row=2, start_column=11+i, end_row=3, end_column=11+i)
-
-        # Styling Headers
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="FF1E3A8A", end_color="FF1E3A8A", fill_type="solid") # Blue 800
-        thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-
-        for row in ws.iter_rows(min_row=1, max_row=3, max_col=23):
-            for cell in row:
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                cell.border = thin_border
-
-        # Adjust Column Widths
+        for row_type in RowType:
+            c_hex = self.color_map.get(row_type)
+            fill = PatternFill(start_color=c_hex, end_color=c_hex, fill_type="solid") if c_hex else PatternFill()
+            font = Font(bold=row_type not in [RowType.DETAIL, RowType.SUBCOMPONENT])
+            variants = {
+                "code": dict(alignment=Alignment(vertical='top')),
+                "desc": dict(alignment=Alignment(
+                    indent=self.indent_map.get(row_type, 0), vertical='top', wrap_text=True
+                )),
+                "text": dict(),
+                "number": dict(number_format='#,##0'),
+            }
+            for kind, extra in variants.items():
+                style = NamedStyle(
+                    name=f"rkk_{row_type.value.lower()}_{kind}",
+                    font=font, fill=fill, border=border, **extra
+                )
+                wb.add_named_style(style)
+                styles[(row_type, kind)] = style.name
+
+        resolved = {}
+        for key, name in styles.items():
+            template = WriteOnlyCell(ws)
+            template.style = name
+            resolved[key] = template._style
+        return resolved
+
+    def _styled_cell(self, ws, value, style: StyleArray) -> Cell:
+        return Cell(ws, row=1, column=1, value=value, style_array=style)
+
+    def _column_kinds(self, months: Sequence[int]) -> List[str]:
+        return self.base_column_kinds + ["number"] * (len(months) + 1)
+
+    def compact_docs(self, docs: Iterable[dict], months: Sequence[int] = ALL_MONTHS) -> List[tuple]:
+        """
+        Baris ringkas dari dokumen budget_rows yang sudah terurut (budget_service.get_export_rows).
+        Nilai bulanan diambil dari monthlyTotals (RPD + Realisasi, termasuk turunan)
+        dan hanya untuk bulan `months`; Total dihitung atas bulan-bulan tersebut.
+        """
+        rows = []
+        for doc in docs:
+            values = [doc.get("code"), doc.get("description")]
+            for detail in (doc.get("semula"), doc.get("menjadi")):
+                if detail:
+                    values.extend([detail.get("volume"), detail.get("unit"), detail.get("price"), detail.get("total")])
+                else:
+                    values.extend([None] * 4)
+            totals = doc.get(MONTHLY_TOTALS_FIELD) or {}
+            rpd = totals.get("rpd") or [0.0] * 12
+            realization = totals.get("realization") or [0.0] * 12
+            monthly = [rpd[i] + realization[i] for i in months]
+            values.extend(monthly)
+            values.append(sum(monthly))  # Total periode
+            rows.append((doc["type"], values))
+        return rows
+
+    async def collect_rows(self, filters: ExportFilter) -> Optional[List[tuple]]:
+        """
+        Baris ringkas untuk export sesuai `filters` (subtree, tipe, bulan, hanya yang berubah).
+        Subtree dan tipe diseleksi di query MongoDB, "hanya yang berubah" saat menelusuri
+        tree (budget_service.get_export_rows).
+        None jika row_id tidak ditemukan.
+        """
+        docs = await budget_service.get_export_rows(filters.row_id, filters.types, filters.changed_only)
+        if docs is None:
+            return None
+        return await run_in_threadpool(self.compact_docs, docs, filters.months)
+
+    def cache_options(self, filters: ExportFilter) -> dict:
+        """Opsi yang menentukan isi file export (bagian dari kunci export_cache)."""
+        return {
+            "layout": EXPORT_LAYOUT_VERSION,
+            **filters.model_dump(mode="json", include=set(ExportFilter.model_fields)),
+        }
+
+    def write_excel_rows(self, rows: Iterable[tuple], output: BinaryIO, months: Sequence[int] = ALL_MONTHS):
+        """
+        Tulis workbook dari baris ringkas (lihat compact_docs);
+        `months` adalah bulan yang ada di baris tersebut (default seluruh tahun).
+        Menggunakan mode write-only openpyxl: baris langsung ditulis ke disk,
+        sehingga memori tetap datar berapa pun jumlah barisnya.
+        """
+        n_cols = 11 + len(months)
+        last_letter = get_column_letter(n_cols)
+        column_kinds = self._column_kinds(months)
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Rincian Kertas Kerja")
+        styles = self._register_styles(wb, ws)
+
+        # Adjust Column Widths (harus sebelum baris pertama ditulis)
         ws.column_dimensions['A'].width = 18  # Kode
         ws.column_dimensions['B'].width = 65  # Uraian (Lebih lebar)
-        for i in range(3, 24):
+        for i in range(3, n_cols + 1):
             ws.column_dimensions[get_column_letter(i)].width = 15
 
         # *** FITUR FREEZE PANES ***
         # Membekukan Baris 1-3 (Header) dan Kolom A-B (Kode & Uraian)
-        # 'C4' berarti pane akan beku di sebelah kiri C (A, B) dan di atas 4 (1, 2, 3)
         ws.freeze_panes = "C4"
 
+        # --- 1. SETUP HEADERS ---
+        sub_headers = ["Vol", "Sat", "Harga", "Jumlah"]
+        header_rows = [
+            ["Kode", "Uraian", "Semula", None, None, None, "Menjadi", None, None, None,
+             "Rencana Penarikan Dana (RPD) & Realisasi"] + [None] * len(months),
+            [None, None] + sub_headers + sub_headers + [MONTH_NAMES[m] for m in months] + ["Total"],
+            [None] * n_cols,
+        ]
+        for values in header_rows:
+            ws.append([self._styled_cell(ws, value, styles["header"]) for value in values])
+
+        # Kode & Uraian (baris 1-3), Semula/Menjadi/RPD (baris 1), sub-header (baris 2-3)
+        ws.merged_cells.add("A1:A3")
+        ws.merged_cells.add("B1:B3")
+        ws.merged_cells.add("C1:F1")
+        ws.merged_cells.add("G1:J1")
+        ws.merged_cells.add(f"K1:{last_letter}1")
+        for col in range(3, n_cols + 1):
+            letter = get_column_letter(col)
+            ws.merged_cells.add(f"{letter}2:{letter}3")
+
         # --- 2. POPULATE DATA ---
-        flat_data = []
-        self._flatten_tree(data, flat_data)
-
-        current_row = 4
-        for item in flat_data:
-            # Kolom Kode
-            ws.cell(row=current_row, column=1, value=item.code).alignment = Alignment(vertical='top')
-            
-            # Kolom Uraian dengan Indentasi
-            desc_cell = ws.cell(row=current_row, column=2, value=item.description)
-            indent_level = self.indent_map.get(item.type, 0)
-            desc_cell.alignment = Alignment(indent=indent_level, vertical='top', wrap_text=True)
-
-            # Styling Baris (Warna & Bold)
-            is_bold = item.type not in [RowType.DETAIL, RowType.SUBCOMPONENT]
-            row_fill = None
-            
-            if item.type in self.color_map:
-                c_hex = self.color_map[item.type]
-                row_fill = PatternFill(start_color=c_hex, end_color=c_hex, fill_type="solid")
-
-            for col in range(1, 24):
-                cell = ws.cell(row=current_row, column=col)
-                if row_fill:
-                    cell.fill = row_fill
-                if is_bold:
-                    cell.font = Font(bold=True)
-                cell.border = thin_border
-
-            # Data Semula
-            if item.semula:
-                ws.cell(row=current_row, column=3, value=item.semula.volume)
-                ws.cell(row=current_row, column=4, value=item.semula.unit)
-                ws.cell(row=current_row, column=5, value=item.semula.price).number_format = '#,##0'
-                ws.cell(row=current_row, column=6, value=item.semula.total).number_format = '#,##0'
-
-            # Data Menjadi
-            if item.menjadi:
-                ws.cell(row=current_row, column=7, value=item.menjadi.volume)
-                ws.cell(row=current_row, column=8, value=item.menjadi.unit)
-                ws.cell(row=current_row, column=9, value=item.menjadi.price).number_format = '#,##0'
-                ws.cell(row=current_row, column=10, value=item.menjadi.total).number_format = '#,##0'
-
-            # Data Bulanan (RPD + Realisasi)
-            total_rpd = 0
-            if hasattr(item, 'monthlyAllocation') and item.monthlyAllocation:
-                for i in range(12):
-                    m_key = str(i) # Kunci bulan biasanya string "0", "1", dst.
-                    val = 0
-                    
-                    # Akses data bulanan secara aman (baik dict maupun object)
-                    # Sesuaikan dengan cara data Anda di-load di backend
-                    allocs = item.monthlyAllocation
-                    if isinstance(allocs, dict) and m_key in allocs:
-                        detail = allocs[m_key]
-                        # Ambil RPD dan Realisasi
-                        rpd = detail.rpd if hasattr(detail, 'rpd') else detail.get('rpd', 0)
-                        real = detail.realization if hasattr(detail, 'realization') else detail.get('realization', 0)
-                        val = rpd + real
-                    elif hasattr(allocs, m_key):
-                        # Jika Pydantic model akses langsung
-                        detail = getattr(allocs, m_key)
-                        if detail:
-                             val = detail.rpd + detail.realization
-
-                    ws.cell(row=current_row, column=11+i, value=val).number_format = '#,##0'
-                    total_rpd += val
-
-            # Total Tahunan
-            ws.cell(row=current_row, column=23, value=total_rpd).number_format = '#,##0'
-
-            current_row += 1
-
-        output = io.BytesIO()
+        for row_type, values in rows:
+            ws.append([
+                self._styled_cell(ws, value, styles[(row_type, kind)])
+                for value, kind in zip(values, column_kinds)
+            ])
+
         wb.save(output)
-        output.seek(0)
-        return output
 
-export_service = ExportService()
\ No newline at end of file
+    def _pdf_row_styles(self) -> Dict[str, tuple]:
+        """
+        Style per tipe baris untuk PDF: (font, warna latar atau None, indent uraian).
+        Dibuat sekali per dokumen dan dipakai ulang untuk setiap baris.
+        """
+        styles = {}
+        for row_type in RowType:
+            c_hex = self.color_map.get(row_type)
+            bold = row_type not in [RowType.DETAIL, RowType.SUBCOMPONENT]
+            styles[row_type.value] = (
+                "Helvetica-Bold" if bold else "Helvetica",
+                HexColor("#" + c_hex[2:]) if c_hex else None,
+                self.indent_map.get(row_type, 0) * PDF_INDENT_STEP,
+            )
+        return styles
+
+    def _pdf_text(self, value, kind: str) -> str:
+        if value is None:
+            return ""
+        if kind == "number" and isinstance(value, (int, float)):
+            return f"{value:,.0f}"
+        return str(value)
+
+    def _pdf_wrap(self, text: str, font: str, width: float) -> List[str]:
+        """Pecah uraian menjadi beberapa baris; dipotong dengan elipsis bila terlalu panjang."""
+        lines = simpleSplit(text, font, PDF_FONT_SIZE, width) or [""]
+        if len(lines) > PDF_MAX_DESC_LINES:
+            lines = lines[:PDF_MAX_DESC_LINES]
+            lines[-1] = lines[-1].rstrip() + "\u2026"
+        return lines
+
+    def write_pdf_rows(self, rows: Iterable[tuple], output: BinaryIO, months: Sequence[int] = ALL_MONTHS) -> int:
+        """
+        Tulis dokumen PDF "Rincian Kertas Kerja" dari baris ringkas (lihat compact_docs);
+        `months` adalah bulan yang ada di baris tersebut.
+
+        Halaman disusun bertahap dari generator baris: setiap halaman diawali header
+        yang sama, lalu baris ditulis sampai halaman penuh dan halaman langsung
+        ditutup (showPage). Tidak ada flowable/Paragraph per baris dan style dibuat
+        sekali per tipe baris. ReportLab menyimpan stream isi halaman sampai save(),
+        jadi setiap PDF_SEGMENT_PAGES halaman canvas disimpan sebagai segmen dan
+        halamannya disalin ke `output` (PdfConcatenator); memori dibatasi oleh
+        ukuran satu segmen berapa pun jumlah barisnya.
+        Mengembalikan jumlah halaman.
+        """
+        page_width, page_height = PDF_PAGE_SIZE
+        col_widths = PDF_BASE_COL_WIDTHS + [PDF_MONTH_COL_WIDTH] * len(months) + [PDF_TOTAL_COL_WIDTH]
+        n_cols = len(col_widths)
+        col_x = [PDF_MARGIN]
+        for width in col_widths:
+            col_x.append(col_x[-1] + width)
+        table_width = col_x[-1] - PDF_MARGIN
+        bottom = PDF_MARGIN + 14  # ruang untuk nomor halaman
+        row_styles = self._pdf_row_styles()
+        kinds = self._column_kinds(months)
+        header_fill = HexColor("#1E3A8A")  # Blue 800
+        # Lebar teks angka banyak berulang (0, harga satuan yang sama, ...)
+        width_cache: Dict[tuple, float] = {}
+
+        document = PdfConcatenator(output, "Rincian Kertas Kerja")
+        segment = c = None
+        state = {"page": 0, "text": None, "top": 0.0, "y": 0.0}
+
+        def start_segment():
+            nonlocal c, segment
+            segment = io.BytesIO()
+            c = Canvas(segment, pagesize=PDF_PAGE_SIZE, pageCompression=1)
+
+        def finish_segment():
+            c.save()
+            document.add_segment(segment.getvalue())
+
+        def start_page():
+            state["page"] += 1
+            top = page_height - PDF_MARGIN
+            # State grafis direset oleh showPage; diatur di sini agar save() tidak
+            # menambah halaman kosong
+            c.setLineWidth(0.3)
+            c.setFillColor(black)
+            c.setFont("Helvetica-Bold", 10)
+            c.drawString(PDF_MARGIN, top - 10, "Rincian Kertas Kerja")
+            top -= 16
+
+            # Header dua tingkat: grup kolom, lalu sub-kolom
+            header_height = PDF_HEADER_BAND * 2
+            c.setFillColor(header_fill)
+            c.rect(PDF_MARGIN, top - header_height, table_width, header_height, stroke=0, fill=1)
+            c.setFillColor(white)
+            c.setFont("Helvetica-Bold", PDF_FONT_SIZE + 1)
+            groups = [(0, 1, "Kode"), (1, 2, "Uraian"), (2, 6, "Semula"), (6, 10, "Menjadi"),
+                      (10, n_cols, "Rencana Penarikan Dana (RPD) & Realisasi")]
+            for start, end, label in groups:
+                c.drawCentredString((col_x[start] + col_x[end]) / 2, top - PDF_HEADER_BAND + 3.5, label)
+            sub_headers = ["Vol", "Sat", "Harga", "Jumlah"] * 2 + [MONTH_NAMES[m] for m in months] + ["Total"]
+            for i, label in enumerate(sub_headers, start=2):
+                c.drawCentredString((col_x[i] + col_x[i + 1]) / 2, top - header_height + 3.5, label)
+
+            c.setStrokeColor(white)
+            c.line(col_x[2], top - PDF_HEADER_BAND, col_x[-1], top - PDF_HEADER_BAND)
+            for i in range(1, len(col_x) - 1):
+                if i in (1, 2, 6, 10):
+                    c.line(col_x[i], top, col_x[i], top - header_height)
+                elif i > 2:
+                    c.line(col_x[i], top - PDF_HEADER_BAND, col_x[i], top - header_height)
+            c.setStrokeColor(black)
+
+            state["top"] = top - header_height
+            state["y"] = state["top"]
+            # Teks baris dikumpulkan dalam satu text object per halaman (digambar di atas latar)
+            state["text"] = c.beginText()
+            state["text"].setFillColor(black)
+
+        def finish_page():
+            top, y = state["top"], state["y"]
+            c.drawText(state["text"])
+            # Garis kolom sekali per halaman, bukan kotak per sel
+            for x in col_x:
+                c.line(x, top, x, y)
+            c.line(PDF_MARGIN, top, col_x[-1], top)
+            c.setFillColor(black)
+            c.setFont("Helvetica", PDF_FONT_SIZE)
+            c.drawRightString(page_width - PDF_MARGIN, PDF_MARGIN, f"Halaman {state['page']}")
+            c.showPage()
+
+        start_segment()
+        start_page()
+        for row_type, values in rows:
+            font, fill, indent = row_styles[row_type]
+            desc_width = col_widths[1] - indent - 2 * PDF_CELL_PADDING
+            desc_lines = self._pdf_wrap(self._pdf_text(values[1], "desc"), font, desc_width)
+            height = len(desc_lines) * PDF_LINE_HEIGHT + 2 * PDF_CELL_PADDING
+
+            if state["y"] - height < bottom and state["y"] < state["top"]:
+                finish_page()
+                if state["page"] % PDF_SEGMENT_PAGES == 0:
+                    finish_segment()
+                    start_segment()
+                start_page()
+
+            y = state["y"]
+            if fill is not None:
+                c.setFillColor(fill)
+                c.rect(PDF_MARGIN, y - height, table_width, height, stroke=0, fill=1)
+            c.line(PDF_MARGIN, y - height, col_x[-1], y - height)
+
+            text = state["text"]
+            text.setFont(font, PDF_FONT_SIZE)
+            baseline = y - PDF_CELL_PADDING - PDF_FONT_SIZE
+            for i, (value, kind) in enumerate(zip(values, kinds)):
+                if kind == "desc":
+                    line_y = baseline
+                    for line in desc_lines:
+                        text.setTextOrigin(col_x[1] + PDF_CELL_PADDING + indent, line_y)
+                        text.textOut(line)
+                        line_y -= PDF_LINE_HEIGHT
+                    continue
+                label = self._pdf_text(value, kind)
+                if not label:
+                    continue
+                if kind == "number":
+                    width = width_cache.get((label, font))
+                    if width is None:
+                        if len(width_cache) > 10000:
+                            width_cache.clear()
+                        width = width_cache[(label, font)] = stringWidth(label, font, PDF_FONT_SIZE)
+                    x = col_x[i + 1] - PDF_CELL_PADDING - width
+                else:
+                    x = col_x[i] + PDF_CELL_PADDING
+                text.setTextOrigin(x, baseline)
+                text.textOut(label)
+
+            state["y"] = y - height
+
+        finish_page()
+        finish_segment()
+        document.close()
+        return state["page"]
+
+export_service = ExportService()
+
+
+# --- Entry point untuk worker proses (harus fungsi level modul agar bisa di-pickle) ---
+
+# Worker mencatat progress setiap sekian baris
+PROGRESS_STEP = 500
+
+
+def _write_progress(progress_path: str, count: int):
+    tmp_path = progress_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(count))
+    os.replace(tmp_path, progress_path)
+
+
+def _with_progress(rows: Iterable[tuple], progress_path: Optional[str]) -> Iterator[tuple]:
+    """Teruskan baris ke renderer sambil mencatat jumlah baris yang sudah dirender."""
+    if not progress_path:
+        yield from rows
+        return
+    count = 0
+    for row in rows:
+        yield row
+        count += 1
+        if count % PROGRESS_STEP == 0:
+            _write_progress(progress_path, count)
+    _write_progress(progress_path, count)
+
+
+def render_excel(
+    rows: List[tuple],
+    path: str,
+    progress_path: Optional[str] = None,
+    months: Sequence[int] = ALL_MONTHS
+):
+    """Render baris ringkas menjadi file .xlsx di `path` (dijalankan di export_pool)."""
+    with open(path, "wb") as output:
+        export_service.write_excel_rows(_with_progress(rows, progress_path), output, months)
+
+
+def render_pdf(
+    rows: List[tuple],
+    path: str,
+    progress_path: Optional[str] = None,
+    months: Sequence[int] = ALL_MONTHS
+):
+    """Render baris ringkas menjadi file .pdf di `path` (dijalankan di export_pool)."""
+    with open(path, "wb") as output:
+        export_service.write_pdf_rows(_with_progress(rows, progress_path), output, months)
+
+
+EXPORT_FORMATS = {
+    # format: (renderer, suffix, media type, nama file unduhan)
+    "excel": (
+        render_excel, ".xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "rincian_kertas_kerja.xlsx"
+    ),
+    "pdf": (render_pdf, ".pdf", "application/pdf", "rincian_kertas_kerja.pdf"),
+}
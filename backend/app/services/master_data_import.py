@@ -0,0 +1,152 @@
+import csv
+from itertools import chain
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Rows are validated and written this many at a time
+IMPORT_BATCH_SIZE = 1000
+# Per-row errors reported in total (further errors are only counted)
+MAX_REPORTED_ERRORS = 1000
+# The header may be preceded by title rows (DJA/SAKTI exports)
+HEADER_SCAN_ROWS = 20
+# Tried in this order on each candidate header line of a CSV
+CSV_DELIMITERS = (",", ";", "\t", "|")
+
+# Accepted header names per field (compared case-insensitively)
+COLUMN_ALIASES = {
+    "type": ("type", "tipe", "jenis", "level"),
+    "code": ("code", "kode", "kd"),
+    "desc": ("desc", "description", "deskripsi", "uraian", "nama", "nm"),
+}
+
+# (line number in the file, {"type", "code", "desc"})
+ImportRow = Tuple[int, Dict[str, str]]
+
+
+class ImportFormatError(ValueError):
+    """Upload that cannot be read as a master data table."""
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    # Spreadsheet codes typed as numbers come back as floats
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _decode_lines(file: BinaryIO) -> Iterator[str]:
+    """Text lines of an uploaded CSV: UTF-8 (with or without BOM), else Latin-1."""
+    first = True
+    for line in file:
+        if first:
+            line = line.removeprefix(b"\xef\xbb\xbf")
+            first = False
+        try:
+            yield line.decode("utf-8")
+        except UnicodeDecodeError:
+            yield line.decode("latin-1")
+
+
+def _header_delimiter(lines: Sequence[str]) -> str:
+    """
+    Delimiter that splits one of `lines` into a header row.
+    Title rows above the header (DJA/SAKTI exports) would mislead csv.Sniffer,
+    so each line is tried with every delimiter instead.
+    """
+    for line in lines:
+        for delimiter in CSV_DELIMITERS:
+            cells = next(csv.reader([line], delimiter=delimiter), [])
+            if _find_columns(cells) is not None:
+                return delimiter
+    return ","
+
+
+def _csv_rows(file: BinaryIO) -> Iterator[Tuple[int, Sequence[Any]]]:
+    lines = _decode_lines(file)
+    head = [line for _, line in zip(range(HEADER_SCAN_ROWS), lines)]
+    reader = csv.reader(chain(head, lines), delimiter=_header_delimiter(head))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _xlsx_rows(file: BinaryIO) -> Iterator[Tuple[int, Sequence[Any]]]:
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFormatError(f"Cannot read XLSX file: {e}")
+    try:
+        sheet = workbook.active
+        for line, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+            yield line, row
+    finally:
+        workbook.close()
+
+
+def _find_columns(cells: Sequence[Any]) -> Optional[Dict[str, int]]:
+    """Column index per field if `cells` is a header row (code and desc at least)."""
+    names = [_cell(cell).lower() for cell in cells]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for i, name in enumerate(names):
+            if name in aliases:
+                columns[field] = i
+                break
+    if "code" in columns and "desc" in columns:
+        return columns
+    return None
+
+
+def open_import(file: BinaryIO, filename: Optional[str], has_default_type: bool) -> Iterator[ImportRow]:
+    """
+    Rows of an uploaded CSV or XLSX master data table, read lazily.
+    The header row (code and desc columns, optionally type) is located here,
+    so a malformed upload raises ImportFormatError before anything is imported.
+    """
+    name = (filename or "").lower()
+    if name.endswith(".xlsx"):
+        rows = _xlsx_rows(file)
+    elif name.endswith((".csv", ".txt")):
+        rows = _csv_rows(file)
+    else:
+        raise ImportFormatError("Unsupported file type, expected .csv or .xlsx")
+
+    columns = None
+    for line, cells in rows:
+        columns = _find_columns(cells)
+        if columns is not None or line >= HEADER_SCAN_ROWS:
+            break
+    if columns is None:
+        rows.close()
+        raise ImportFormatError(
+            f"No header row with code and description columns in the first {HEADER_SCAN_ROWS} rows"
+        )
+    if "type" not in columns and not has_default_type:
+        rows.close()
+        raise ImportFormatError("The file has no type column; pass row_type")
+    return _data_rows(rows, columns)
+
+
+def _data_rows(rows: Iterator[Tuple[int, Sequence[Any]]], columns: Dict[str, int]) -> Iterator[ImportRow]:
+    try:
+        for line, cells in rows:
+            values = {
+                field: _cell(cells[i]) if i < len(cells) else ""
+                for field, i in columns.items()
+            }
+            if any(values.values()):
+                yield line, values
+    finally:
+        rows.close()
+
+
+def next_batch(rows: Iterator[ImportRow], size: int = IMPORT_BATCH_SIZE) -> List[ImportRow]:
+    """Up to `size` further rows (empty at the end)."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            break
+    return batch
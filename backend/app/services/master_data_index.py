@@ -0,0 +1,179 @@
+import re
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from app.models.schemas import MasterDataItem
+
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+")
+# Query tokens shorter than this are never matched fuzzily (too many neighbours)
+FUZZY_MIN_LENGTH = 4
+
+# Ranking: code matches always rank above description matches, which are
+# scored by the mean weight of how each query word matched
+WEIGHT_TOKEN_EXACT = 1.0
+WEIGHT_TOKEN_PREFIX = 0.75
+WEIGHT_TOKEN_FUZZY = 0.5
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def deletions(token: str) -> Set[str]:
+    """Variants of `token` with one character removed."""
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+class MasterDataSearchIndex:
+    """
+    Autocomplete index over the master data items of one type.
+
+    - codes: sorted (code, slot) list; a code prefix is one bisect plus a scan
+      that stops after `limit` hits, since code order is also the rank order
+      (and the tie-break for description matches).
+    - desc: token -> slots postings, with a sorted vocabulary so the token
+      being typed matches as a prefix.
+    - fuzzy: every token is also filed under its one-deletion variants; two
+      tokens sharing a variant are at most one typo apart (substitution,
+      insertion, deletion or adjacent transposition).
+
+    Items live in slots; add/remove keep every structure up to date, so
+    mutations never require a rebuild.
+    """
+
+    def __init__(self, items: Iterable[MasterDataItem] = ()):
+        self._items: List[Optional[MasterDataItem]] = []
+        self._slots: Dict[Tuple[str, str], List[int]] = {}
+        self._free: List[int] = []
+        self._codes: List[Tuple[str, int]] = []
+        self._postings: Dict[str, Set[int]] = {}
+        self._vocab: List[str] = []
+        self._variants: Dict[str, Set[str]] = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self._items) - len(self._free)
+
+    def add(self, item: MasterDataItem):
+        slot = self._free.pop() if self._free else len(self._items)
+        if slot == len(self._items):
+            self._items.append(item)
+        else:
+            self._items[slot] = item
+        self._slots.setdefault((item.code, item.desc), []).append(slot)
+        insort(self._codes, (item.code.lower(), slot))
+        for token in set(tokenize(item.desc)):
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                insort(self._vocab, token)
+                for variant in deletions(token) | {token}:
+                    self._variants.setdefault(variant, set()).add(token)
+            postings.add(slot)
+
+    def remove(self, code: str, desc: str) -> bool:
+        """Remove one item with this code and desc; False if there is none."""
+        slots = self._slots.get((code, desc))
+        if not slots:
+            return False
+        slot = slots.pop()
+        if not slots:
+            del self._slots[(code, desc)]
+        item = self._items[slot]
+        self._items[slot] = None
+        self._free.append(slot)
+
+        pos = bisect_left(self._codes, (item.code.lower(), slot))
+        del self._codes[pos]
+        for token in set(tokenize(item.desc)):
+            postings = self._postings[token]
+            postings.discard(slot)
+            if not postings:
+                del self._postings[token]
+                del self._vocab[bisect_left(self._vocab, token)]
+                for variant in deletions(token) | {token}:
+                    tokens = self._variants[variant]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._variants[variant]
+        return True
+
+    def _token_tiers(self, token: str, fuzzy: bool) -> List[Tuple[float, Set[int]]]:
+        """Slots whose description matches `token`: (weight, slots) per match kind, best first."""
+        exact = set(self._postings.get(token, ()))
+        prefixed = []
+        i = bisect_left(self._vocab, token)
+        while i < len(self._vocab) and self._vocab[i].startswith(token):
+            if self._vocab[i] != token:
+                prefixed.append(self._postings[self._vocab[i]])
+            i += 1
+        prefix = set().union(*prefixed) - exact
+        tiers = [(WEIGHT_TOKEN_EXACT, exact), (WEIGHT_TOKEN_PREFIX, prefix)]
+
+        if fuzzy and len(token) >= FUZZY_MIN_LENGTH:
+            similar: Set[str] = set()
+            for variant in deletions(token) | {token}:
+                similar |= self._variants.get(variant, set())
+            similar.discard(token)
+            near = set().union(*(self._postings[t] for t in similar)) - exact - prefix
+            tiers.append((WEIGHT_TOKEN_FUZZY, near))
+        return tiers
+
+    def _first_by_code(self, slots: Set[int], n: int) -> List[int]:
+        """Up to `n` of `slots` in code order."""
+        if len(slots) > 8 * n:
+            # Large sets: walk the sorted codes and stop early
+            found = []
+            for _, slot in self._codes:
+                if slot in slots:
+                    found.append(slot)
+                    if len(found) == n:
+                        break
+            return found
+        return sorted(slots, key=lambda slot: (self._items[slot].code.lower(), slot))[:n]
+
+    def search(self, q: str, limit: int = 20, fuzzy: bool = False) -> List[MasterDataItem]:
+        """
+        Items matching `q`, best first: exact code, code prefix, then items whose
+        description matches every query word (exact word, word prefix, or with
+        fuzzy one typo), ties broken by code. An empty query lists by code.
+        """
+        text = q.strip().lower()
+        if limit <= 0:
+            return []
+        if not text:
+            return [self._items[slot] for _, slot in self._codes[:limit]]
+
+        # Code prefix matches come first and are already in code order
+        # (an exact code sorts before its extensions)
+        found: List[int] = []
+        i = bisect_left(self._codes, (text, -1))
+        while i < len(self._codes) and len(found) < limit and self._codes[i][0].startswith(text):
+            found.append(self._codes[i][1])
+            i += 1
+
+        tokens = list(dict.fromkeys(tokenize(text)))
+        if len(found) < limit and tokens:
+            taken = set(found)
+            per_token = [self._token_tiers(token, fuzzy) for token in tokens]
+            if len(tokens) == 1:
+                tiers = per_token[0]
+            else:
+                # Every word must match; score = mean of the per-word weights
+                candidates = set.intersection(*(
+                    set().union(*(slots for _, slots in tiers)) for tiers in per_token
+                ))
+                weights = dict.fromkeys(candidates, 0.0)
+                for tiers in per_token:
+                    for weight, slots in tiers:
+                        for slot in slots & candidates:
+                            weights[slot] += weight
+                scored: Dict[float, Set[int]] = {}
+                for slot, weight in weights.items():
+                    scored.setdefault(weight / len(tokens), set()).add(slot)
+                tiers = sorted(scored.items(), reverse=True)
+            for _, slots in tiers:
+                if len(found) >= limit:
+                    break
+                found.extend(self._first_by_code(slots - taken, limit - len(found)))
+        return [self._items[slot] for slot in found]
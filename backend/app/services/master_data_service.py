@@ -1,18 +1,45 @@
-from typing import List, Dict, Optional
+import hashlib
+import json
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, Iterator, List, Dict, Optional, Tuple
 from bson import ObjectId
+from fastapi.concurrency import run_in_threadpool
+from pydantic import TypeAdapter, ValidationError
+from pymongo import DeleteMany, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from app.database import get_collection
 from app.models.schemas import (
     MasterDataItem,
     MasterDataCreate,
     MasterDataDocument,
+    MasterDataImportMode,
     MasterDataResponse,
     RowType,
 )
+from app.services.master_data_index import MasterDataSearchIndex
+from app.services.master_data_import import ImportRow, MAX_REPORTED_ERRORS, next_batch
+
+_import_adapter = TypeAdapter(List[MasterDataCreate])
+
+# Search index patch applied by a write: {type: index} of the indexes built so far
+SearchPatch = Callable[[Dict[str, MasterDataSearchIndex]], None]
 
 class MasterDataService:
     def __init__(self):
         self.collection_name = "master_data"
         self._indexes_initialized = False
+        # In-process cache: items partitioned by type (storage order), tagged
+        # with the data version it was built from. Every write goes through
+        # this service and bumps the version.
+        self._data_version = 0
+        self._cache: Optional[Dict[str, List[MasterDataItem]]] = None
+        self._cache_version = -1
+        # Serialized JSON bodies and their ETag, per type (None = all types)
+        self._bodies: Dict[Optional[str], Tuple[bytes, str]] = {}
+        # Autocomplete indexes per type, built lazily and patched by writes
+        # (not rebuilt) while they are in sync with the data version
+        self._search: Dict[str, MasterDataSearchIndex] = {}
+        self._search_version = 0
 
     def get_collection(self):
         return get_collection(self.collection_name)
@@ -51,32 +78,119 @@ class MasterDataService:
             # Log error tapi jangan hentikan aplikasi
             print(f"Warning: Failed to initialize indexes: {e}")
 
-    async def get_all(self) -> Dict[str, List[MasterDataItem]]:
+    @property
+    def data_version(self) -> int:
+        """Monotonically increasing version of the master data in this process."""
+        return self._data_version
+
+    def _invalidate(self, patch: Optional[SearchPatch] = None):
+        """
+        Mark master data as changed, dropping the cache. `patch` applies the
+        write to the search indexes; without it they are rebuilt on next use.
+        """
+        search_current = self._search_version == self._data_version
+        self._data_version += 1
+        self._cache = None
+        self._bodies = {}
+        if search_current and patch is not None:
+            patch(self._search)
+            self._search_version = self._data_version
+
+    @staticmethod
+    def _search_patch(
+        type_key: str,
+        added: List[MasterDataItem] = (),
+        removed: List[MasterDataItem] = ()
+    ) -> SearchPatch:
+        def patch(indexes: Dict[str, MasterDataSearchIndex]):
+            index = indexes.get(type_key)
+            if index is None:
+                return
+            for item in removed:
+                index.remove(item.code, item.desc)
+            for item in added:
+                index.add(item)
+        return patch
+
+    async def _search_index(self, type_key: str) -> MasterDataSearchIndex:
+        if self._search_version != self._data_version:
+            self._search = {}
+            self._search_version = self._data_version
+        index = self._search.get(type_key)
+        if index is not None:
+            return index
+
+        version = self._data_version
+        partitions = await self._load()
+        index = MasterDataSearchIndex(partitions.get(type_key, []))
+        if version == self._data_version == self._search_version:
+            self._search[type_key] = index
+        return index
+
+    async def search(
+        self,
+        row_type: RowType,
+        q: str,
+        limit: int = 20,
+        fuzzy: bool = False
+    ) -> List[MasterDataItem]:
+        """Autocomplete over code (prefix) and desc (words), see MasterDataSearchIndex."""
+        index = await self._search_index(row_type.value)
+        return index.search(q, limit, fuzzy)
+
+    async def _load(self) -> Dict[str, List[MasterDataItem]]:
+        """
+        All items partitioned by type, from cache while no write happened since
+        it was built. The returned lists are shared and must not be mutated.
+        """
+        if self._cache is not None and self._cache_version == self._data_version:
+            return self._cache
+
+        version = self._data_version
         collection = self.get_collection()
-        cursor = collection.find({})
-        items = await cursor.to_list(length=None)
-        
-        result = {}
-        for item in items:
-            type_key = item["type"]
-            if type_key not in result:
-                result[type_key] = []
-            result[type_key].append(MasterDataItem(
-                code=item["code"],
-                desc=item["desc"]
-            ))
-        
-        return result
+        cursor = collection.find({}, {"_id": 0, "type": 1, "code": 1, "desc": 1})
+        partitions: Dict[str, List[MasterDataItem]] = {}
+        async for doc in cursor:
+            partitions.setdefault(doc["type"], []).append(
+                MasterDataItem(code=doc["code"], desc=doc["desc"])
+            )
+
+        # Only cache if no write landed while the items were being loaded
+        if version == self._data_version:
+            self._cache = partitions
+            self._cache_version = version
+            self._bodies = {}
+        return partitions
+
+    async def get_all(self) -> Dict[str, List[MasterDataItem]]:
+        return dict(await self._load())
 
     async def get_by_type(self, row_type: RowType) -> List[MasterDataItem]:
-        collection = self.get_collection()
-        cursor = collection.find({"type": row_type.value})
-        items = await cursor.to_list(length=None)
-        
-        return [
-            MasterDataItem(code=item["code"], desc=item["desc"])
-            for item in items
-        ]
+        return list((await self._load()).get(row_type.value, []))
+
+    async def get_json(self, row_type: Optional[RowType] = None) -> Tuple[bytes, str]:
+        """
+        JSON body of get_all (or get_by_type) and its ETag, a hash of the body.
+        Serialized once per cache version, so repeat reads only send bytes.
+        """
+        version = self._data_version
+        partitions = await self._load()
+        key = row_type.value if row_type else None
+        cached = self._bodies.get(key)
+        if cached is not None and version == self._data_version:
+            return cached
+
+        def dump(items: List[MasterDataItem]) -> list:
+            return [{"code": item.code, "desc": item.desc} for item in items]
+
+        payload = dump(partitions.get(key, [])) if key else {
+            type_key: dump(items) for type_key, items in partitions.items()
+        }
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+        result = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+        if version == self._data_version and self._cache is partitions:
+            self._bodies[key] = result
+        return result
 
     async def create(self, data: MasterDataCreate) -> str:
         # Pastikan index sudah benar sebelum insert
@@ -90,7 +204,13 @@ class MasterDataService:
             "code": data.code,
             "desc": data.desc
         }
-        await collection.insert_one(doc)
+        try:
+            await collection.insert_one(doc)
+        except BaseException:
+            self._invalidate()
+            raise
+        item = MasterDataItem(code=data.code, desc=data.desc)
+        self._invalidate(self._search_patch(data.type.value, added=[item]))
         return doc_id
 
     async def delete(self, row_type: RowType, code: str, desc: Optional[str] = None) -> bool:
@@ -106,8 +226,12 @@ class MasterDataService:
         if desc:
             query["desc"] = desc
             
-        result = await collection.delete_one(query)
-        return result.deleted_count > 0
+        deleted = await collection.find_one_and_delete(query, {"code": 1, "desc": 1})
+        if not deleted:
+            return False
+        item = MasterDataItem(code=deleted["code"], desc=deleted["desc"])
+        self._invalidate(self._search_patch(row_type.value, removed=[item]))
+        return True
 
     async def update(
         self,
@@ -127,11 +251,21 @@ class MasterDataService:
         if current_desc:
             query["desc"] = current_desc
             
-        result = await collection.update_one(
+        before = await collection.find_one_and_update(
             query,
-            {"$set": {"desc": new_desc}}
+            {"$set": {"desc": new_desc}},
+            {"code": 1, "desc": 1},
+            return_document=ReturnDocument.BEFORE
         )
-        return result.modified_count > 0
+        # Deskripsi sama = tidak ada perubahan
+        if not before or before["desc"] == new_desc:
+            return False
+        self._invalidate(self._search_patch(
+            row_type.value,
+            added=[MasterDataItem(code=before["code"], desc=new_desc)],
+            removed=[MasterDataItem(code=before["code"], desc=before["desc"])]
+        ))
+        return True
 
     async def bulk_create(self, items: List[MasterDataCreate]) -> int:
         if not items:
@@ -149,33 +283,249 @@ class MasterDataService:
             }
             for item in items
         ]
-        result = await collection.insert_many(docs)
+        try:
+            result = await collection.insert_many(docs)
+        except BaseException:
+            self._invalidate()
+            raise
+
+        def patch(indexes: Dict[str, MasterDataSearchIndex]):
+            for item in items:
+                index = indexes.get(item.type.value)
+                if index is not None:
+                    index.add(MasterDataItem(code=item.code, desc=item.desc))
+
+        self._invalidate(patch)
         return len(result.inserted_ids)
 
-    async def sync_all(self, data: Dict[str, List[MasterDataItem]]) -> Dict[str, int]:
+    async def sync_all(self, data: Dict[str, List[MasterDataItem]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Make every type in `data` contain exactly its items (other types are untouched).
+        Stored and incoming entries are compared per type as sets of (code, desc)
+        and only the difference is written, in one unordered bulk_write:
+        - a code with one entry gone and one new entry is a desc change, updated in place;
+        - other new entries are upserted on (type, code, desc);
+        - other entries no longer present (and duplicates) are deleted by _id.
+        Existing _ids are kept. Returns {"counts": {type: items stored}, "changes":
+        {type: {"added", "removed", "updated", "unchanged"}}}; "counts" keeps the
+        shape this endpoint always returned.
+        """
         await self._ensure_indexes()
         
         collection = self.get_collection()
+        stored: Dict[str, Dict[Tuple[str, str], List[str]]] = {type_key: {} for type_key in data}
+        cursor = collection.find({"type": {"$in": list(data)}}, {"type": 1, "code": 1, "desc": 1})
+        async for doc in cursor:
+            stored[doc["type"]].setdefault((doc["code"], doc["desc"]), []).append(doc["_id"])
+
+        operations = []
+        delete_ids = []
         counts = {}
-        
+        changes = {}
+        added_items: Dict[str, List[MasterDataItem]] = {}
+        removed_items: Dict[str, List[MasterDataItem]] = {}
         for type_key, items in data.items():
-            await collection.delete_many({"type": type_key})
-            
-            if items:
-                docs = [
-                    {
-                        "_id": str(ObjectId()),
-                        "type": type_key,
-                        "code": item.code,
-                        "desc": item.desc
-                    }
-                    for item in items
-                ]
-                result = await collection.insert_many(docs)
-                counts[type_key] = len(result.inserted_ids)
+            entries = stored[type_key]
+            incoming = dict.fromkeys((item.code, item.desc) for item in items)
+            added = [key for key in incoming if key not in entries]
+            # (code, desc, _id) of stored entries to drop; extra copies of a kept entry are dropped too
+            removed = []
+            for (code, desc), ids in entries.items():
+                for doc_id in (ids[1:] if (code, desc) in incoming else ids):
+                    removed.append((code, desc, doc_id))
+
+            added_per_code = Counter(code for code, _ in added)
+            removed_per_code = Counter(code for code, _, _ in removed)
+            changed = {
+                code for code, n in added_per_code.items()
+                if n == 1 and removed_per_code.get(code) == 1
+            }
+            new_desc = {code: desc for code, desc in added if code in changed}
+
+            for code, desc, doc_id in removed:
+                if code in changed:
+                    operations.append(UpdateOne({"_id": doc_id}, {"$set": {"desc": new_desc[code]}}))
+                else:
+                    delete_ids.append(doc_id)
+            for code, desc in added:
+                if code not in changed:
+                    operations.append(UpdateOne(
+                        {"type": type_key, "code": code, "desc": desc},
+                        {"$setOnInsert": {"_id": str(ObjectId())}},
+                        upsert=True
+                    ))
+
+            added_items[type_key] = [MasterDataItem(code=code, desc=desc) for code, desc in added]
+            removed_items[type_key] = [MasterDataItem(code=code, desc=desc) for code, desc, _ in removed]
+            counts[type_key] = len(incoming)
+            changes[type_key] = {
+                "added": len(added) - len(changed),
+                "removed": len(removed) - len(changed),
+                "updated": len(changed),
+                "unchanged": len(incoming) - len(added),
+            }
+
+        result = {"counts": counts, "changes": changes}
+        if delete_ids:
+            operations.append(DeleteMany({"_id": {"$in": delete_ids}}))
+        if not operations:
+            return result
+        try:
+            await collection.bulk_write(operations, ordered=False)
+        except BaseException:
+            self._invalidate()
+            raise
+
+        def patch(indexes: Dict[str, MasterDataSearchIndex]):
+            for type_key in data:
+                index = indexes.get(type_key)
+                if index is None:
+                    continue
+                for item in removed_items[type_key]:
+                    index.remove(item.code, item.desc)
+                for item in added_items[type_key]:
+                    index.add(item)
+
+        self._invalidate(patch)
+        return result
+
+    def _validate_import(
+        self,
+        batch: List[ImportRow],
+        default_type: Optional[RowType]
+    ) -> Tuple[List[Tuple[int, MasterDataCreate]], List[dict]]:
+        """Validate one batch of imported rows: ([(line, item)], [{"line", "error"}])."""
+        errors = []
+        candidates = []
+        for line, values in batch:
+            row_type = values.get("type") or (default_type.value if default_type else "")
+            if not values["code"]:
+                errors.append({"line": line, "error": "code is empty"})
+            elif not values["desc"]:
+                errors.append({"line": line, "error": "desc is empty"})
             else:
-                counts[type_key] = 0
-        
-        return counts
+                candidates.append((line, {
+                    "type": row_type.upper(),
+                    "code": values["code"],
+                    "desc": values["desc"]
+                }))
+
+        # Satu validasi untuk seluruh batch; baris yang gagal dibuang lalu sisanya divalidasi ulang
+        try:
+            items = _import_adapter.validate_python([row for _, row in candidates])
+        except ValidationError as e:
+            invalid: Dict[int, str] = {}
+            for error in e.errors():
+                index, *field = error["loc"]
+                invalid.setdefault(index, f"{'.'.join(map(str, field))}: {error['msg']}")
+            errors.extend({"line": candidates[i][0], "error": msg} for i, msg in sorted(invalid.items()))
+            candidates = [row for i, row in enumerate(candidates) if i not in invalid]
+            items = _import_adapter.validate_python([row for _, row in candidates])
+        errors.sort(key=lambda error: error["line"])
+        return [(line, item) for (line, _), item in zip(candidates, items)], errors
+
+    async def _write_import(
+        self,
+        items: List[Tuple[int, MasterDataCreate]],
+        mode: MasterDataImportMode
+    ) -> Tuple[Dict[str, int], List[dict]]:
+        """Write one validated batch: (counts, [{"line", "error"}] of rows Mongo rejected)."""
+        collection = self.get_collection()
+        if mode == MasterDataImportMode.INSERT:
+            operations = [
+                {"_id": str(ObjectId()), "type": item.type.value, "code": item.code, "desc": item.desc}
+                for _, item in items
+            ]
+        else:
+            operations = []
+            for _, item in items:
+                new_id = {"_id": str(ObjectId())}
+                if item.type == RowType.COMPONENT:
+                    # Kode COMPONENT boleh kembar: entri diidentifikasi oleh (code, desc)
+                    operations.append(UpdateOne(
+                        {"type": item.type.value, "code": item.code, "desc": item.desc},
+                        {"$setOnInsert": new_id},
+                        upsert=True
+                    ))
+                else:
+                    operations.append(UpdateOne(
+                        {"type": item.type.value, "code": item.code},
+                        {"$set": {"desc": item.desc}, "$setOnInsert": new_id},
+                        upsert=True
+                    ))
+
+        try:
+            if mode == MasterDataImportMode.INSERT:
+                result = await collection.insert_many(operations, ordered=False)
+                details = {"nInserted": len(result.inserted_ids)}
+            else:
+                result = await collection.bulk_write(operations, ordered=False)
+                details = result.bulk_api_result
+            write_errors = []
+        except BulkWriteError as e:
+            details = e.details
+            write_errors = details.get("writeErrors", [])
+        finally:
+            self._invalidate()
+
+        errors = [
+            {
+                "line": items[error["index"]][0],
+                "error": "duplicate code" if error.get("code") == 11000 else error.get("errmsg", "write failed")
+            }
+            for error in write_errors
+        ]
+        matched = details.get("nMatched", 0)
+        modified = details.get("nModified", 0)
+        counts = {
+            "inserted": details.get("nInserted", 0) + details.get("nUpserted", 0),
+            "updated": modified,
+            "unchanged": matched - modified,
+        }
+        return counts, errors
+
+    async def import_rows(
+        self,
+        rows: Iterator[ImportRow],
+        default_type: Optional[RowType] = None,
+        mode: MasterDataImportMode = MasterDataImportMode.UPSERT
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Import rows read by master_data_import.open_import, one batch at a time:
+        read, validate, write, then yield progress {"processed", "inserted",
+        "updated", "unchanged", "failed", "errors"} (errors of that batch as
+        {"line", "error"}, at most MAX_REPORTED_ERRORS overall). Ends with the
+        totals and "done": True, plus "error" if the import stopped early.
+        Only the current batch is held in memory.
+        """
+        await self._ensure_indexes()
+        totals = {"processed": 0, "inserted": 0, "updated": 0, "unchanged": 0, "failed": 0}
+        reported = 0
+        try:
+            while True:
+                batch = await run_in_threadpool(next_batch, rows)
+                if not batch:
+                    break
+                items, errors = await run_in_threadpool(self._validate_import, batch, default_type)
+                if items:
+                    counts, write_errors = await self._write_import(items, mode)
+                    for key, value in counts.items():
+                        totals[key] += value
+                    errors = sorted(errors + write_errors, key=lambda error: error["line"])
+                totals["processed"] += len(batch)
+                totals["failed"] += len(errors)
+
+                errors = errors[:max(MAX_REPORTED_ERRORS - reported, 0)]
+                reported += len(errors)
+                yield {**totals, "errors": errors}
+        except Exception as e:
+            yield {**totals, "done": True, "error": str(e)}
+            return
+        finally:
+            close = getattr(rows, "close", None)
+            if close:
+                close()
+        yield {**totals, "done": True}
+
 
 master_data_service = MasterDataService()
\ No newline at end of file
@@ -0,0 +1,156 @@
+import gzip
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Tuple
+import bson
+from bson import Binary, ObjectId
+from pymongo import ASCENDING
+from fastapi.concurrency import run_in_threadpool
+from app.config import get_settings
+from app.database import get_collection
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is used instead
+    zstandard = None
+
+settings = get_settings()
+
+COMPRESSION_NONE = "none"
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    if compression == COMPRESSION_ZSTD:
+        return zstandard.ZstdCompressor().compress(data)
+    if compression == COMPRESSION_GZIP:
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    return data
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Revision chunk is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if compression == COMPRESSION_GZIP:
+        return gzip.decompress(data)
+    return data
+
+
+def iter_batches(items: Iterable[dict], max_bytes: int) -> Iterator[Tuple[bytes, int]]:
+    """
+    BSON-encode `items` back to back in batches of at most `max_bytes`
+    (a single larger item gets a batch of its own). Yields (raw bytes, item count).
+    """
+    parts: List[bytes] = []
+    size = 0
+    for item in items:
+        encoded = bson.encode(item)
+        if parts and size + len(encoded) > max_bytes:
+            yield b"".join(parts), len(parts)
+            parts, size = [], 0
+        parts.append(encoded)
+        size += len(encoded)
+    if parts:
+        yield b"".join(parts), len(parts)
+
+
+class RevisionChunkStore:
+    """
+    Split storage for large revision payloads (keyframe rows, delta upserts,
+    legacy snapshot trees), so a revision never hits the 16MB document limit.
+
+    Items are BSON-encoded back to back, cut into chunks of about `chunk_bytes`
+    and compressed (gzip, or zstd when the zstandard package is installed).
+    Each chunk is one document in `revision_chunks`; the revision keeps only a
+    marker {"field", "id", "chunks", "count", "compression"}. Payloads up to
+    `inline_bytes` stay inline in the revision document as before.
+    """
+
+    def __init__(self, chunk_bytes: int, inline_bytes: int, compression: str):
+        self.collection_name = "revision_chunks"
+        self.chunk_bytes = chunk_bytes
+        self.inline_bytes = min(inline_bytes, chunk_bytes)
+        if compression == COMPRESSION_ZSTD and zstandard is None:
+            print("Warning: zstandard is not installed, revision chunks use gzip")
+            compression = COMPRESSION_GZIP
+        if compression not in (COMPRESSION_NONE, COMPRESSION_GZIP, COMPRESSION_ZSTD):
+            compression = COMPRESSION_GZIP
+        self.compression = compression
+        self._indexes_initialized = False
+
+    def get_collection(self):
+        return get_collection(self.collection_name)
+
+    async def _ensure_indexes(self):
+        if self._indexes_initialized:
+            return
+        collection = self.get_collection()
+        try:
+            await collection.create_index(
+                [("payload_id", ASCENDING), ("seq", ASCENDING)],
+                unique=True,
+                name="payload_id_1_seq_1"
+            )
+            self._indexes_initialized = True
+        except Exception as e:
+            print(f"Warning: Failed to initialize revision chunk indexes: {e}")
+
+    async def write(self, field: str, items: List[dict]) -> Optional[dict]:
+        """
+        Store `items` in chunks if they are too large to stay inline.
+        Returns the marker to keep in the revision, or None when `items` fit inline.
+        """
+        batches = iter_batches(items, self.chunk_bytes)
+        pending = [await run_in_threadpool(next, batches, None) for _ in range(2)]
+        if pending[0] is None or (pending[1] is None and len(pending[0][0]) <= self.inline_bytes):
+            return None
+
+        await self._ensure_indexes()
+        collection = self.get_collection()
+        marker = {
+            "field": field,
+            "id": ObjectId(),
+            "chunks": 0,
+            "count": 0,
+            "compression": self.compression,
+        }
+        try:
+            while True:
+                batch = pending.pop(0) if pending else await run_in_threadpool(next, batches, None)
+                if batch is None:
+                    break
+                raw, count = batch
+                data = await run_in_threadpool(compress, raw, self.compression)
+                await collection.insert_one({
+                    "payload_id": marker["id"],
+                    "seq": marker["chunks"],
+                    "count": count,
+                    "data": Binary(data),
+                })
+                marker["chunks"] += 1
+                marker["count"] += count
+        except BaseException:
+            await self.delete(marker)
+            raise
+        return marker
+
+    async def read(self, marker: dict) -> AsyncIterator[dict]:
+        """Items of a chunked payload in order, decoding one chunk at a time."""
+        collection = self.get_collection()
+        cursor = collection.find({"payload_id": marker["id"]}).sort("seq", ASCENDING)
+        async for chunk in cursor:
+            raw = await run_in_threadpool(decompress, bytes(chunk["data"]), marker["compression"])
+            for item in await run_in_threadpool(bson.decode_all, raw):
+                yield item
+
+    async def delete(self, marker: Optional[dict]):
+        if marker:
+            await self.get_collection().delete_many({"payload_id": marker["id"]})
+
+
+revision_chunks = RevisionChunkStore(
+    settings.revision_chunk_bytes,
+    settings.revision_inline_bytes,
+    settings.revision_compression,
+)
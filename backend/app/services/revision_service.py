@@ -1,55 +1,815 @@
-from typing import List, Optional
+import base64
+import json
+from bisect import bisect_left
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
 from bson import ObjectId
 from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import DuplicateKeyError
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
 from app.database import get_collection
-from app.models.schemas import RevisionCreate, RevisionResponse, RevisionDetailResponse
+from app.models.schemas import BudgetRowResponse, RevisionCreate, RevisionResponse, RevisionDetailResponse
+from app.services.budget_service import budget_service
+from app.services.revision_chunks import revision_chunks
+
+# Revisions are stored as keyframes (all rows) followed by deltas against the
+# previous revision. A new keyframe starts every KEYFRAME_INTERVAL revisions,
+# or earlier when a delta would touch more than KEYFRAME_CHANGE_RATIO of the rows,
+# so reconstruction never replays more than KEYFRAME_INTERVAL - 1 deltas.
+KEYFRAME_INTERVAL = 10
+KEYFRAME_CHANGE_RATIO = 0.5
+# Attempts when a concurrent snapshot took the same chain position
+CREATE_RETRIES = 5
+
+KIND_KEYFRAME = "keyframe"
+KIND_DELTA = "delta"
+# List fields that may be moved to revision_chunks (marker kept under "payload")
+PAYLOAD_FIELDS = ("rows", "upserts", "data")
+
+# Rows keyed by id: {id: row without children, plus parent_id and order}
+RowMap = Dict[str, dict]
+
+# Revision history listing (keyset pagination on timestamp, _id)
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 1000
+
+# Pseudo revision id for the current budget data in diffs
+LIVE_REVISION = "live"
+POSITION_FIELDS = ("parent_id", "order")
+DIFF_OPS = ("added", "removed", "moved", "changed")
+
+
+class RevisionNotDiffable(Exception):
+    """Legacy revision whose rows have no unique ids."""
+
+
+def flatten_snapshot(data: List[dict]) -> Optional[RowMap]:
+    """
+    Flatten a snapshot tree into rows keyed by row id.
+    Returns None if ids are missing or duplicated (such a snapshot cannot be delta-encoded).
+    """
+    rows: RowMap = {}
+    stack = [(None, order, node) for order, node in reversed(list(enumerate(data)))]
+    while stack:
+        parent_id, order, node = stack.pop()
+        row_id = node.get("id")
+        if not row_id or row_id in rows:
+            return None
+        row = {k: v for k, v in node.items() if k != "children"}
+        row["parent_id"] = parent_id
+        row["order"] = order
+        rows[row_id] = row
+        children = node.get("children") or []
+        stack.extend((row_id, i, child) for i, child in reversed(list(enumerate(children))))
+    return rows
+
+
+def flatten_models(tree: List[BudgetRowResponse]) -> RowMap:
+    """
+    Same as flatten_snapshot, straight from response models (e.g. the cached
+    budget tree): every node is serialized once and never re-validated.
+    """
+    rows: RowMap = {}
+    stack = [(None, order, node) for order, node in reversed(list(enumerate(tree)))]
+    while stack:
+        parent_id, order, node = stack.pop()
+        row = node.model_dump(exclude={"children"})
+        row["parent_id"] = parent_id
+        row["order"] = order
+        rows[node.id] = row
+        stack.extend((node.id, i, child) for i, child in reversed(list(enumerate(node.children))))
+    return rows
+
+
+def build_snapshot_tree(rows: RowMap) -> List[dict]:
+    """Rebuild the snapshot tree from rows keyed by id (inverse of flatten_snapshot)."""
+    children_map: Dict[Optional[str], List[dict]] = {}
+    for row in rows.values():
+        children_map.setdefault(row.get("parent_id"), []).append(row)
+
+    nodes: Dict[str, dict] = {}
+    for row_id, row in rows.items():
+        nodes[row_id] = {k: v for k, v in row.items() if k not in ("parent_id", "order")}
+    for parent_id, siblings in children_map.items():
+        siblings.sort(key=lambda r: r.get("order", 0))
+        if parent_id is not None and parent_id in nodes:
+            nodes[parent_id]["children"] = [nodes[r["id"]] for r in siblings]
+    for node in nodes.values():
+        node.setdefault("children", [])
+    return [nodes[r["id"]] for r in children_map.get(None, [])]
+
+
+def iter_tree_json(rows: RowMap, batch_size: int = 256) -> Iterator[str]:
+    """
+    JSON array of the snapshot tree (same nodes as build_snapshot_tree), produced
+    in pieces of `batch_size` rows so the nested tree is never built in memory.
+    """
+    children_map: Dict[Optional[str], List[dict]] = {}
+    for row in rows.values():
+        children_map.setdefault(row.get("parent_id"), []).append(row)
+    for siblings in children_map.values():
+        siblings.sort(key=lambda r: r.get("order", 0))
+
+    parts = ["["]
+    stack = [iter(children_map.get(None, []))]
+    first = [True]
+    while stack:
+        row = next(stack[-1], None)
+        if row is None:
+            stack.pop()
+            first.pop()
+            parts.append("]}" if stack else "]")
+            continue
+        if not first[-1]:
+            parts.append(",")
+        first[-1] = False
+        fields = {k: v for k, v in row.items() if k not in POSITION_FIELDS}
+        parts.append(json.dumps(fields, default=str)[:-1] + ', "children": [')
+        stack.append(iter(children_map.get(row["id"], [])))
+        first.append(True)
+        if len(parts) >= batch_size:
+            yield "".join(parts)
+            parts = []
+    yield "".join(parts)
+
+
+class PreorderTreeJson:
+    """
+    The JSON of iter_tree_json, built row by row from rows in tree pre-order
+    (every row right after its parent's earlier descendants, siblings by order),
+    which is how flatten_snapshot and flatten_models emit them. Only the path
+    of open ancestors is kept, so rows can be fed straight from revision_chunks.
+    step() and feed() raise ValueError for a row out of pre-order.
+    """
+
+    def __init__(self):
+        self.path: List[str] = []
+        # Order of the last row seen per level of `path` (index 0: roots)
+        self.orders: List[Any] = [None]
+        self.started = False
+
+    def step(self, row: dict) -> int:
+        """Check `row` and make it the current node; returns how many open rows it closes."""
+        parent_id = row.get("parent_id")
+        depth = len(self.path)
+        while self.path and self.path[-1] != parent_id:
+            self.path.pop()
+        if parent_id is not None and not self.path:
+            raise ValueError(f"Row {row.get('id')} comes before or apart from its parent")
+        del self.orders[len(self.path) + 1:]
+        order = row.get("order", 0)
+        if self.orders[-1] is not None and order < self.orders[-1]:
+            raise ValueError(f"Row {row.get('id')} comes after a later sibling")
+        self.orders[-1] = order
+        closed = depth - len(self.path)
+        self.path.append(row["id"])
+        self.orders.append(None)
+        return closed
+
+    def feed(self, row: dict) -> str:
+        """JSON text for `row`, its children list left open."""
+        closed = self.step(row)
+        prefix = "]}" * closed + "," if closed else ("" if self.started else "[")
+        self.started = True
+        fields = {k: v for k, v in row.items() if k not in POSITION_FIELDS}
+        return prefix + json.dumps(fields, default=str)[:-1] + ', "children": ['
+
+    def close(self) -> str:
+        return ("]}" * len(self.path) + "]") if self.started else "[]"
+
+
+def rows_in_preorder(rows: Iterable[dict]) -> bool:
+    """Whether `rows` are in tree pre-order, i.e. can be fed to PreorderTreeJson."""
+    tree = PreorderTreeJson()
+    try:
+        for row in rows:
+            tree.step(row)
+    except ValueError:
+        return False
+    return True
+
+
+def diff_rows(previous: RowMap, current: RowMap) -> Tuple[List[dict], List[str]]:
+    """Row-level delta from `previous` to `current`: (added or changed rows, removed ids)."""
+    upserts = [row for row_id, row in current.items() if previous.get(row_id) != row]
+    removed = [row_id for row_id in previous if row_id not in current]
+    return upserts, removed
+
+
+def apply_delta(rows: RowMap, upserts: List[dict], removed: List[str]):
+    """Apply a delta in place."""
+    for row_id in removed:
+        rows.pop(row_id, None)
+    for row in upserts:
+        rows[row["id"]] = row
+
+
+def compose_deltas(first: dict, second: dict) -> Tuple[List[dict], List[str]]:
+    """Single delta equivalent to applying `first` then `second`."""
+    upserts = {row["id"]: row for row in first.get("upserts", [])}
+    removed = set(first.get("removed", []))
+    for row_id in second.get("removed", []):
+        upserts.pop(row_id, None)
+        removed.add(row_id)
+    for row in second.get("upserts", []):
+        upserts[row["id"]] = row
+        removed.discard(row["id"])
+    return list(upserts.values()), sorted(removed)
+
+
+def can_extend_chain(latest: Optional[dict]) -> bool:
+    """Whether the next revision may be stored as a delta on top of `latest`."""
+    return bool(
+        latest and latest.get("kind")
+        and latest["sequence"] % KEYFRAME_INTERVAL != KEYFRAME_INTERVAL - 1
+    )
+
+
+def encode_revision(rows: RowMap, latest: Optional[dict], previous: Optional[RowMap]) -> dict:
+    """
+    Storage fields of a new revision: a delta against `latest` (whose rows are
+    `previous`) when that is small enough, otherwise a keyframe starting a new chain.
+    "preorder" marks a revision whose rows can be streamed in tree pre-order
+    from its keyframe (see RevisionService.stream_revision): a keyframe stored
+    in pre-order, or a delta on such a revision that only changes rows in place
+    (no new rows, no parent/order changes).
+    """
+    if previous is not None:
+        upserts, removed = diff_rows(previous, rows)
+        if len(upserts) + len(removed) <= KEYFRAME_CHANGE_RATIO * max(len(rows), 1):
+            in_place = all(
+                row["id"] in previous
+                and all(previous[row["id"]].get(f) == row.get(f) for f in POSITION_FIELDS)
+                for row in upserts
+            )
+            return {
+                "kind": KIND_DELTA,
+                "chain_id": latest["chain_id"],
+                "sequence": latest["sequence"] + 1,
+                "upserts": upserts,
+                "removed": removed,
+                "preorder": bool(latest.get("preorder")) and in_place,
+            }
+    return {
+        "kind": KIND_KEYFRAME,
+        "chain_id": ObjectId(),
+        "sequence": 0,
+        "rows": list(rows.values()),
+        "preorder": rows_in_preorder(rows.values()),
+    }
+
+
+def replay_chain(chain: List[dict]) -> RowMap:
+    """Rows after replaying a chain (ordered by sequence) from its last keyframe."""
+    start = max(i for i, link in enumerate(chain) if link["kind"] == KIND_KEYFRAME)
+    rows = {row["id"]: row for row in chain[start]["rows"]}
+    for link in chain[start + 1:]:
+        apply_delta(rows, link["upserts"], link["removed"])
+    return rows
+
+
+def field_changes(old: dict, new: dict, prefix: str = "") -> Dict[str, dict]:
+    """
+    Changed fields between two versions of a row as {path: {"from", "to"}}.
+    Nested objects (semula, monthlyAllocation, ...) are compared per key,
+    e.g. "menjadi.volume" or "monthlyAllocation.3.rpd".
+    """
+    changes = {}
+    for key in [*old, *(k for k in new if k not in old)]:
+        if not prefix and key in POSITION_FIELDS:
+            continue
+        before, after = old.get(key), new.get(key)
+        if before == after:
+            continue
+        path = f"{prefix}{key}"
+        if isinstance(before, dict) and isinstance(after, dict):
+            changes.update(field_changes(before, after, path + "."))
+        else:
+            changes[path] = {"from": before, "to": after}
+    return changes
+
+
+def _reordered(siblings: List[Tuple[Any, Any, str]]) -> List[str]:
+    """
+    Ids among (new order, old order, id) siblings that changed position.
+    Rows on the longest run keeping their old relative order stay put, so a
+    single insert or move reports one row instead of every shifted sibling.
+    """
+    siblings.sort(key=lambda s: s[0])
+    tails: List[Any] = []
+    tail_index: List[int] = []
+    previous = [-1] * len(siblings)
+    for i, (_, old_order, _) in enumerate(siblings):
+        pos = bisect_left(tails, old_order)
+        if pos == len(tails):
+            tails.append(old_order)
+            tail_index.append(i)
+        else:
+            tails[pos] = old_order
+            tail_index[pos] = i
+        previous[i] = tail_index[pos - 1] if pos else -1
+
+    kept = set()
+    i = tail_index[-1] if tail_index else -1
+    while i >= 0:
+        kept.add(i)
+        i = previous[i]
+    return [s[2] for i, s in enumerate(siblings) if i not in kept]
+
+
+def moved_rows(old: RowMap, new: RowMap) -> set:
+    """Ids present in both versions that changed parent or relative sibling order."""
+    moved = set()
+    groups: Dict[Optional[str], List[Tuple[Any, Any, str]]] = {}
+    for row_id, row in new.items():
+        before = old.get(row_id)
+        if before is None:
+            continue
+        if before.get("parent_id") != row.get("parent_id"):
+            moved.add(row_id)
+        else:
+            groups.setdefault(row.get("parent_id"), []).append(
+                (row.get("order", 0), before.get("order", 0), row_id)
+            )
+    for siblings in groups.values():
+        moved.update(_reordered(siblings))
+    return moved
+
+
+def iter_diff(old: RowMap, new: RowMap) -> Iterator[dict]:
+    """
+    Row differences from `old` to `new`, one entry per operation:
+    removed rows first, then added / moved / changed in `new` order. A row that
+    was moved and edited yields both a "moved" and a "changed" entry.
+    Linear in the number of rows (rows are matched by id; moves add a log factor per sibling group).
+    """
+    for row_id, row in old.items():
+        if row_id not in new:
+            yield {"op": "removed", "id": row_id, "row": row}
+
+    moved = moved_rows(old, new)
+    for row_id, row in new.items():
+        before = old.get(row_id)
+        if before is None:
+            yield {"op": "added", "id": row_id, "row": row}
+            continue
+        if row_id in moved:
+            yield {
+                "op": "moved",
+                "id": row_id,
+                "from": {f: before.get(f) for f in POSITION_FIELDS},
+                "to": {f: row.get(f) for f in POSITION_FIELDS},
+            }
+        if before != row:
+            changes = field_changes(before, row)
+            if changes:
+                yield {"op": "changed", "id": row_id, "code": row.get("code"), "changes": changes}
+
+
+def diff_snapshots(old: RowMap, new: RowMap) -> Dict[str, Any]:
+    """iter_diff grouped by operation, with counts in "summary"."""
+    result: Dict[str, Any] = {op: [] for op in DIFF_OPS}
+    for entry in iter_diff(old, new):
+        result[entry.pop("op")].append(entry)
+    result["summary"] = {op: len(result[op]) for op in DIFF_OPS}
+    return result
+
+
+def iter_diff_lines(old: RowMap, new: RowMap) -> Iterator[str]:
+    """iter_diff as NDJSON lines, closed by a {"op": "summary"} line with the counts."""
+    counts = dict.fromkeys(DIFF_OPS, 0)
+    for entry in iter_diff(old, new):
+        counts[entry["op"]] += 1
+        yield json.dumps(entry, default=str) + "\n"
+    yield json.dumps({"op": "summary", **counts}) + "\n"
+
+
+def encode_cursor(timestamp: datetime, rev_id: ObjectId) -> str:
+    """Opaque history cursor pointing just after the revision (timestamp, _id)."""
+    raw = f"{timestamp.isoformat()}|{rev_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, rev_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(rev_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def history_query(
+    cursor: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    q: Optional[str] = None
+) -> dict:
+    """
+    Filter of one history page, newest first: timestamp in [date_from, date_to),
+    note matching the words in `q` (text index) and after `cursor`.
+    """
+    query: Dict[str, Any] = {}
+    timestamp: Dict[str, datetime] = {}
+    if date_from:
+        timestamp["$gte"] = date_from
+    if date_to:
+        timestamp["$lt"] = date_to
+    if timestamp:
+        query["timestamp"] = timestamp
+    if q and q.strip():
+        query["$text"] = {"$search": q.strip()}
+    if cursor:
+        after_timestamp, after_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"timestamp": {"$lt": after_timestamp}},
+            {"timestamp": after_timestamp, "_id": {"$lt": after_id}},
+        ]
+    return query
+
 
 class RevisionService:
     def __init__(self):
         self.collection_name = "revisions"
+        self._indexes_initialized = False
+        # Rows of the most recent revision, reused as the base of the next delta
+        self._latest: Optional[Tuple[Any, RowMap]] = None
 
     def get_collection(self):
         return get_collection(self.collection_name)
 
+    async def ensure_indexes(self):
+        """
+        Index untuk membaca satu rantai keyframe + delta secara berurutan, dan untuk
+        daftar riwayat (urut timestamp, _id; pencarian teks pada note).
+        Dipanggil saat startup; juga lazy sebelum menulis revisi.
+        """
+        if self._indexes_initialized:
+            return
+        collection = self.get_collection()
+        try:
+            await collection.create_index(
+                [("timestamp", DESCENDING), ("_id", DESCENDING)],
+                name="timestamp_-1__id_-1"
+            )
+            # Catatan revisi berbahasa Indonesia: tanpa stemming bahasa Inggris
+            await collection.create_index(
+                [("note", TEXT)],
+                default_language="none",
+                name="note_text"
+            )
+            # Unik: dua snapshot bersamaan tidak boleh menjadi delta dari revisi yang sama
+            await collection.create_index(
+                [("chain_id", ASCENDING), ("sequence", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"chain_id": {"$exists": True}},
+                name="chain_id_1_sequence_1"
+            )
+            self._indexes_initialized = True
+        except Exception as e:
+            print(f"Warning: Failed to initialize revision indexes: {e}")
+
+    async def _load_rows(self, doc: dict) -> Optional[RowMap]:
+        """
+        Reconstruct the rows of a revision document: read its chain up to the
+        revision in one query and replay the deltas after the nearest keyframe.
+        Returns None for legacy revisions stored as a full tree.
+        """
+        kind = doc.get("kind")
+        if kind is None:
+            return None
+        if kind == KIND_KEYFRAME:
+            return {row["id"]: row for row in await self._payload(doc, "rows")}
+
+        collection = self.get_collection()
+        cursor = collection.find(
+            {"chain_id": doc["chain_id"], "sequence": {"$lte": doc["sequence"]}},
+            {"note": 0, "timestamp": 0}
+        ).sort("sequence", ASCENDING)
+        chain = await cursor.to_list(length=None)
+        for link in chain:
+            await self._inline_payload(link)
+        return replay_chain(chain)
+
+    async def _payload(self, doc: dict, field: str) -> List[Any]:
+        """A payload field of a revision, read back from revision_chunks if it was split off."""
+        if field in doc:
+            return doc[field]
+        marker = doc.get("payload")
+        if marker and marker["field"] == field:
+            return [item async for item in revision_chunks.read(marker)]
+        return []
+
+    async def _inline_payload(self, doc: dict):
+        """Put a chunked payload back into `doc` under its field."""
+        marker = doc.pop("payload", None)
+        if marker:
+            doc[marker["field"]] = await self._payload({"payload": marker}, marker["field"])
+
+    async def _offload_payload(self, doc: dict):
+        """Move a payload field of `doc` too large to stay inline to revision_chunks."""
+        for field in PAYLOAD_FIELDS:
+            if field in doc:
+                marker = await revision_chunks.write(field, doc[field])
+                if marker:
+                    del doc[field]
+                    doc["payload"] = marker
+
+    async def _latest_revision(self) -> Optional[dict]:
+        collection = self.get_collection()
+        return await collection.find_one(
+            {}, {"kind": 1, "chain_id": 1, "sequence": 1, "preorder": 1}, sort=[("_id", DESCENDING)]
+        )
+
     async def create_revision(self, note: str, data: List[dict]) -> str:
+        """
+        Save a snapshot. Stored as a delta (rows added/changed and ids removed)
+        against the previous revision, or as a keyframe when a new chain starts.
+        """
+        await self.ensure_indexes()
         collection = self.get_collection()
         doc = {
             "note": note,
             "timestamp": datetime.now(),
-            "data": data # Simpan full JSON tree
         }
-        result = await collection.insert_one(doc)
+
+        rows = flatten_snapshot(data)
+        if rows is None:
+            # Snapshot without unique row ids: keep the full tree
+            doc["data"] = data
+            await self._offload_payload(doc)
+            try:
+                result = await collection.insert_one(doc)
+            except BaseException:
+                await revision_chunks.delete(doc.get("payload"))
+                raise
+            self._latest = None
+            return str(result.inserted_id)
+        return await self._store(doc, rows)
+
+    async def create_snapshot(self, note: str) -> Dict[str, Any]:
+        """
+        Save the current budget_rows as a revision without a client upload.
+        Rows come from budget_service's cached tree (built once if needed) in a
+        single walk off the event loop; cache patches replace nodes rather than
+        mutate them, so the walk sees one consistent tree.
+        Returns {"id": ..., "rows": row count}.
+        """
+        await self.ensure_indexes()
+        tree = await budget_service.get_all_rows()
+        rows = await run_in_threadpool(flatten_models, tree)
+        doc = {
+            "note": note,
+            "timestamp": datetime.now(),
+        }
+        rev_id = await self._store(doc, rows)
+        return {"id": rev_id, "rows": len(rows)}
+
+    async def _store(self, doc: dict, rows: RowMap) -> str:
+        """Insert a revision for `rows` as a delta or keyframe (see _encode)."""
+        collection = self.get_collection()
+        for attempt in range(CREATE_RETRIES):
+            doc.pop("_id", None)
+            await self._encode(doc, rows, await self._latest_revision())
+            await self._offload_payload(doc)
+            try:
+                result = await collection.insert_one(doc)
+                break
+            except DuplicateKeyError:
+                # Another snapshot was saved meanwhile; diff against that one instead
+                await revision_chunks.delete(doc.get("payload"))
+                if attempt == CREATE_RETRIES - 1:
+                    raise
+            except BaseException:
+                await revision_chunks.delete(doc.get("payload"))
+                raise
+        self._latest = (result.inserted_id, rows)
         return str(result.inserted_id)
 
-    async def get_all_revisions(self) -> List[RevisionResponse]:
+    async def _encode(self, doc: dict, rows: RowMap, latest: Optional[dict]):
+        """Fill the storage fields of `doc` (delta against `latest` or keyframe)."""
+        for field in ("kind", "chain_id", "sequence", "rows", "upserts", "removed", "payload", "preorder"):
+            doc.pop(field, None)
+
+        previous = None
+        if can_extend_chain(latest):
+            if self._latest and self._latest[0] == latest["_id"]:
+                previous = self._latest[1]
+            else:
+                previous = await self._load_rows(latest)
+        doc.update(encode_revision(rows, latest, previous))
+
+    async def get_revisions(
+        self,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        q: Optional[str] = None
+    ) -> Tuple[List[RevisionResponse], Optional[str]]:
+        """
+        One page of revision history, newest first, walked along the
+        (timestamp, _id) index. Returns the page and the cursor of the next
+        page (None on the last page). Without limit and cursor the whole
+        history is returned, as before pagination; a cursor without limit
+        pages by HISTORY_PAGE_SIZE. Raises ValueError for a malformed cursor.
+        """
         collection = self.get_collection()
-        # Projection: exclude 'data' field for lighter list response
-        cursor = collection.find({}, {"data": 0}).sort("timestamp", -1)
-        rows = await cursor.to_list(length=None)
+        query = history_query(cursor, date_from, date_to, q)
+        # Projection: only list fields (snapshot rows/deltas stay on the server)
+        find = collection.find(query, {"note": 1, "timestamp": 1}).sort(
+            [("timestamp", DESCENDING), ("_id", DESCENDING)]
+        )
+        if limit is not None or cursor is not None:
+            limit = max(1, min(limit or HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE))
+            find = find.limit(limit + 1)
+        rows = await find.to_list(length=None)
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["_id"])
         return [
             RevisionResponse(
                 id=str(row["_id"]),
                 note=row["note"],
                 timestamp=row["timestamp"]
             ) for row in rows
-        ]
+        ], next_cursor
 
     async def get_revision_by_id(self, rev_id: str) -> Optional[RevisionDetailResponse]:
         collection = self.get_collection()
         row = await collection.find_one({"_id": ObjectId(rev_id)})
         if not row:
             return None
+        rows = await self._load_rows(row)
         return RevisionDetailResponse(
             id=str(row["_id"]),
             note=row["note"],
             timestamp=row["timestamp"],
-            data=row["data"]
+            data=await self._payload(row, "data") if rows is None else build_snapshot_tree(rows)
         )
-        
+
+    async def stream_revision(self, rev_id: str) -> Optional[AsyncIterator[str]]:
+        """
+        A revision as RevisionDetailResponse JSON, produced piece by piece, so
+        the nested tree and the body are never held in full. Revisions flagged
+        "preorder" at write time (see encode_revision) and legacy trees are read
+        one chunk at a time; other revisions are reconstructed to rows first
+        (see _load_rows) and the tree is serialized from those.
+        None if the revision does not exist.
+        """
+        if not ObjectId.is_valid(rev_id):
+            return None
+        collection = self.get_collection()
+        row = await collection.find_one({"_id": ObjectId(rev_id)})
+        if not row:
+            return None
+        stream_rows = bool(row.get("kind") and row.get("preorder"))
+        rows = None if stream_rows else await self._load_rows(row)
+        head = RevisionResponse(id=str(row["_id"]), note=row["note"], timestamp=row["timestamp"])
+
+        async def body():
+            yield head.model_dump_json()[:-1] + ', "data": '
+            if stream_rows:
+                tree = PreorderTreeJson()
+                parts = []
+                async for item in self._preorder_rows(row):
+                    parts.append(tree.feed(item))
+                    if len(parts) >= 256:
+                        yield "".join(parts)
+                        parts = []
+                parts.append(tree.close())
+                yield "".join(parts)
+            elif rows is not None:
+                async for piece in iterate_in_threadpool(iter_tree_json(rows)):
+                    yield piece
+            elif "data" in row:
+                yield json.dumps(row["data"], default=str)
+            else:
+                separator = "["
+                async for node in revision_chunks.read(row["payload"]):
+                    yield separator + json.dumps(node, default=str)
+                    separator = ","
+                yield "[]" if separator == "[" else "]"
+            yield "}"
+
+        return body()
+
+    async def _preorder_rows(self, doc: dict) -> AsyncIterator[dict]:
+        """
+        Rows of a revision flagged "preorder", in tree pre-order: the rows of its
+        keyframe, read chunk by chunk, with the deltas after it (changes in
+        place and removals only) applied on the way. Only the deltas are held.
+        """
+        keyframe = doc
+        changes: Dict[str, Any] = {"upserts": [], "removed": []}
+        if doc["kind"] == KIND_DELTA:
+            cursor = self.get_collection().find(
+                {"chain_id": doc["chain_id"], "sequence": {"$lte": doc["sequence"]}},
+                {"note": 0, "timestamp": 0}
+            ).sort("sequence", ASCENDING)
+            chain = await cursor.to_list(length=None)
+            start = max(i for i, link in enumerate(chain) if link["kind"] == KIND_KEYFRAME)
+            keyframe = chain[start]
+            for link in chain[start + 1:]:
+                await self._inline_payload(link)
+                upserts, removed = compose_deltas(changes, link)
+                changes = {"upserts": upserts, "removed": removed}
+
+        async def keyframe_rows() -> AsyncIterator[dict]:
+            marker = keyframe.get("payload")
+            if marker:
+                async for row in revision_chunks.read(marker):
+                    yield row
+            else:
+                for row in keyframe.get("rows", []):
+                    yield row
+
+        upserts = {row["id"]: row for row in changes["upserts"]}
+        removed = set(changes["removed"])
+        async for row in keyframe_rows():
+            if row["id"] not in removed:
+                yield upserts.get(row["id"], row)
+
+    async def get_rows(self, rev_id: str) -> Optional[RowMap]:
+        """
+        Rows of a revision keyed by id, or of the current budget data for
+        LIVE_REVISION. None if the revision does not exist.
+        """
+        if rev_id == LIVE_REVISION:
+            tree = await budget_service.get_all_rows()
+            return await run_in_threadpool(flatten_models, tree)
+        if not ObjectId.is_valid(rev_id):
+            return None
+        collection = self.get_collection()
+        row = await collection.find_one({"_id": ObjectId(rev_id)})
+        if not row:
+            return None
+        rows = await self._load_rows(row)
+        if rows is None:
+            rows = flatten_snapshot(await self._payload(row, "data"))
+            if rows is None:
+                raise RevisionNotDiffable(f"Revision {rev_id} has rows without unique ids")
+        return rows
+
+    async def restore_revision(self, rev_id: str, dry_run: bool = False) -> Optional[Dict[str, int]]:
+        """
+        Make budget_rows equal to a revision's snapshot, writing only the rows
+        that differ (see budget_service.sync_docs). Returns the change counts,
+        or None if the revision does not exist.
+        """
+        rows = await self.get_rows(rev_id)
+        if rows is None:
+            return None
+        return await budget_service.restore_rows(rows.values(), dry_run)
+
     async def delete_revision(self, rev_id: str) -> bool:
+        """
+        Delete a revision. Its successor in the chain absorbs it first: a delta is
+        composed into the next delta, a keyframe turns the next revision into a
+        keyframe, so later revisions still reconstruct to the same snapshot.
+        """
         collection = self.get_collection()
+        row = await collection.find_one({"_id": ObjectId(rev_id)})
+        if not row:
+            return False
+
+        row_marker = row.get("payload")
+        if row.get("kind"):
+            successor = await collection.find_one(
+                {"chain_id": row["chain_id"], "sequence": {"$gt": row["sequence"]}},
+                sort=[("sequence", ASCENDING)]
+            )
+            if successor and successor["kind"] == KIND_DELTA:
+                old_marker = successor.get("payload")
+                await self._inline_payload(row)
+                await self._inline_payload(successor)
+                if row["kind"] == KIND_KEYFRAME:
+                    rows = {r["id"]: r for r in row["rows"]}
+                    apply_delta(rows, successor["upserts"], successor["removed"])
+                    fields = {
+                        "kind": KIND_KEYFRAME,
+                        "rows": list(rows.values()),
+                        # A delta in place keeps the keyframe's order; otherwise check
+                        "preorder": bool(successor.get("preorder")) or rows_in_preorder(rows.values()),
+                    }
+                else:
+                    upserts, removed = compose_deltas(row, successor)
+                    fields = {"upserts": upserts, "removed": removed}
+                await self._offload_payload(fields)
+                unset = {f: "" for f in (*PAYLOAD_FIELDS, "payload", "removed") if f not in fields}
+                await collection.update_one(
+                    {"_id": successor["_id"]}, {"$set": fields, "$unset": unset}
+                )
+                await revision_chunks.delete(old_marker)
+
         # Menghapus dokumen berdasarkan _id
         result = await collection.delete_one({"_id": ObjectId(rev_id)})
+        await revision_chunks.delete(row_marker)
+        if self._latest and self._latest[0] == row["_id"]:
+            self._latest = None
         # Mengembalikan True jika ada data yang terhapus (count > 0)
         return result.deleted_count > 0
 
@@ -0,0 +1,14 @@
+from typing import Optional
+
+
+def etag(key: str) -> str:
+    """Strong ETag header value for a cache key."""
+    return f'"{key}"'
+
+
+def etag_matches(if_none_match: Optional[str], key: str) -> bool:
+    """Whether an If-None-Match header value matches the ETag of `key`."""
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in tags or etag(key) in tags or f"W/{etag(key)}" in tags
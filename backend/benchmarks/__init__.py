@@ -0,0 +1 @@
+# SISARA Backend Benchmarks
@@ -0,0 +1,70 @@
+"""
+Benchmark for ExportService.write_pdf_rows (PDF "Rincian Kertas Kerja").
+
+Reports pages per second and the peak Python memory allocated while
+rendering. Pages are laid out incrementally from the row generator and
+saved in segments of PDF_SEGMENT_PAGES pages that are copied into the
+output, so the peak should stay flat as the row count grows.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_pdf_export
+    python -m benchmarks.bench_pdf_export 1000 10000
+"""
+
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from app.services.budget_service import budget_service
+from app.services.export_service import export_service
+from benchmarks.synthetic import generate_rows
+
+DEFAULT_SIZES = [1_000, 10_000, 50_000]
+
+
+def worksheet_docs(size: int) -> list:
+    """Synthetic rows with monthlyTotals, in worksheet (depth-first) order like get_export_rows."""
+    docs = generate_rows(size)
+    budget_service._rollup_docs(docs)
+    by_id = {doc["_id"]: doc for doc in docs}
+    ordered = []
+    stack = list(reversed(budget_service._build_tree(docs)))
+    while stack:
+        node = stack.pop()
+        ordered.append(by_id[node.id])
+        stack.extend(reversed(node.children))
+    return ordered
+
+
+def bench(size: int):
+    rows = export_service.compact_docs(worksheet_docs(size))
+
+    with tempfile.TemporaryFile() as output:
+        start = time.perf_counter()
+        pages = export_service.write_pdf_rows(iter(rows), output)
+        elapsed = time.perf_counter() - start
+        file_size = output.tell()
+
+    # Second pass for memory only: tracemalloc slows rendering down considerably
+    with tempfile.TemporaryFile() as output:
+        tracemalloc.start()
+        export_service.write_pdf_rows(iter(rows), output)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return len(rows), pages, elapsed, peak, file_size
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print(f"{'rows':>8} {'pages':>7} {'time (s)':>9} {'pages/s':>8} {'rows/s':>8} {'peak MB':>8} {'PDF MB':>7}")
+    for size in sizes:
+        rows, pages, elapsed, peak, file_size = bench(size)
+        print(
+            f"{rows:>8} {pages:>7} {elapsed:>9.2f} {pages / elapsed:>8.1f} "
+            f"{rows / elapsed:>8.0f} {peak / 2**20:>8.1f} {file_size / 2**20:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark for delta-compressed revision storage (app/services/revision_service.py).
+
+Simulates a series of snapshots of a synthetic worksheet where a small share
+of rows changes between snapshots, stores them with the same keyframe/delta
+policy as RevisionService and reports:
+
+- storage: total BSON size of full-copy revisions vs keyframes + deltas
+- reconstruction: time to decode a chain from BSON, replay it and rebuild
+  the snapshot tree, for a keyframe and for the longest chain
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_revision_storage
+    python -m benchmarks.bench_revision_storage 10000 --revisions 50 --changed 0.01
+"""
+
+import argparse
+import random
+import time
+
+import bson
+
+from app.services.budget_service import budget_service
+from app.services.revision_service import (
+    KEYFRAME_INTERVAL,
+    build_snapshot_tree,
+    can_extend_chain,
+    encode_revision,
+    flatten_snapshot,
+    replay_chain,
+)
+from benchmarks.synthetic import generate_rows
+
+REPEAT = 5
+
+
+def mutate(rows: dict, rng: random.Random, share: float) -> dict:
+    """Copy of `rows` with `share` of the rows edited (description and menjadi total)."""
+    rows = dict(rows)
+    for row_id in rng.sample(list(rows), max(1, int(len(rows) * share))):
+        row = dict(rows[row_id])
+        row["description"] = f"{row['description']} *"
+        if row.get("menjadi"):
+            row["menjadi"] = {**row["menjadi"], "total": row["menjadi"]["total"] + 1000}
+        rows[row_id] = row
+    return rows
+
+
+def best_of(fn) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("rows", nargs="?", type=int, default=10_000)
+    parser.add_argument("--revisions", type=int, default=50)
+    parser.add_argument("--changed", type=float, default=0.01, help="share of rows changed per revision")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    tree = [node.model_dump() for node in budget_service._build_tree(generate_rows(args.rows))]
+    rows = flatten_snapshot(tree)
+
+    full_bytes = 0
+    stored = []  # BSON-encoded revision documents, in creation order
+    latest, previous = None, None
+    for i in range(args.revisions):
+        if i:
+            rows = mutate(rows, rng, args.changed)
+        full_bytes += len(bson.encode({"note": f"r{i}", "data": build_snapshot_tree(rows)}))
+
+        doc = {"note": f"r{i}", **encode_revision(rows, latest, previous if can_extend_chain(latest) else None)}
+        stored.append(bson.encode(doc))
+        latest, previous = doc, rows
+
+    delta_bytes = sum(len(doc) for doc in stored)
+    print(f"rows per snapshot : {len(rows)}")
+    print(f"revisions         : {args.revisions} ({args.changed:.1%} of rows changed each)")
+    print(f"full copies       : {full_bytes / 2**20:8.2f} MB")
+    print(f"keyframes + deltas: {delta_bytes / 2**20:8.2f} MB  (ratio {full_bytes / delta_bytes:.1f}x)")
+
+    # Longest chain = keyframe followed by KEYFRAME_INTERVAL - 1 deltas
+    keyframe_chain = stored[:1]
+    longest_chain = stored[:min(KEYFRAME_INTERVAL, len(stored))]
+
+    def reconstruct(chain):
+        return build_snapshot_tree(replay_chain([bson.decode(doc) for doc in chain]))
+
+    def reconstruct_full():
+        return bson.decode(stored_full)["data"]
+
+    stored_full = bson.encode({"note": "full", "data": build_snapshot_tree(rows)})
+    print(f"reconstruct full copy   : {best_of(reconstruct_full) * 1000:8.1f} ms")
+    print(f"reconstruct keyframe    : {best_of(lambda: reconstruct(keyframe_chain)) * 1000:8.1f} ms")
+    print(f"reconstruct {len(longest_chain) - 1} deltas    : {best_of(lambda: reconstruct(longest_chain)) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark for BudgetService._build_tree (flat rows -> response tree).
+
+Shows that tree assembly scales linearly with the number of rows:
+the time per row excluding garbage collection should stay roughly
+constant from 1k to 100k rows. The time spent in CPython's cyclic GC
+is reported separately; its full collections scan the whole heap, so
+that part grows with the size of everything alive in the process.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_tree_build
+    python -m benchmarks.bench_tree_build 1000 5000 20000
+"""
+
+import gc
+import sys
+import time
+from typing import Tuple
+
+from app.services.budget_service import budget_service
+from benchmarks.synthetic import generate_rows
+
+DEFAULT_SIZES = [1_000, 10_000, 50_000, 100_000]
+REPEAT = 3
+
+
+class GCTimer:
+    """Accumulates time spent in garbage collection (via gc.callbacks)."""
+
+    def __init__(self):
+        self.total = 0.0
+        self._start = 0.0
+
+    def __call__(self, phase: str, info: dict):
+        if phase == "start":
+            self._start = time.perf_counter()
+        else:
+            self.total += time.perf_counter() - self._start
+
+
+def bench(size: int) -> Tuple[float, float]:
+    """Best run for `size` rows: (total seconds, seconds spent in GC)."""
+    rows = generate_rows(size)
+    best = (float("inf"), 0.0)
+    tree = None
+    for _ in range(REPEAT):
+        # Drop the previous tree first so every run starts from the same heap
+        tree = None
+        gc.collect()
+        timer = GCTimer()
+        gc.callbacks.append(timer)
+        try:
+            start = time.perf_counter()
+            tree = budget_service._build_tree(list(rows))
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.callbacks.remove(timer)
+        best = min(best, (elapsed, timer.total))
+    assert len(tree) == 1
+    return best
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print(f"{'rows':>10} {'best (s)':>10} {'gc (s)':>10} {'us/row':>10} {'excl. gc':>10}")
+    baseline = None
+    for size in sizes:
+        elapsed, in_gc = bench(size)
+        per_row = elapsed / size * 1e6
+        per_row_no_gc = (elapsed - in_gc) / size * 1e6
+        baseline = baseline or per_row_no_gc
+        print(
+            f"{size:>10} {elapsed:>10.3f} {in_gc:>10.3f} {per_row:>10.2f} {per_row_no_gc:>10.2f}"
+            f"  (x{per_row_no_gc / baseline:.2f} vs first, excl. gc)"
+        )
+
+
+if __name__ == "__main__":
+    main()
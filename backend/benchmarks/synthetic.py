@@ -0,0 +1,96 @@
+"""
+Synthetic budget worksheet generator shared by the benchmark scripts.
+
+Produces flat `budget_rows` documents (same shape as stored in MongoDB)
+shaped like a satker worksheet: a handful of structural levels on top
+and DETAIL rows making up the bulk of the data.
+"""
+
+import random
+from typing import List, Optional
+
+from bson import ObjectId
+
+# (type, children per node) from SATKER down to ACCOUNT; ACCOUNTs hold DETAIL rows
+LEVELS = [
+    ("SATKER", 1),
+    ("PROGRAM", 2),
+    ("ACTIVITY", 2),
+    ("KRO", 2),
+    ("RO", 2),
+    ("COMPONENT", 3),
+    ("SUBCOMPONENT", 2),
+    ("ACCOUNT", 4),
+]
+DETAILS_PER_ACCOUNT = 10
+
+
+def _budget(rng: random.Random) -> dict:
+    volume = rng.randint(1, 20)
+    price = rng.randint(1, 500) * 1000
+    return {"volume": volume, "unit": "OK", "price": price, "total": volume * price}
+
+
+def _monthly(rng: random.Random) -> dict:
+    allocation = {}
+    for month in rng.sample(range(12), 3):
+        allocation[str(month)] = {
+            "rpd": rng.randint(0, 50) * 100000,
+            "realization": rng.randint(0, 50) * 100000,
+            "date": "",
+            "isVerified": False,
+            "sp2d": 0,
+            "paymentMechanism": "",
+            "spm": "",
+            "keterangan": "",
+        }
+    return allocation
+
+
+def _doc(rng: random.Random, row_type: str, parent_id: Optional[str], order: int, index: int) -> dict:
+    is_detail = row_type == "DETAIL"
+    return {
+        "_id": str(ObjectId()),
+        "code": f"{index:06d}",
+        "description": f"{row_type} {index}",
+        "type": row_type,
+        "semula": _budget(rng) if is_detail else None,
+        "menjadi": _budget(rng) if is_detail else None,
+        "monthlyAllocation": _monthly(rng) if is_detail else {},
+        "isBlocked": None,
+        "isOpen": True,
+        "parent_id": parent_id,
+        "order": order,
+    }
+
+
+def generate_rows(count: int, seed: int = 42, shuffle: bool = True) -> List[dict]:
+    """Generate roughly `count` flat budget row documents."""
+    rng = random.Random(seed)
+    rows: List[dict] = []
+
+    def add(row_type: str, parent_id: Optional[str], order: int) -> str:
+        doc = _doc(rng, row_type, parent_id, order, len(rows))
+        rows.append(doc)
+        return doc["_id"]
+
+    frontier = [add("SATKER", None, 0)]
+    for row_type, fan_out in LEVELS[1:]:
+        next_frontier = []
+        for parent_id in frontier:
+            for order in range(fan_out):
+                next_frontier.append(add(row_type, parent_id, order))
+        frontier = next_frontier
+
+    # Spread the remaining budget across ACCOUNT rows as DETAIL lines
+    account_index = 0
+    while len(rows) < count:
+        parent_id = frontier[account_index % len(frontier)]
+        order = account_index // len(frontier)
+        add("DETAIL", parent_id, order)
+        account_index += 1
+
+    if shuffle:
+        # MongoDB does not guarantee natural order matches tree order
+        rng.shuffle(rows)
+    return rows
@@ -0,0 +1,184 @@
+import asyncio
+import copy
+import inspect
+
+import pytest
+
+from app.database import db
+from app.models.schemas import (
+    BudgetBatchOperation,
+    BudgetDetail,
+    BudgetRowCreate,
+    BudgetRowUpdate,
+    MonthlyDetail,
+    RowType,
+)
+from app.services.budget_service import BudgetService
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+from mongomock.collection import BulkOperationBuilder  # noqa: E402
+
+
+def _drop_sort(add):
+    # pymongo >= 4.11 passes sort= to bulk updates; mongomock 4.x does not take it
+    def wrapper(self, *args, sort=None, **kwargs):
+        assert sort is None
+        return add(self, *args, **kwargs)
+    return wrapper
+
+
+for _name in ("add_update", "add_replace"):
+    _add = getattr(BulkOperationBuilder, _name)
+    if "sort" not in inspect.signature(_add).parameters:
+        setattr(BulkOperationBuilder, _name, _drop_sort(_add))
+
+
+@pytest.fixture
+def service():
+    previous = db.client, db.db
+    db.client = mongomock_motor.AsyncMongoMockClient()
+    db.db = db.client["test"]
+    yield BudgetService()
+    db.client, db.db = previous
+
+
+def _detail(total):
+    return BudgetDetail(volume=1, unit="OK", price=total, total=total)
+
+
+def _row(code, type=RowType.DETAIL, total=0, children=(), **months):
+    return BudgetRowCreate(
+        code=code,
+        description=code,
+        type=type,
+        semula=_detail(total),
+        menjadi=_detail(total),
+        monthlyAllocation={month[1:]: MonthlyDetail(rpd=rpd) for month, rpd in months.items()},
+        children=list(children),
+    )
+
+
+async def _worksheet(service):
+    """Program > two accounts > details; returns the created ids in pre-order."""
+    return await service.create_row(_row("01", RowType.PROGRAM, children=[
+        _row("521211", RowType.ACCOUNT, children=[
+            _row("a", total=100, m0=10, m3=20),
+            _row("b", total=250, m3=5),
+        ]),
+        _row("521213", RowType.ACCOUNT, children=[
+            _row("c", total=40, m11=40),
+        ]),
+    ]))
+
+
+async def _assert_consistent(service):
+    """Stored aggregates and the (cached) tree match a fresh computation."""
+    docs = await service.get_collection().find({}).to_list(length=None)
+    fresh = copy.deepcopy(docs)
+    assert service._rollup_docs(fresh) == []
+
+    tree = await service.get_all_rows()
+    assert [node.model_dump() for node in tree] == [
+        node.model_dump() for node in service._build_tree(fresh)
+    ]
+
+
+def test_create_rolls_up_to_ancestors(service):
+    async def scenario():
+        ids = await _worksheet(service)
+        await _assert_consistent(service)
+        await service.add_child_row(ids[1], _row("d", total=7, m5=3))
+        await _assert_consistent(service)
+
+        root = await service.get_row_by_id(ids[0])
+        assert root["semula"]["total"] == 397
+        assert root["monthlyTotals"]["rpd"][5] == 3
+
+    asyncio.run(scenario())
+
+
+def test_updates_patch_the_cached_tree(service):
+    async def scenario():
+        ids = await _worksheet(service)
+        cached = await service.get_all_rows()
+
+        assert await service.update_row(ids[2], BudgetRowUpdate(menjadi=_detail(500)))
+        assert await service.update_monthly_allocation(ids[3], 3, MonthlyDetail(rpd=70))
+        # Parent totals stay derived from the children
+        assert await service.update_row(ids[1], BudgetRowUpdate(semula=_detail(1)))
+
+        # Patched in place of a reload: untouched subtrees are shared
+        assert service._tree_cache is not None
+        assert service._tree_cache_version == service.data_version
+        tree = await service.get_all_rows()
+        assert tree is service._tree_cache
+        assert tree[0].children[1] is cached[0].children[1]
+        assert tree[0].menjadi.total == 790
+        await _assert_consistent(service)
+
+    asyncio.run(scenario())
+
+
+def test_delete_and_copy(service):
+    async def scenario():
+        ids = await _worksheet(service)
+        await service.get_all_rows()
+
+        copy_id = await service.copy_row(ids[1])
+        assert copy_id is not None
+        await _assert_consistent(service)
+
+        assert await service.delete_row(ids[2])
+        await _assert_consistent(service)
+        assert await service.delete_row(copy_id)
+        await _assert_consistent(service)
+        assert not await service.delete_row(copy_id)
+
+        root = await service.get_row_by_id(ids[0])
+        assert root["semula"]["total"] == 290
+
+    asyncio.run(scenario())
+
+
+def test_batch(service):
+    async def scenario():
+        ids = await _worksheet(service)
+        await service.get_all_rows()
+
+        operations = [
+            {"op": "update", "row_id": ids[2], "data": {"semula": {"volume": 1, "unit": "", "price": 1, "total": 60}}},
+            {"op": "monthly", "row_id": ids[5], "month_index": 0, "detail": {"rpd": 9}},
+            {"op": "insert", "parent_id": ids[5], "row": {"code": "e", "description": "e", "type": "DETAIL",
+                "semula": {"volume": 1, "unit": "", "price": 8, "total": 8}, "monthlyAllocation": {"1": {"rpd": 2}}}},
+            {"op": "move", "row_id": ids[3], "parent_id": ids[4]},
+            {"op": "delete", "row_id": ids[2]},
+            {"op": "move", "row_id": ids[0], "parent_id": ids[4]},
+        ]
+        result = await service.apply_batch([BudgetBatchOperation(**op) for op in operations])
+
+        assert [item["success"] for item in result["results"]] == [True] * 5 + [False]
+        await _assert_consistent(service)
+
+    asyncio.run(scenario())
+
+
+def test_tree_loaded_during_a_patch_is_not_cached(service):
+    async def scenario():
+        ids = await _worksheet(service)
+
+        service._pending_patches += 1
+        try:
+            tree = await service.get_all_rows()
+        finally:
+            service._pending_patches -= 1
+        assert service._tree_cache is None
+
+        # Without a cached tree the write invalidates instead of patching
+        version = service.data_version
+        assert await service.update_row(ids[2], BudgetRowUpdate(description="x"))
+        assert service.data_version > version
+        assert service._tree_cache is None
+        assert tree[0].children[0].children[0].description == "a"
+        await _assert_consistent(service)
+
+    asyncio.run(scenario())
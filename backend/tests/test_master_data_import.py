@@ -0,0 +1,28 @@
+import io
+
+from app.services.master_data_import import open_import
+
+
+def test_semicolon_csv_with_title_row():
+    data = (
+        "DAFTAR AKUN\n"
+        "Tahun Anggaran 2025, Satker 123456\n"
+        "Kode;Uraian;Jenis\n"
+        "521211;Belanja Bahan;akun\n"
+        "521213;Honor, Output Kegiatan;akun\n"
+    ).encode("utf-8")
+
+    rows = list(open_import(io.BytesIO(data), "akun.csv", has_default_type=False))
+
+    assert rows == [
+        (4, {"code": "521211", "desc": "Belanja Bahan", "type": "akun"}),
+        (5, {"code": "521213", "desc": "Honor, Output Kegiatan", "type": "akun"}),
+    ]
+
+
+def test_comma_csv_without_title_row():
+    data = b"\xef\xbb\xbfcode,desc\n01,Program A\n"
+
+    rows = list(open_import(io.BytesIO(data), "program.csv", has_default_type=True))
+
+    assert rows == [(2, {"code": "01", "desc": "Program A"})]
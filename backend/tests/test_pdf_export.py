@@ -0,0 +1,29 @@
+import io
+
+import pytest
+
+from app.services.export_service import PDF_SEGMENT_PAGES, export_service
+
+pypdf = pytest.importorskip("pypdf")
+
+
+def _rows(count):
+    for i in range(count):
+        values = [f"{i:06d}", f"Detail {i}", 1, "OK", 1000, 1000, 2, "OK", 1000, 2000]
+        values.extend([100.0] * 12)
+        values.append(1200.0)
+        yield ("DETAIL", values)
+
+
+def test_pdf_spanning_several_segments():
+    output = io.BytesIO()
+
+    pages = export_service.write_pdf_rows(_rows(4000), output)
+
+    reader = pypdf.PdfReader(io.BytesIO(output.getvalue()), strict=True)
+    assert pages > PDF_SEGMENT_PAGES
+    assert len(reader.pages) == pages
+    assert "Halaman 1" in reader.pages[0].extract_text()
+    assert f"Halaman {pages}" in reader.pages[-1].extract_text()
+    assert "Detail 3999" in reader.pages[-1].extract_text()
+    assert "Kode" in reader.pages[PDF_SEGMENT_PAGES].extract_text()